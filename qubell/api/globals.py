@@ -36,10 +36,12 @@ DEFAULT_SHARED_INSTANCE_CATALOG_SERVICE = lambda: global_zone_constants.DEFAULT_
 
 QUBELL = {
     'token': os.getenv('QUBELL_TOKEN'),
+    'refresh_token': os.getenv('QUBELL_REFRESH_TOKEN'),
     'user': os.getenv('QUBELL_USER'),
     'password': os.getenv('QUBELL_PASSWORD'),
     'tenant': os.getenv('QUBELL_TENANT', 'http://localhost:9000').rstrip('/'),
     'organization': os.getenv('QUBELL_ORGANIZATION', None),
+    'rate_limit': os.getenv('QUBELL_RATE_LIMIT', None),
 }
 
 PROVIDER = {
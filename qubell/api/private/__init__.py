@@ -23,17 +23,20 @@ __license__ = "Apache"
 __email__ = "vkhomenko@qubell.com"
 
 
-# Setup logging
-
-log_opts={'format': '%(asctime)s %(levelname)s:%(name)s:%(message)s'}
-if os.getenv('QUBELL_LOG_LEVEL', 'info') == 'debug':
-    log_opts['level'] = log.INFO
-else:
-    log_opts['level'] = log.DEBUG
+def setup_logging():
+    """
+    Configures root logger from QUBELL_LOG_LEVEL and QUBELL_LOG_TO_FILE.
+    Called by test and monitor entry points, importing api alone does not touch logging.
+    """
+    log_opts={'format': '%(asctime)s %(levelname)s:%(name)s:%(message)s'}
+    if os.getenv('QUBELL_LOG_LEVEL', 'info') == 'debug':
+        log_opts['level'] = log.INFO
+    else:
+        log_opts['level'] = log.DEBUG
 
-if os.getenv('QUBELL_LOG_TO_FILE'):
-    log_opts['filename']=os.getenv('QUBELL_LOG_TO_FILE')
-log.basicConfig(**log_opts)
+    if os.getenv('QUBELL_LOG_TO_FILE'):
+        log_opts['filename']=os.getenv('QUBELL_LOG_TO_FILE')
+    log.basicConfig(**log_opts)
 
 
 def operations():
@@ -99,9 +99,8 @@ class Application(Entity, InstanceRouter):
             timeout = [7, 1, 1.5]
         instances = self.instances
         log.info("Cleaning application: id=%s" % self.applicationId)
-        for ins in instances:
-            if ins.status not in ['Destroyed', 'Destroying']:
-                ins.destroy()
+        alive = [ins for ins in instances if ins.status not in ['Destroyed', 'Destroying']]
+        self._router.parallel_map(lambda ins: ins.destroy(), alive)
 
         @retry(*timeout, retry_exception=AssertionError)
         def eventually_clean():
@@ -112,16 +112,17 @@ class QubellEntityList(EntityList, InstanceRouter):
 
 
     def _id_name_list(self):
-        self._list = []
+        id_names = []  # list is swapped at once, it could be read from other threads
         for ent in self.json():
             if ent.get('id'):  # Normal behavior
-                self._list.append(IdName(ent['id'], ent['name']))
+                id_names.append(IdName(ent['id'], ent['name']))
             elif ent.get('instanceId'):  # public api in use
-                self._list.append(IdName(ent['instanceId'], ent['name']))
+                id_names.append(IdName(ent['instanceId'], ent['name']))
             else:
                 pass
                 # We have NO id on element. That could be submodule info
                 # Investigate and fix this.
+        self._list = id_names
 
     # noinspection PyUnresolvedReferences
     def _get_item(self, id_name):
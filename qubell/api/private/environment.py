@@ -80,7 +80,7 @@ class Environment(Entity, InstanceRouter):
     # noinspection PyUnusedLocal
     def restore(self, config, clean=False, timeout=10):
         config = copy.deepcopy(config)
-        with self as env:
+        with self._router.snapshot(), self as env:
             if clean:
                 env.clean()
             for marker in config.pop('markers', []):
@@ -203,7 +203,7 @@ class Environment(Entity, InstanceRouter):
 
     def __bulk_update(self, env_operations):
 
-        data = self.json()
+        data = copy.deepcopy(self.json())  # json could be shared by response cache
         env_name = data['name']  # speedup
 
         policy_name = lambda policy: "{}.{}".format(policy.get('action'), policy.get('parameter'))
@@ -20,4 +20,17 @@ class ApiAuthenticationError(ApiError): pass
 
 class ApiNotFoundError(ApiError): pass
 
-api_http_code_errors = {401: ApiUnauthorizedError, 403: ApiAuthenticationError, 404: ApiNotFoundError}
\ No newline at end of file
+class ApiThrottledError(ApiError):
+    def __init__(self, message, retry_after=0):
+        ApiError.__init__(self, message)
+        self.retry_after = retry_after
+
+api_http_code_errors = {401: ApiUnauthorizedError, 403: ApiAuthenticationError, 404: ApiNotFoundError}
+
+
+class ApiCircuitOpenError(ApiError):
+    def __init__(self, message, retry_after=0):
+        ApiError.__init__(self, message)
+        self.retry_after = retry_after
+
+class LeaseTimeoutError(BaseQubellException): pass
@@ -217,7 +217,10 @@ class Organization(Entity, InstanceRouter):
         If app found by id, but other parameters differs: change them.
         If no application found, create.
         """
+        with self._router.snapshot():
+            return self._application(id, manifest, name)
 
+    def _application(self, id=None, manifest=None, name=None):
         modify = False
         found = False
 
@@ -291,6 +294,33 @@ class Organization(Entity, InstanceRouter):
 
         return instances
 
+    def iter_instances_json(self, application=None, show_only_destroyed=False, page_size=100):
+        """ Yields instances in json format page by page, so caller can handle first ones while others are loading"""
+        q_filter = {'sortBy': 'byCreation', 'descending': 'true', 'mode': 'short'}
+        if not show_only_destroyed:
+            q_filter['showDestroyed'] = 'false'
+        else:
+            q_filter.update(showDestroyed='true', showRunning='false', showError='false', showLaunching='false')
+        if application:
+            q_filter["applicationFilterId"] = application.applicationId
+        seen = set()
+        offset = 0
+        while True:
+            q_filter.update({'from': str(offset), 'to': str(offset + page_size)})
+            resp_json = self._router.get_instances(org_id=self.organizationId, params=q_filter).json()
+            if type(resp_json) == dict:
+                page = [instance for g in resp_json['groups'] for instance in g['records']]
+            else:  # platform < 37.1 returns all instances at once
+                page = resp_json
+            new = [instance for instance in page if (instance.get('id') or instance.get('instanceId')) not in seen]
+            for instance in new:
+                seen.add(instance.get('id') or instance.get('instanceId'))
+                yield instance
+            # page ignored by platform comes with old instances only
+            if len(page) < page_size or not new:
+                return
+            offset += page_size
+
     def get_or_create_instance(self, id=None, application=None, revision=None, environment=None, name=None, parameters=None, submodules=None,
                                destroyInterval=None):
         """ Get instance by id or name.
@@ -18,6 +18,7 @@ from qubell.api.private import exceptions
 from qubell.api.private.common import Auth
 from qubell.api.private.exceptions import ApiAuthenticationError
 from qubell.api.private.organization import OrganizationList, Organization
+from qubell.api.provider.batch import DEFAULT_MAX_IN_FLIGHT
 from qubell.api.provider.router import InstanceRouter, PrivatePath, PublicPath
 from qubell.api.tools import lazyproperty
 
@@ -36,7 +37,7 @@ class QubellPlatform(InstanceRouter):
         assert not (auth or context), "support of auth and context parameters is removed"
 
     @staticmethod
-    def connect(tenant=None, user=None, password=None, token=None, is_public=False):
+    def connect(tenant=None, user=None, password=None, token=None, is_public=False, refresh_token=None):
         """
         Authenticates user and returns new platform to user.
         This is an entry point to start working with Qubell Api.
@@ -46,6 +47,8 @@ class QubellPlatform(InstanceRouter):
         :param str password: user password, default taken from 'QUBELL_PASSWORD'
         :param str token: session token, default taken from 'QUBELL_TOKEN'
         :param bool is_public: either to use public or private api (public is not fully supported use with caution)
+        :param str refresh_token: token to generate session tokens, which are then refreshed before expiry,
+                                  default taken from 'QUBELL_REFRESH_TOKEN'
         :return: New Platform instance
         """
         if not is_public:
@@ -54,8 +57,8 @@ class QubellPlatform(InstanceRouter):
             router = PublicPath(tenant)
             router.public_api_in_use = is_public
 
-        if token or (user and password):
-            router.connect(user, password, token)
+        if token or refresh_token or (user and password):
+            router.connect(user, password, token, refresh_token)
 
         return QubellPlatform().init_router(router)
 
@@ -71,6 +74,28 @@ class QubellPlatform(InstanceRouter):
         """
         return QubellPlatform.connect(self._router.base_url, user, password, token, is_public)
 
+    def snapshot(self):
+        """
+        Context manager, that memoizes all reads made inside the block, see Router.snapshot
+        """
+        return self._router.snapshot()
+
+    def parallel_map(self, fn, items, max_in_flight=DEFAULT_MAX_IN_FLIGHT, return_exceptions=False):
+        """
+        Calls fn for every item concurrently, on a bounded pool of threads.
+        :param int max_in_flight: limit of simultaneous calls
+        :param bool return_exceptions: put exception in place of result instead of raising first one
+        :return: results in order of items
+        """
+        return self._router.parallel_map(fn, items, max_in_flight, return_exceptions)
+
+    def batch(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Pool of threads for independent calls sharing platform session, see Router.batch
+        :rtype: qubell.api.provider.batch.Batch
+        """
+        return self._router.batch(max_in_flight)
+
     def list_organizations_json(self):
         resp = self._router.get_organizations()
         return resp.json()
@@ -121,16 +146,23 @@ class QubellPlatform(InstanceRouter):
         Get backends versions
         :return: dict containing name of backend and version.
         """
-        # We are not always have permission, so find open.
-        for i in range(0, len(self.organizations)):
+        # We are not always have permission, so organizations are asked concurrently in waves,
+        # and the first readable one in order of organizations wins, without asking further waves.
+        def read_backends(org):
             try:
-                backends = self.organizations[i].environments['default'].backends
+                return org.environments['default'].backends
             except ApiAuthenticationError:
-                pass
-            else:
-                break
-        versions = dict([(x['name'], x['version']) for x in backends])
-        return versions
+                return None
+
+        organizations = list(self.organizations)
+        for start in range(0, len(organizations), DEFAULT_MAX_IN_FLIGHT):
+            wave = organizations[start:start + DEFAULT_MAX_IN_FLIGHT]
+            for backends in self.parallel_map(read_backends, wave, return_exceptions=True):
+                if isinstance(backends, Exception):
+                    raise backends
+                if backends is not None:
+                    return dict([(x['name'], x['version']) for x in backends])
+        raise exceptions.NotFoundError("No organization with readable environment available")
 
     def restore(self, config, clean=False, timeout=10):
         config = copy.deepcopy(config)
@@ -12,6 +12,9 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+import hashlib
+import json
 import os
 import yaml
 import logging as log
@@ -23,8 +26,14 @@ from functools import wraps
 import logging
 
 from nose.plugins.skip import SkipTest
+from qubell.api import globals as qubell_globals
 from qubell.api.globals import ZoneConstants
+from qubell.api.private import setup_logging
+from qubell.api.private.exceptions import NotFoundError
+from qubell.api.private.manifest import Manifest
+from qubell.api.private.testing.lease import organization_lease
 
+setup_logging()
 logging.getLogger("requests.packages.urllib3.connectionpool").setLevel(logging.ERROR)
 
 
@@ -183,18 +192,56 @@ def instance(byApplication):
     return wrapper
 
 
+# environment properties, that let next run reuse sandbox
+FINGERPRINT_PROPERTY = "sandbox_fingerprint"
+INSTANCES_PROPERTY = "sandbox_instances"
+
+
+def reuse_sandbox():
+    """
+    QUBELL_REUSE_SANDBOX turns on reuse of sandboxes across runs, their instances are left running after tests then
+    """
+    return os.getenv("QUBELL_REUSE_SANDBOX", "false").lower() not in ("", "0", "false", "no", "off")
+
+
+def async_teardown():
+    """
+    QUBELL_ASYNC_TEARDOWN turns off waiting for the last instances of sandbox to get destroyed,
+    background reaper checks them while next tests run
+    """
+    return os.getenv("QUBELL_ASYNC_TEARDOWN", "false").lower() not in ("", "0", "false", "no", "off")
+
+
+def _digest(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def _meta_digest(meta):
+    """
+    :return: digests of meta.yml and manifests of its applications, as set_applications_from_meta reads them
+    """
+    if not meta:
+        return None
+    content = (Manifest(url=meta) if meta.startswith('http') else Manifest(file=meta)).content
+    applications = yaml.safe_load(content)['kit']['applications']
+    return {'meta': _digest(content),
+            'applications': dict((app['name'], _digest(Manifest(url=app['manifest']).content))
+                                 for app in applications)}
+
+
 class SandBox(object):
     def __init__(self, platform, sandbox):
         self.sandbox = sandbox
         self.platform = platform
         self.organization_name = sandbox["organization"]["name"]
-        if self.organization_name not in self.platform.organizations:
-            import time
-            import random
-            pause = random.randint(1, 10)
-            time.sleep(pause*15)
-
-        self.organization = self.platform.organization(name=self.organization_name)
+        if self.organization_name in self.platform.organizations:
+            self.organization = self.platform.organization(name=self.organization_name)
+        else:
+            # parallel processes would create organization each, first one creates it, others wait and get it
+            with organization_lease(self.platform, self.organization_name):
+                self.organization = self.platform.organization(name=self.organization_name)
         self.sandbox['instances'] = sandbox.get('instances', [])
 
 
@@ -206,6 +253,85 @@ class SandBox(object):
         self.organization.restore(self.sandbox)
         return self.organization
 
+    def fingerprint(self, environment, meta=None):
+        """
+        Digest of sandbox definition: manifests by content, services, environments, instance parameters and zone
+        :param str environment: name of environment, sandbox is made in
+        :param str meta: path or url of meta.yml, its applications are restored too, taken by content
+        """
+        definition = copy.deepcopy(self.sandbox)
+        definition.pop('organization', None)
+        for app in definition.get('applications', []):
+            source = dict((k, app.pop(k)) for k in ["content", "url", "file"] if k in app)
+            if source:
+                app['manifest'] = _digest(Manifest(**source).content)
+        return hashlib.sha1(json.dumps([definition, qubell_globals.ZONE_NAME, environment, _meta_digest(meta)],
+                                       sort_keys=True, default=repr)).hexdigest()
+
+    def find_reusable(self, environment_name, fingerprint):
+        """
+        Finds instances, left by previous run with the same fingerprint
+        :return: dict of application name to instance, or None, unless all of them are running
+                 and services are still in environment
+        """
+        env_json = self._environment_json(environment_name)
+        if env_json is None:
+            return None
+        properties = dict((p['name'], p.get('value')) for p in env_json.get('properties', []))
+        if properties.get(FINGERPRINT_PROPERTY) != fingerprint:
+            log.info("Sandbox definition changed since previous run, restoring it")
+            return None
+        ids = json.loads(properties.get(INSTANCES_PROPERTY) or "{}")
+        statuses = self._statuses()
+        services = self._services()
+        for name, id in ids.items():
+            if statuses.get(id) not in ('Active', 'Running') or \
+                    (name in services and id not in env_json.get('serviceIds', [])):
+                log.info("Instance %s (%s) of previous sandbox is not running, restoring sandbox" % (name, id))
+                return None
+        return dict((name, self.organization.get_instance(id=id)) for name, id in ids.items())
+
+    def recorded_instances(self, environment_name):
+        """
+        Instances, left by previous run, that are not destroyed yet. They are to be destroyed, when not reused.
+        :return: lists of regular and service instances
+        """
+        env_json = self._environment_json(environment_name)
+        if env_json is None:
+            return [], []
+        properties = dict((p['name'], p.get('value')) for p in env_json.get('properties', []))
+        ids = json.loads(properties.get(INSTANCES_PROPERTY) or "{}")
+        statuses = self._statuses()
+        services = self._services()
+        regular, service = [], []
+        for name, id in sorted(ids.items()):
+            if statuses.get(id) not in (None, 'Destroyed'):
+                (service if name in services else regular).append(self.organization.get_instance(id=id))
+        return regular, service
+
+    def _environment_json(self, environment_name):
+        try:
+            return self.organization.environments[environment_name].json()
+        except NotFoundError:
+            return None
+
+    def _statuses(self):
+        return dict((i.get('id') or i.get('instanceId'), i.get('status'))
+                    for i in self.organization.list_instances_json())
+
+    def _services(self):
+        return [app['name'] for app in self.sandbox.get('applications', []) if app.get('add_as_service', False)]
+
+    def remember(self, environment_name, fingerprint, instances):
+        """
+        Stores fingerprint and instances in environment properties, for find_reusable
+        :param dict instances: application name to instance
+        """
+        with self.organization.environments[environment_name] as env:
+            env.add_property(INSTANCES_PROPERTY, 'string',
+                             json.dumps(dict((name, i.instanceId) for name, i in instances.items()), sort_keys=True))
+            env.add_property(FINGERPRINT_PROPERTY, 'string', fingerprint)
+
     def clean(self):
         # TODO: need cleaning mechanism
         pass
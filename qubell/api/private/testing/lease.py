@@ -0,0 +1,160 @@
+# Copyright (c) 2013 Qubell Inc., http://qubell.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Leases, that let only one of parallel test processes create shared organization.
+Others wait only while it does, and then find organization created.
+"""
+import errno
+import fcntl
+import hashlib
+import logging as log
+import os
+import socket
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from qubell.api.globals import QUBELL as qubell_config
+from qubell.api.private.exceptions import LeaseTimeoutError
+
+DEFAULT_TIMEOUT = 600  # seconds
+
+
+def _digest(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+
+
+class FileLease(object):
+    """
+    Exclusive lock of local file, coordinates processes of one host
+    """
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, directory=None, poll_interval=0.5,
+                 clock=time.time, sleep=None):
+        self.name = name
+        self.path = os.path.join(directory or tempfile.gettempdir(), "qubell-lease-%s.lock" % _digest(name))
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep or time.sleep
+        self._file = None
+
+    def acquire(self):
+        lock_file = open(self.path, "a")
+        deadline = self.clock() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._file = lock_file
+                return
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    lock_file.close()
+                    raise
+            if self.clock() >= deadline:
+                lock_file.close()
+                raise LeaseTimeoutError("Lock {0} of '{1}' is not released in {2} sec".format(
+                    self.path, self.name, self.timeout))
+            self.sleep(self.poll_interval)
+
+    def release(self):
+        if self._file:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class EnvironmentLease(object):
+    """
+    Lease kept as property of environment, that processes of all hosts can access.
+    Property holds owner and expiration time, expired lease is taken over.
+    Environment update is not atomic, so taken lease is read back after settle time, and the last writer wins.
+    """
+
+    def __init__(self, environment, name, timeout=DEFAULT_TIMEOUT, ttl=DEFAULT_TIMEOUT, poll_interval=5, settle=2,
+                 clock=time.time, sleep=None):
+        self.environment = environment
+        self.name = name
+        self.property = "lease_%s" % _digest(name)
+        self.owner = "%s:%s:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.timeout = timeout
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.clock = clock
+        self.sleep = sleep or time.sleep
+
+    def holder(self):
+        """
+        :return: owner and expiration time of lease, or None, 0
+        """
+        properties = dict((p['name'], p.get('value')) for p in self.environment.json().get('properties', []))
+        owner, _, expires = (properties.get(self.property) or "").rpartition("@")
+        return (owner, float(expires)) if owner else (None, 0)
+
+    def acquire(self):
+        deadline = self.clock() + self.timeout
+        while True:
+            owner, expires = self.holder()
+            if owner is None or expires < self.clock():
+                self.environment.set_property(self.property, 'string', "%s@%s" % (self.owner, self.clock() + self.ttl))
+                self.sleep(self.settle)
+                if self.holder()[0] == self.owner:
+                    return
+            else:
+                log.info("Waiting for lease of '%s' held by %s" % (self.name, owner))
+            if self.clock() >= deadline:
+                raise LeaseTimeoutError("Lease of '{0}' is held by {1} for more than {2} sec".format(
+                    self.name, owner, self.timeout))
+            self.sleep(self.poll_interval)
+
+    def release(self):
+        if self.holder()[0] == self.owner:
+            self.environment.remove_property(self.property)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+@contextmanager
+def organization_lease(platform, name, timeout=DEFAULT_TIMEOUT):
+    """
+    Lease to create organization: local file lock, and, for processes on several hosts,
+    property of default environment of organization, named by QUBELL_LEASE_ORGANIZATION
+    """
+    key = "%s %s" % (qubell_config['tenant'], name)
+    started = time.time()
+    with FileLease(key, timeout):
+        lease_organization = os.getenv('QUBELL_LEASE_ORGANIZATION')
+        if lease_organization:
+            environment = platform.get_organization(name=lease_organization).get_default_environment()
+            with EnvironmentLease(environment, key, timeout):
+                log.info("Lease of organization '%s' taken in %.1f sec" % (name, time.time() - started))
+                yield
+        else:
+            log.info("Lease of organization '%s' taken in %.1f sec" % (name, time.time() - started))
+            yield
@@ -13,16 +13,80 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import logging as log
 import os
 import re
+import threading
 import unittest
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from qubell.api.globals import *
 from qubell.api.private.exceptions import NotFoundError
 from qubell.api.private.service import *
-from qubell.api.private.testing import SandBox
+from qubell.api.private.testing import SandBox, async_teardown, reuse_sandbox
 from qubell.api.private.testing.setup_once import SetupOnce
+from qubell.api.tools import wait_for_statuses
+
+DESTROYING_STATUSES = ['Destroying', 'Active', 'Running', 'Executing', 'Unknown', 'Error']  # same as Instance.destroyed
+_reapers = []
+_reaped_failures = []  # instances, background reapers found not destroyed
+
+
+def verify_destroyed(instances, timeout):
+    """
+    Waits for instances to get Destroyed status, and logs ones that do not
+    :param int timeout: minutes
+    :return: messages about instances, that are not destroyed
+    """
+    statuses = wait_for_statuses(instances, final=['Destroyed'], accepted=DESTROYING_STATUSES, timeout=timeout)
+    failures = []
+    for instance in instances:
+        if statuses[instance.instanceId] != 'Destroyed':
+            failures.append("Instance {0} ({1}) was not destroyed properly. Org: {2}, App: {3} ".format(
+                instance.id, instance.name, instance.organizationId, instance.applicationId))
+            log.error(failures[-1])
+    return failures
+
+
+def _verify_in_background(instances, timeout):
+    try:
+        failures = verify_destroyed(instances, timeout)
+    except Exception as e:
+        failures = ["Destroy of instances {0} is not verified: {1}".format(", ".join(i.name for i in instances), e)]
+        log.error(failures[-1])
+    _reaped_failures.extend(failures)
+
+
+def reap(instances, timeout):
+    """
+    Verifies destroy of instances in background thread. Thread is not a daemon, so process exits after it is done.
+    """
+    thread = threading.Thread(target=_verify_in_background, args=(list(instances), timeout), name="sandbox-reaper")
+    thread.start()
+    _reapers.append(thread)
+    return thread
+
+
+def join_reapers():
+    """
+    Waits for all background verifications of destroy
+    :return: messages about instances, that are not destroyed, found since previous call
+    """
+    while _reapers:
+        _reapers.pop().join()
+    failures = list(_reaped_failures)
+    del _reaped_failures[:len(failures)]
+    return failures
+
+
+@atexit.register
+def _report_reapers():
+    failures = join_reapers()
+    if failures:
+        log.error("{0} sandbox instance(s) were not destroyed properly".format(len(failures)))
+
 
 class SandBoxTestCase(SetupOnce, unittest.TestCase):
     platform = None
@@ -35,6 +99,7 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
     current_environment = DEFAULT_ENV_NAME()
 
     setup_skip = None
+    sandbox_fingerprint = None  # set when sandbox is kept for reuse
 
     @classmethod
     def environment(cls, organization):
@@ -75,12 +140,22 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
     def timeout(cls):
         return 15
 
+    @contextmanager
+    def _timed(self, phase):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.setup_timings[phase] = time.time() - started
+            log.info("Sandbox %s took %.1f sec" % (phase, self.setup_timings[phase]))
+
     def setup_once(self):
         super(SandBoxTestCase, self).setup_once()
 
         log.info("\n\n\n---------------  Preparing sandbox...  ---------------")
         self.service_instances = []
         self.regular_instances = []
+        self.setup_timings = OrderedDict()
 
         #todo: refactor, reading `_ or _ or _` is unclear final result
         if os.getenv("QUBELL_IT_LOCAL"):
@@ -88,12 +163,31 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
         org = self.parameters.get('organization') or getattr(self, 'source_name', False) or self.__class__.__name__
 
         self.sandbox = SandBox(self.platform, self.environment(org))
-        if hasattr(self, '_wait_for_prev'):
-            # in case of simultaneous run spreads preparation on timeline
-            # todo: it seems sometimes later test is executed earlier and still race may occur
-            SPREAD_IN_TIME_MULTIPLIER = 5
-            time.sleep(self._wait_for_prev * SPREAD_IN_TIME_MULTIPLIER)
-        self.organization = self.sandbox.make()
+        fingerprint = reused = None
+        if reuse_sandbox():
+            with self._timed("reuse check"):
+                fingerprint = self.sandbox.fingerprint(self.current_environment, getattr(self, 'meta', None))
+                reused = self.sandbox.find_reusable(self.current_environment, fingerprint)
+            if reused is None:
+                # instances of previous run are not reused, so they are not left running
+                regular, services = self.sandbox.recorded_instances(self.current_environment)
+                if regular or services:
+                    with self._timed("previous sandbox destroy"):
+                        if regular:
+                            self.destroy_instances(regular)
+                        if services:
+                            self.destroy_instances(services)
+
+        if reused is not None:
+            self.organization = self.sandbox.organization
+        else:
+            if hasattr(self, '_wait_for_prev'):
+                # in case of simultaneous run spreads preparation on timeline
+                # todo: it seems sometimes later test is executed earlier and still race may occur
+                SPREAD_IN_TIME_MULTIPLIER = 5
+                time.sleep(self._wait_for_prev * SPREAD_IN_TIME_MULTIPLIER)
+            with self._timed("organization"):
+                self.organization = self.sandbox.make()
 
         if self.__dict__.get('platform_version'):
             ver = self.organization.get_default_environment().get_backend_version()
@@ -109,34 +203,58 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
 
         ### Start ###
 
+        services_to_start = [x for x in self.sandbox['applications'] if x.get('add_as_service', False)]
+        instances_to_start = [x for x in self.sandbox['applications'] if x.get('launch', True) and not x.get('add_as_service', False)]
+
         if self.setup_skip:
             pass # go to exit
+        elif reused is not None:
+            log.info("Sandbox of previous run is reused, fingerprint %s" % fingerprint)
+            self.service_instances = [reused[x['name']] for x in services_to_start]
+            self.regular_instances = [reused[x['name']] for x in instances_to_start]
+            self.sandbox_fingerprint = fingerprint
         else:
             # If 'meta' in sandbox, restore applications that comes in meta before.
             if hasattr(self, 'meta'):
-                apps_under_test = [app['name'] for app in self.sandbox.sandbox['applications']]
-                self.organization.set_applications_from_meta(self.meta, exclude=apps_under_test)
-
-            services_to_start = [x for x in self.sandbox['applications'] if x.get('add_as_service', False)]
-            instances_to_start = [x for x in self.sandbox['applications'] if x.get('launch', True) and not x.get('add_as_service', False)]
-
-            for appdata in services_to_start:
-                ins = self.launch_instance(appdata)
-                self.service_instances.append(ins)
-                self.organization.environments[self.current_environment].add_service(ins, force=True)
-            self.check_instances(self.service_instances)
-
-            for appdata in instances_to_start:
-                self.regular_instances.append(self.launch_instance(appdata))
-            self.check_instances(self.regular_instances)
-
-        log.info("\n---------------  Sandbox prepared  ---------------\n\n")
+                with self._timed("meta applications"):
+                    apps_under_test = [app['name'] for app in self.sandbox.sandbox['applications']]
+                    self.organization.set_applications_from_meta(self.meta, exclude=apps_under_test)
+
+            # services are launched together, so one cannot rely on another one in environment at launch
+            with self._timed("services launch"):
+                self.launch_instances(services_to_start, self.service_instances)
+            if self.service_instances:
+                with self._timed("services added to environment"):
+                    with self.organization.environments[self.current_environment] as env:
+                        for ins in self.service_instances:
+                            env.add_service(ins, force=True)
+            with self._timed("services start"):
+                self.check_instances(self.service_instances)
+
+            with self._timed("instances launch"):
+                self.launch_instances(instances_to_start, self.regular_instances)
+            with self._timed("instances start"):
+                self.check_instances(self.regular_instances)
+
+            if fingerprint:
+                apps = services_to_start + instances_to_start
+                self.sandbox.remember(self.current_environment, fingerprint,
+                                      dict((app['name'], ins) for app, ins in
+                                           zip(apps, self.service_instances + self.regular_instances)))
+                self.sandbox_fingerprint = fingerprint
+
+        log.info("\n---------------  Sandbox prepared in %.1f sec  ---------------\n\n" % sum(self.setup_timings.values()))
 
     def teardown_once(self):
         log.info("\n---------------  Cleaning sandbox  ---------------")
 
-        self.destroy_instances(self.regular_instances)
-        self.destroy_instances(reversed(self.service_instances))
+        if self.sandbox_fingerprint:
+            log.info("Sandbox instances are left running for reuse by next run")
+        else:
+            # regular instances use services, so they go first, every wave is destroyed concurrently
+            waves = [wave for wave in (self.regular_instances, list(reversed(self.service_instances))) if wave]
+            for number, wave in enumerate(waves, 1):
+                self.destroy_instances(wave, wait=number < len(waves) or not async_teardown())
         self.regular_instances = []
         self.service_instances = []
 
@@ -157,10 +275,22 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
                                                     **appdata.get('settings',{}))
         return instance
 
+    def launch_instances(self, apps, launched):
+        """
+        Launches instances of apps concurrently
+        :param list launched: launched instances are appended to it, in order of apps, even if some launch failed
+        """
+        results = self.platform.parallel_map(self.launch_instance, apps, return_exceptions=True)
+        launched.extend(r for r in results if not isinstance(r, Exception))
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
     @classmethod
     def check_instances(cls, instances):
+        statuses = wait_for_statuses(instances, timeout=cls.timeout())
         for instance in instances:
-            if not instance.running(timeout=cls.timeout()):
+            if statuses[instance.instanceId] not in ['Active', 'Running']:
                 if instance.error: # If error message exists - status should be error, else instance faced timeout
                     error = instance.error.strip()
                 else:
@@ -173,17 +303,26 @@ class SandBoxTestCase(SetupOnce, unittest.TestCase):
                 assert False, "Instance %s (%s): %s" % (instance.name, instance.instanceId, error)
 
     @classmethod
-    def destroy_instances(cls, instances):
+    def destroy_instances(cls, instances, wait=True):
+        """
+        Destroys instances concurrently and waits for all of them at once
+        :param bool wait: if False, destroy is verified by background reaper, see join_reapers
+        """
         if os.getenv("QUBELL_DEBUG", None) and not('false' in os.getenv("QUBELL_DEBUG", None)):
             log.info("QUBELL_DEBUG is ON\n DO NOT clean sandbox")
         else:
-            for instance in instances:
-                instance.destroy()
-                if not instance.destroyed(cls.timeout()):
-                    log.error("Instance {0} ({1}) was not destroyed properly. Org: {2}, App: {3} ".format(instance.id,
-                                                                                                          instance.name,
-                                                                                                          instance.organizationId,
-                                                                                                          instance.applicationId))
+            instances = list(instances)
+            results = cls.platform.parallel_map(lambda instance: instance.destroy(), instances, return_exceptions=True)
+            destroying = []
+            for instance, result in zip(instances, results):
+                if isinstance(result, Exception):
+                    log.error("Instance {0} ({1}) destroy failed: {2}".format(instance.id, instance.name, result))
+                else:
+                    destroying.append(instance)
+            if wait:
+                verify_destroyed(destroying, cls.timeout())
+            else:
+                reap(destroying, cls.timeout())
 
     # todo: method is used in decarator only, would be nice to refactor
     def find_by_application_name(self, name):
@@ -1,10 +1,15 @@
+import bisect
 import inspect
 import logging as log
+import math
 import requests
 import sys
+import threading
 import time
 from functools import wraps
 from qubell.api.private.exceptions import ApiError, api_http_code_errors
+from qubell.api.provider.breaker import CIRCUIT_BREAKERS
+from qubell.api.provider.ratelimit import RATE_LIMITER
 
 try:
     import requests.packages.urllib3 as urllib3
@@ -16,6 +21,13 @@ except:
 log.getLogger("requests.packages.urllib3.connectionpool").setLevel(log.ERROR)
 
 _routes_stat = {}
+_routes_stat_lock = threading.Lock()
+
+# upper bounds (ms) of route latency histogram, last bucket counts slower calls
+HISTOGRAM_BOUNDS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# routes, that authenticate themselves, are never repeated after 401
+_AUTH_ROUTES = ("POST /signIn", "POST /refreshToken/jwtBearer")
 
 
 def route(route_str):  # decorator param
@@ -26,15 +38,30 @@ def route(route_str):  # decorator param
     :return: the response of requests.request
     """
 
-    def ilog(elapsed):
+    def ilog(elapsed, cached=False, throttled=0, circuit=None):
         # statistic
-        last_stat = _routes_stat.get(route_str, {"count": 0, "min": sys.maxint, "max": 0, "avg": 0})
+        with _routes_stat_lock:
+            _ilog(elapsed, cached, throttled)
+            if circuit:
+                _routes_stat[route_str]["circuit"] = circuit
+
+    def _ilog(elapsed, cached, throttled):
+        last_stat = _routes_stat.get(route_str, {"count": 0, "min": sys.maxint, "max": 0, "avg": 0, "total": 0,
+                                                 "hits": 0, "throttled": 0})
         last_count = last_stat["count"]
+        hits = last_stat["hits"] + (1 if cached else 0)
+        histogram = list(last_stat.get("histogram") or [0] * (len(HISTOGRAM_BOUNDS) + 1))
+        histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, elapsed)] += 1
         _routes_stat[route_str] = {
             "count": last_count + 1,
             "min": min(elapsed, last_stat["min"]),
             "max": max(elapsed, last_stat["max"]),
-            "avg": (last_count * last_stat["avg"] + elapsed) / (last_count + 1)
+            "avg": (last_count * last_stat["avg"] + elapsed) / (last_count + 1),
+            "total": last_stat["total"] + elapsed,
+            "hits": hits,
+            "hit_ratio": float(hits) / (last_count + 1),
+            "throttled": last_stat["throttled"] + throttled,
+            "histogram": histogram
         }
         # log.debug('Route Time: {0} took {1} ms'.format(route_str, elapsed))
 
@@ -82,25 +109,81 @@ def route(route_str):  # decorator param
                 del bypass_args["content_type"]
                 bypass_args['headers'] = {'Content-Type': 'application/x-yaml'}
 
+            # inside router.snapshot() GETs are read only once
+            snapshot = self._snapshot
+            if snapshot is not None and method == "GET":
+                snapshot_key = snapshot.key(route_str, destination_url, bypass_args.get("params"))
+                memoized = snapshot.get(snapshot_key)
+                if memoized is not None:
+                    return memoized
+
+            # conditional GET, if response cache is enabled for router
+            cache = self._response_cache if method == "GET" else None
+            if cache is not None:
+                cache_key = cache.key(destination_url, bypass_args.get("params"))
+                cache_entry = cache.lookup(cache_key)
+                if cache_entry and cache_entry.validators:
+                    bypass_args['headers'] = dict(bypass_args.get('headers', {}), **cache_entry.validators)
+
+            # fail fast, while tenant is degraded, without spending rate limit tokens
+            breaker = CIRCUIT_BREAKERS.get(route_str) if CIRCUIT_BREAKERS else None
+            if breaker:
+                breaker.before(route_str)
+
+            # client side rate limit, ms spent waiting for token
+            throttled = 0
+            if RATE_LIMITER:
+                try:
+                    throttled = int(RATE_LIMITER.acquire(route_str, route_args.get("org_id")) * 1000.0)
+                except ApiError:
+                    if breaker:
+                        breaker.cancel()
+                    raise
+
+            def send():
+                try:
+                    return self._session.request(method, destination_url, verify=self.verify_ssl, **bypass_args)
+                except requests.ConnectionError:
+                    log.info('ConnectionError caught. Trying again: \n %s:%s ' % (method, destination_url))
+                    import traceback
+                    def log_exception(exc_class, exc, tb):
+                        log.info('Got exception: %s' % exc)
+                        log.info('Class: %s' % exc_class)
+                        log.info('Trace: %s' % traceback.format_tb(tb))
+                        log.error('Got exception while executing: %s' % exc)
+
+                    log_exception(*sys.exc_info())
+                    time.sleep(2)
+                    try:
+                        return self._session.request(method, destination_url, verify=self.verify_ssl, **bypass_args)
+                    except Exception:
+                        if breaker:
+                            breaker.record(False)
+                        raise
+
             start = time.time()
-            try:
-                response = self._session.request(method, destination_url, verify=self.verify_ssl, **bypass_args)
-            except requests.ConnectionError:
-                log.info('ConnectionError caught. Trying again: \n %s:%s ' % (method, destination_url))
-                import traceback
-                def log_exception(exc_class, exc, tb):
-                    log.info('Got exception: %s' % exc)
-                    log.info('Class: %s' % exc_class)
-                    log.info('Trace: %s' % traceback.format_tb(tb))
-                    log.error('Got exception while executing: %s' % exc)
-
-                log_exception(*sys.exc_info())
-                time.sleep(2)
-                response = self._session.request(method, destination_url, verify=self.verify_ssl, **bypass_args)
+            generation = getattr(self, "auth_generation", None)
+            response = send()
+            # expired session: renew it once and repeat, auth objects are updated in place
+            if response.status_code == 401 and route_str not in _AUTH_ROUTES and \
+                    hasattr(self, "reauthenticate") and self.reauthenticate(generation):
+                log.debug("Route {0} got 401, repeating with renewed credentials".format(route_str))
+                response = send()
 
             end = time.time()
             elapsed = int((end - start) * 1000.0)
-            ilog(elapsed)
+            if breaker:
+                breaker.record(response.status_code < 500, elapsed)
+            cached = False
+            if cache is not None:
+                response, cached = cache.process(cache_key, response, cache_entry)
+            ilog(elapsed, cached, throttled, breaker and breaker.state)
+
+            if snapshot is not None:
+                if method != "GET":
+                    snapshot.invalidate(destination_url)
+                elif response.status_code == 200:
+                    response = snapshot.put(snapshot_key, response)
 
             if self.verify_codes:
                 if response.status_code is not 200:
@@ -174,9 +257,37 @@ def basic_auth(f):
     return wrapper
 
 
+def routes_stat():
+    """
+    :return: copy of statistics of every route called: count, min, max, avg and total ms, cache hits,
+             and histogram - counts of calls by HISTOGRAM_BOUNDS
+    """
+    with _routes_stat_lock:
+        return dict((r, dict(stat)) for r, stat in _routes_stat.items())
+
+
 def log_routes_stat():
     nice_stat = [
-        "  count: {0:<4} min: {1:<6} avg: {2:<6} max: {3:<6}  {4}".format(
-            stat["count"], stat["min"], stat["avg"], stat["max"], r)
+        "  count: {0:<4} min: {1:<6} avg: {2:<6} max: {3:<6} hit: {4:<5.0%} throttled: {5:<6} {6:<9}  {7}".format(
+            stat["count"], stat["min"], stat["avg"], stat["max"], stat["hit_ratio"], stat["throttled"],
+            stat.get("circuit", ""), r)
         for r, stat in _routes_stat.items()]
     log.info("Route Statistic\n{0}".format("\n".join(nice_stat)))
+
+
+def histogram_percentile(histogram, p, bounds=HISTOGRAM_BOUNDS):
+    """
+    Estimates percentile as upper bound of bucket, that holds nearest rank.
+    Calls slower than last bound are estimated as last bound.
+    :param list histogram: counts by bounds, like "histogram" of route statistics
+    :return: ms, or None for empty histogram
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = max(int(math.ceil(p / 100.0 * total)), 1)
+    seen = 0
+    for bound, count in zip(bounds + [bounds[-1]], histogram):
+        seen += count
+        if seen >= rank:
+            return bound
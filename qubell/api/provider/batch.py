@@ -0,0 +1,144 @@
+import logging as log
+import sys
+import threading
+from Queue import Queue
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+class Call(object):
+    """
+    Future-like result of a call submitted to Batch.
+    Exception raised by call is captured and re-raised by result().
+    """
+
+    def __init__(self, fn, args, kwargs, context=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = context
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            if self.context is not None:
+                with self.context:
+                    self._result = self.fn(*self.args, **self.kwargs)
+            else:
+                self._result = self.fn(*self.args, **self.kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+            log.debug("Batch call %s failed: %s" % (getattr(self.fn, '__name__', self.fn), self._exc_info[1]))
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done()
+
+    def exception(self, timeout=None):
+        assert self.wait(timeout), "call is not finished in %s sec" % timeout
+        return self._exc_info and self._exc_info[1]
+
+    def result(self, timeout=None):
+        assert self.wait(timeout), "call is not finished in %s sec" % timeout
+        if self._exc_info:
+            exc_type, exc, tb = self._exc_info
+            raise exc_type, exc, tb
+        return self._result
+
+
+class Batch(object):
+    """
+    Runs independent calls on a bounded pool of threads, at most max_in_flight at once.
+    Workers are started on demand and stopped on exit from the with-block, which waits for all submitted calls.
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, context=None):
+        """
+        :param context: function, called in submitting thread, that returns context manager to run call in,
+                        like Router.use_snapshot with snapshot of submitting thread
+        """
+        assert max_in_flight > 0, "max_in_flight must be 1 or greater"
+        self.max_in_flight = max_in_flight
+        self._context = context
+        self._queue = Queue()
+        self._workers = []
+        self._pending = set()  # submitted calls, that are not finished yet
+        self._lock = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _worker(self):
+        while True:
+            call = self._queue.get()
+            if call is None:
+                break
+            call.run()
+            with self._lock:
+                self._pending.discard(call)
+                if not self._pending:
+                    self._lock.notify_all()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs)
+        :rtype: Call
+        """
+        call = Call(fn, args, kwargs, self._context and self._context())
+        with self._lock:
+            assert self._workers is not None, "batch is already shut down"
+            self._pending.add(call)
+            if len(self._workers) < min(self.max_in_flight, len(self._pending)):
+                worker = threading.Thread(target=self._worker, name="batch-%s" % len(self._workers))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        self._queue.put(call)
+        return call
+
+    def map(self, fn, *iterables):
+        """
+        Schedules fn for every item
+        :return: list of Call in order of items
+        """
+        return [self.submit(fn, *args) for args in zip(*iterables)]
+
+    def wait(self):
+        """
+        Waits for all submitted calls
+        """
+        with self._lock:
+            while self._pending:
+                self._lock.wait()
+
+    def shutdown(self):
+        self.wait()
+        with self._lock:
+            workers, self._workers = self._workers, None
+        for _ in workers or []:
+            self._queue.put(None)
+        for worker in workers or []:
+            worker.join()
+
+
+def parallel_map(fn, items, max_in_flight=DEFAULT_MAX_IN_FLIGHT, return_exceptions=False, context=None):
+    """
+    Calls fn for every item concurrently and returns results in order of items.
+    :param return_exceptions: put exception in place of result instead of raising first one
+    :param context: see Batch
+    """
+    with Batch(max_in_flight, context) as batch:
+        calls = batch.map(fn, items)
+    if return_exceptions:
+        return [call.exception() or call.result() for call in calls]
+    return [call.result() for call in calls]
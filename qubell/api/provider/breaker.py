@@ -0,0 +1,144 @@
+import fnmatch
+import logging as log
+import threading
+import time
+from collections import deque
+
+from qubell.api.private.exceptions import ApiCircuitOpenError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a route, while tenant is degraded.
+    Circuit opens when error rate or slow call rate over last `window` calls exceeds threshold,
+    calls fail fast with ApiCircuitOpenError for `cooldown` seconds, then one probe call is let through (half-open):
+    success closes circuit, failure opens it again.
+    """
+
+    def __init__(self, error_rate=0.5, slow_call=None, slow_rate=0.5, window=20, min_calls=10, cooldown=30):
+        """
+        :param float error_rate: share of failed calls (connection errors and 5xx) to open circuit
+        :param int slow_call: call taking more ms is slow, default is no latency threshold
+        :param float slow_rate: share of slow calls to open circuit
+        :param int window: number of last calls to count rates over
+        :param int min_calls: rates are not checked until so many calls made
+        :param float cooldown: seconds circuit stays open before probe
+        """
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0
+        self._probing = False
+        self._probe_started = 0
+        self._lock = threading.Lock()
+
+    def before(self, name=""):
+        """
+        Checks if call is allowed
+        :raise ApiCircuitOpenError: while circuit is open
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_after = self._opened_at + self.cooldown - time.time()
+            if self.state == OPEN and retry_after <= 0:
+                self.state = HALF_OPEN
+            # probe, that never reported back, is replaced after cooldown
+            if self.state == HALF_OPEN and (not self._probing or time.time() - self._probe_started > self.cooldown):
+                self._probing = True
+                self._probe_started = time.time()
+                return
+        raise ApiCircuitOpenError("Circuit for {0} is {1}, retry after {2:.1f} sec".format(name, self.state,
+                                                                                          max(retry_after, 0)),
+                                  retry_after=max(retry_after, 1))
+
+    def cancel(self):
+        """
+        Releases allowed call, that is not made, so that probe is not held until cooldown
+        """
+        with self._lock:
+            self._probing = False
+
+    def record(self, success, elapsed=0):
+        """
+        Registers result of allowed call
+        :param int elapsed: call time, ms
+        """
+        slow = bool(self.slow_call) and elapsed > self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    self._calls.clear()
+                    self.state = CLOSED
+                else:
+                    self._open()
+                return
+            self._calls.append((success, slow))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                count = float(len(self._calls))
+                errors = len([c for c in self._calls if not c[0]]) / count
+                slows = len([c for c in self._calls if c[1]]) / count
+                if errors >= self.error_rate or (self.slow_call and slows >= self.slow_rate):
+                    self._open()
+
+    def _open(self):
+        log.warning("Circuit is opened for %s sec" % self.cooldown)
+        self.state = OPEN
+        self._opened_at = time.time()
+        self._calls.clear()
+
+
+class CircuitBreakers(object):
+    """
+    Registry of breakers, one per route template, for routes matching enabled patterns.
+    Disabled unless enable() is called.
+    """
+
+    def __init__(self):
+        self._rules = []
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def enable(self, route="*", **settings):
+        """
+        Enables breakers for routes, see CircuitBreaker for settings
+        :param str route: route pattern, like "GET .../instances/*", default is any route
+        """
+        with self._lock:
+            self._rules.append((route.replace("...", "*"), settings))
+            self._breakers = {}
+        return self
+
+    def clear(self):
+        with self._lock:
+            self._rules = []
+            self._breakers = {}
+
+    def __nonzero__(self):
+        return bool(self._rules)
+
+    def get(self, route_str):
+        """
+        :rtype: CircuitBreaker or None
+        """
+        with self._lock:
+            if route_str not in self._breakers:
+                settings = [s for pattern, s in self._rules
+                            if fnmatch.fnmatchcase(route_str.replace("{ctype}", ""), pattern)]
+                self._breakers[route_str] = settings and CircuitBreaker(**settings[-1]) or None
+            return self._breakers[route_str]
+
+    def states(self):
+        return dict((r, b.state) for r, b in self._breakers.items() if b)
+
+
+CIRCUIT_BREAKERS = CircuitBreakers()
@@ -0,0 +1,172 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 256
+
+
+def body_digest(response):
+    return hashlib.sha1(response.content or '').hexdigest()
+
+
+class CacheEntry(object):
+    """
+    Keeps validators, body digest and decoded json of the last successful GET.
+    Json is decoded lazily, on first use, and then reused by all cached responses.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.digest = body_digest(response)
+        self._decoded = False
+        self._json = None
+        self._lock = threading.Lock()
+
+    @property
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def json(self, **kwargs):
+        with self._lock:
+            if not self._decoded:
+                self._json = self.response.json(**kwargs)
+                self._decoded = True
+            return self._json
+
+
+class CachedResponse(object):
+    """
+    Response replayed from cache.
+    Note: json() returns the same decoded object for every hit, do not modify it in place.
+    """
+
+    def __init__(self, entry):
+        self._entry = entry
+
+    def json(self, **kwargs):
+        return self._entry.json(**kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self._entry.response, item)
+
+
+class ResponseCache(object):
+    """
+    Bounded LRU of GET responses, used to send conditional requests.
+    On 304 or on the same body (when server gives no validators) cached response is returned,
+    so body is neither downloaded again nor parsed again.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        assert max_entries > 0, "cache size must be positive"
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params=None):
+        if params:
+            return url, tuple(sorted((str(k), str(v)) for k, v in params.items()))
+        return url, ()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry  # mark as recently used
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, key):
+        return self._get(key)
+
+    def process(self, key, response, entry=None):
+        """
+        Updates cache with fresh response
+        :param entry: entry, which validators were sent with request
+        :return: tuple (response to return, True if cached copy was reused)
+        """
+        entry = entry or self._get(key)
+        if response.status_code == 304 and entry:
+            return CachedResponse(entry), True
+        if response.status_code != 200:
+            return response, False
+        if entry and entry.digest == body_digest(response):
+            # no validators or server ignored them, but body is the same: skip parsing
+            entry.etag = response.headers.get('ETag')
+            entry.last_modified = response.headers.get('Last-Modified')
+            return CachedResponse(entry), True
+        entry = CacheEntry(response)
+        self._put(key, entry)
+        return CachedResponse(entry), False
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+_ORG_SCOPE = re.compile(r"/organizations/[^/.]+")
+
+
+class Snapshot(object):
+    """
+    Unit-of-work read cache, see Router.snapshot.
+    Every successful GET is memoized until snapshot is discarded,
+    write invalidates all reads of the same organization (or everything, if it is not organization scoped).
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(route_str, url, params=None):
+        return (route_str,) + ResponseCache.key(url, params)
+
+    @staticmethod
+    def scope(url):
+        match = _ORG_SCOPE.search(url)
+        return match and match.group(0)
+
+    def __len__(self):
+        return len(self._responses)
+
+    def get(self, key):
+        with self._lock:
+            return self._responses.get(key)
+
+    def put(self, key, response):
+        if not isinstance(response, CachedResponse):
+            response = CachedResponse(CacheEntry(response))
+        with self._lock:
+            self._responses[key] = response
+        return response
+
+    def invalidate(self, url):
+        scope = self.scope(url)
+        with self._lock:
+            if not scope:
+                self._responses.clear()
+                return
+            for key in [k for k in self._responses if self.scope(k[1]) == scope]:
+                del self._responses[key]
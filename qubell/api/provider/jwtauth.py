@@ -1,3 +1,7 @@
+import logging as log
+import threading
+import time
+
 from requests import Session
 from requests.auth import AuthBase
 
@@ -13,3 +17,63 @@ class HTTPBearerAuth(AuthBase):
     def __call__(self, r):
         r.headers['Authorization'] = 'Bearer %s' % self.token
         return r
+
+
+class TokenManager(object):
+    """
+    Keeps session token of HTTPBearerAuth fresh, using refresh token.
+    Token is refreshed in background ahead of expiry and on demand (after 401), only once for concurrent callers.
+    """
+
+    REFRESH_AHEAD = 60  # seconds before expiry
+
+    def __init__(self, router, refresh_token, auth=None):
+        self._router = router
+        self.refresh_token = refresh_token
+        self.auth = auth or HTTPBearerAuth(None)
+        self.expires_at = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def refresh(self):
+        """
+        Generates new session token, schedules next refresh ahead of its expiry
+        """
+        with self._lock:
+            response = self._router.generate_session_token(json={'refreshToken': self.refresh_token})
+            json = response.json()
+            self.auth.token = json['jwtBearer']
+            self.expires_at = time.time() + json['expiresIn']
+            self._schedule(json['expiresIn'])
+            log.debug("Session token is refreshed, expires in %s sec" % json['expiresIn'])
+            return self.auth.token
+
+    def schedule(self, expires_at):
+        """
+        Schedules refresh ahead of expiry of token, obtained earlier, e.g. restored from cache
+        :param float expires_at: expiration time of token, seconds since epoch
+        """
+        with self._lock:
+            self.expires_at = expires_at
+            self._schedule(expires_at - time.time())
+
+    def _schedule(self, expires_in):
+        if self._timer:
+            self._timer.cancel()  # not joined: it could be waiting for lock we hold
+        self._timer = threading.Timer(max(expires_in - self.REFRESH_AHEAD, expires_in / 2.0), self._refresh_ahead)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_ahead(self):
+        try:
+            self._router.refresh_ahead(self)
+        except Exception as e:
+            # request after expiry will get 401 and refresh again
+            log.warning("Failed to refresh session token: %s" % e)
+
+    def stop(self):
+        timer, self._timer = self._timer, None
+        if timer:
+            timer.cancel()
+            if timer is not threading.current_thread():
+                timer.join()
@@ -0,0 +1,159 @@
+import fnmatch
+import logging as log
+import threading
+import time
+
+from qubell.api.globals import QUBELL as qubell_config
+from qubell.api.private.exceptions import ApiThrottledError
+
+
+_backing_off = threading.local()
+
+
+def back_off(seconds):
+    """
+    Sleeps while client is throttled or backs off as tenant asks,
+    so that accounting of sleeps tells throttling from waits for instances
+    """
+    _backing_off.active = True
+    try:
+        time.sleep(seconds)
+    finally:
+        _backing_off.active = False
+
+
+def is_backing_off():
+    """
+    :return: True inside back_off in current thread
+    """
+    return getattr(_backing_off, "active", False)
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` calls per second on average and bursts up to `burst` calls.
+    Waiting callers reserve their token in advance, so they are served in order and never overshoot the rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        assert rate > 0, "rate must be positive"
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def take(self, block=True):
+        """
+        Takes one token
+        :return: seconds waited (block=True) or seconds to wait, token is not taken in that case (block=False)
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait and not block:
+                return wait
+            self._tokens -= 1
+        if wait:
+            back_off(wait)
+        return wait
+
+    def give_back(self):
+        """
+        Returns token, taken for call, that is not made
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class _Rule(object):
+    def __init__(self, rate, burst, route, organization, block):
+        self.rate = rate
+        self.burst = burst
+        self.route = route and route.replace("...", "*")
+        self.organization = organization
+        self.block = block
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def matches(self, route_str, org_id):
+        if self.route and not fnmatch.fnmatchcase(route_str.replace("{ctype}", ""), self.route):
+            return False
+        if self.organization and self.organization != "*" and self.organization != org_id:
+            return False
+        return True
+
+    def bucket(self, org_id):
+        # organization="*" gives every organization own bucket
+        key = org_id if self.organization == "*" else None
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[key]
+
+
+class RateLimiter(object):
+    """
+    Client side throttling of route calls, shared by all routers and threads.
+    Every rule matching the call is applied: global, per route pattern and per organization.
+    """
+
+    def __init__(self):
+        self._rules = []
+
+    def limit(self, rate, burst=None, route=None, organization=None, block=True):
+        """
+        Adds limit
+        :param float rate: calls per second
+        :param int burst: calls allowed at once, default is rate
+        :param str route: route pattern, like "POST .../launch" or "GET /organizations/*", default is any route
+        :param str organization: organization id, or "*" to limit each organization separately, default is any
+        :param bool block: wait for token, or raise ApiThrottledError at once
+        """
+        self._rules.append(_Rule(rate, burst, route, organization, block))
+        return self
+
+    def clear(self):
+        self._rules = []
+
+    def __nonzero__(self):
+        return bool(self._rules)
+
+    def acquire(self, route_str, org_id=None):
+        """
+        Takes token from every matching bucket, or none of them, when call is throttled
+        :return: seconds spent throttled
+        """
+        throttled = 0
+        taken = []
+        for rule in self._rules:
+            if not rule.matches(route_str, org_id):
+                continue
+            bucket = rule.bucket(org_id)
+            waited = bucket.take(rule.block)
+            if waited and not rule.block:
+                for earlier in taken:
+                    earlier.give_back()
+                raise ApiThrottledError("Route {0} is throttled, retry after {1:.2f} sec".format(route_str, waited),
+                                        retry_after=waited)
+            taken.append(bucket)
+            throttled += waited
+        if throttled:
+            log.debug("Route {0} throttled for {1:.2f} sec".format(route_str, throttled))
+        return throttled
+
+
+def from_config(value):
+    """
+    Parses global limit as "rate" or "rate:burst", like QUBELL_RATE_LIMIT=10:20
+    """
+    limiter = RateLimiter()
+    if value:
+        rate, _, burst = str(value).partition(":")
+        limiter.limit(float(rate), burst and int(burst) or None)
+    return limiter
+
+
+RATE_LIMITER = from_config(qubell_config['rate_limit'])
@@ -1,9 +1,15 @@
 import os
+import threading
+from contextlib import contextmanager
+
 import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from qubell.api.globals import QUBELL as qubell_config
 from qubell.api.private.exceptions import ApiUnauthorizedError
 from qubell.api.provider import route, play_auth, basic_auth
-from qubell.api.provider.jwtauth import HTTPBearerAuth
+from qubell.api.provider.batch import Batch, parallel_map, DEFAULT_MAX_IN_FLIGHT
+from qubell.api.provider.cache import ResponseCache, Snapshot, DEFAULT_CACHE_SIZE
+from qubell.api.provider.jwtauth import HTTPBearerAuth, TokenManager
 from requests.auth import HTTPBasicAuth
 
 
@@ -21,34 +27,197 @@ class Router(object):
         self.public_api_in_use = False
 
         self._creds = None
+        self._token_manager = None
+        self._auth_lock = threading.Lock()
+        self.auth_generation = 0  # incremented on every renewal of credentials
 
         self._session = requests.Session()
+        self._pool_size = DEFAULT_POOLSIZE
+        self._response_cache = None
+        self._local = threading.local()  # snapshot and its depth are per thread
+
+    def enable_cache(self, max_entries=DEFAULT_CACHE_SIZE):
+        """
+        Turns on conditional GET cache (ETag / Last-Modified, or body digest when server gives no validators).
+        Useful for polling, when the same resources are requested again and again.
+        """
+        self._response_cache = ResponseCache(max_entries)
+        return self
+
+    def disable_cache(self):
+        self._response_cache = None
+        return self
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Memoizes every GET made through router inside the block and discards them on exit,
+        so multi-step reads are consistent and cheap. Writes invalidate reads of the same organization.
+        Nested blocks share the outermost snapshot. Snapshot belongs to the thread, that opened it,
+        batch calls get snapshot of the thread, that submitted them.
+        Note: do not wait for status changes inside snapshot, polled resource would never change.
+        """
+        if not getattr(self._local, 'depth', 0):
+            self._local.snapshot = Snapshot()
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield self._local.snapshot
+        finally:
+            self._local.depth -= 1
+            if not self._local.depth:
+                self._local.snapshot = None
+
+    @property
+    def _snapshot(self):
+        """
+        Snapshot of current thread, or None
+        """
+        return getattr(self._local, 'snapshot', None)
+
+    @contextmanager
+    def use_snapshot(self, snapshot):
+        """
+        Makes snapshot of other thread current in this one for the block, None means reading without snapshot
+        """
+        saved = self._snapshot, getattr(self._local, 'depth', 0)
+        self._local.snapshot, self._local.depth = snapshot, 1 if snapshot is not None else 0
+        try:
+            yield snapshot
+        finally:
+            self._local.snapshot, self._local.depth = saved
+
+    def _caller_context(self):
+        # called by batch in submitting thread, returned context is entered in worker thread
+        return self.use_snapshot(self._snapshot)
+
+    def _ensure_pool_size(self, size):
+        # every call in flight needs own connection, otherwise urllib3 discards extra ones
+        if size > self._pool_size:
+            for prefix in ("http://", "https://"):
+                self._session.mount(prefix, HTTPAdapter(pool_maxsize=size))
+            self._pool_size = size
+
+    def batch(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Runs independent route calls concurrently, sharing session and its connection pool.
+        Exit from with-block waits for all calls.
+        :rtype: Batch
+        """
+        self._ensure_pool_size(max_in_flight)
+        return Batch(max_in_flight, context=self._caller_context)
+
+    def parallel_map(self, fn, items, max_in_flight=DEFAULT_MAX_IN_FLIGHT, return_exceptions=False):
+        """
+        Calls fn for every item concurrently, returns results in order of items.
+        :param return_exceptions: put exception in place of result instead of raising first one
+        """
+        self._ensure_pool_size(max_in_flight)
+        return parallel_map(fn, items, max_in_flight, return_exceptions, context=self._caller_context)
 
     @property
     def is_connected(self):
         return (self._cookies and ('PLAY_SESSION' in self._cookies)) or (self._jwt_auth and (self._jwt_auth.token))
 
-    def connect(self, email=None, password=None, token=None):
+    def connect(self, email=None, password=None, token=None, refresh_token=None):
         token = token or qubell_config['token']
-        if token:
+        refresh_token = refresh_token or qubell_config['refresh_token']
+        if token or refresh_token:
             self._jwt_auth = HTTPBearerAuth(token)
+            if refresh_token:
+                self._set_token_manager(TokenManager(self, refresh_token, self._jwt_auth))
+                if not token:
+                    self._token_manager.refresh()
         else:
             email = email or qubell_config['user']
             password = password or qubell_config['password']
-            url = self.base_url + '/signIn'
-            data = {
-                'email': email,
-                'password': password}
-
-            with self._session as session:
-                session.post(url=url, data=data, verify=self.verify_ssl)
-                self._cookies = session.cookies
-
-            if not self.is_connected:
-                raise ApiUnauthorizedError("Authentication failed, please check settings")
+            self._sign_in(email, password)
 
+    def session_state(self):
+        """
+        Returns serializable credentials of connected router: session cookies or token with its expiration time
+        """
+        if self._jwt_auth and self._jwt_auth.token:
+            return {'jwt': self._jwt_auth.token,
+                    'expires_at': self._token_manager and self._token_manager.expires_at}
+        if self._cookies:
+            expires = [c.expires for c in self._cookies if c.expires]
+            return {'cookies': requests.utils.dict_from_cookiejar(self._cookies),
+                    'expires_at': expires and min(expires) or None}
+        return {}
+
+    def restore_session(self, state, email=None, password=None, refresh_token=None):
+        """
+        Connects router with credentials from session_state, without signing in.
+        Password or refresh token are kept to renew session, when server rejects it.
+        """
+        if state.get('jwt'):
+            self._jwt_auth = HTTPBearerAuth(state['jwt'])
+            if refresh_token:
+                self._set_token_manager(TokenManager(self, refresh_token, self._jwt_auth))
+                if state.get('expires_at'):
+                    self._token_manager.schedule(state['expires_at'])
+        elif state.get('cookies'):
+            self._cookies = requests.utils.cookiejar_from_dict(state['cookies'], self._session.cookies)
+        if email and password:
             self._auth = HTTPBasicAuth(email, password)
             self._creds = email, password
+        return self
+
+    def refresh_ahead(self, manager):
+        """
+        Refreshes session token before expiry as renewal of credentials,
+        so requests rejected with old token are repeated without renewing it again
+        """
+        with self._auth_lock:
+            manager.refresh()
+            if manager is self._token_manager:
+                self.auth_generation += 1
+
+    def _set_token_manager(self, manager):
+        previous, self._token_manager = self._token_manager, manager
+        if previous:
+            previous.stop()
+
+    def close(self):
+        """
+        Stops background refresh of session token, router is not used after it
+        """
+        self._set_token_manager(None)
+
+    def _sign_in(self, email, password):
+        url = self.base_url + '/signIn'
+        data = {
+            'email': email,
+            'password': password}
+
+        with self._session as session:
+            session.post(url=url, data=data, verify=self.verify_ssl)
+            self._cookies = session.cookies
+
+        if not self.is_connected:
+            raise ApiUnauthorizedError("Authentication failed, please check settings")
+
+        self._auth = HTTPBasicAuth(email, password)
+        self._creds = email, password
+
+    def reauthenticate(self, generation=None):
+        """
+        Renews credentials, rejected by server: refreshes session token or signs in again.
+        Concurrent callers, rejected with the same credentials, cause only one renewal.
+        :param int generation: auth_generation, rejected request was made with
+        :return: True if request could be retried
+        """
+        with self._auth_lock:
+            if generation is not None and generation != self.auth_generation:
+                return True  # already renewed by other call
+            if self._token_manager:
+                self._token_manager.refresh()
+            elif self._creds:
+                self._sign_in(*self._creds)
+            else:
+                return False
+            self.auth_generation += 1
+            return True
 
 
 class InstanceRouter(object):
@@ -585,8 +754,29 @@ class PublicPath(PrivatePath):
 
 # TODO: Public api hack.
 # To use public api routes, set QUBELL_USE_PUBLIC env to not None
-if os.environ.get('QUBELL_USE_PUBLIC', None):
-    ROUTER = PublicPath(os.environ.get('QUBELL_TENANT'))
-    ROUTER.public_api_in_use = True
-else:
-    ROUTER = PrivatePath(os.environ.get('QUBELL_TENANT'))
+class _LazyRouter(object):
+    """
+    Global router, created on first use: importing api does not open sessions.
+    """
+
+    def __init__(self):
+        self.__dict__['_router'] = None
+
+    def _get(self):
+        if self._router is None:
+            if os.environ.get('QUBELL_USE_PUBLIC', None):
+                router = PublicPath(os.environ.get('QUBELL_TENANT'))
+                router.public_api_in_use = True
+            else:
+                router = PrivatePath(os.environ.get('QUBELL_TENANT'))
+            self.__dict__['_router'] = router
+        return self._router
+
+    def __getattr__(self, item):
+        return getattr(self._get(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self._get(), key, value)
+
+
+ROUTER = _LazyRouter()
@@ -27,6 +27,9 @@ import time
 import os
 import logging as log
 
+from qubell.api.private.exceptions import ApiCircuitOpenError, ApiThrottledError
+from qubell.api.provider.ratelimit import back_off
+
 
 def rand():
     return str(randrange(1000, 9999))
@@ -39,6 +42,8 @@ def retry(tries=10, delay=1, backoff=2, retry_exception=None):
     Retry "tries" times, with initial "delay", increasing delay "delay*backoff" each time.
     Without exception success means when function returns valid object.
     With exception success when no exceptions
+    When tenant asks to back off (open circuit or throttling), try is spent and only the next delay is at least
+    retry_after, later delays follow the usual schedule.
     """
     assert tries > 0, "tries must be 1 or greater"
     catching_mode = bool(retry_exception)
@@ -47,14 +52,20 @@ def retry(tries=10, delay=1, backoff=2, retry_exception=None):
         @functools.wraps(f)
         def f_retry(*args, **kwargs):
             mtries, mdelay = tries, delay
+            pause, backing_off = mdelay, False
 
             while mtries > 0:
-                time.sleep(mdelay)
+                (back_off if backing_off else time.sleep)(pause)
                 mdelay *= backoff
+                pause, backing_off = mdelay, False
                 try:
                     rv = f(*args, **kwargs)
                     if not catching_mode and rv:
                         return rv
+                except (ApiCircuitOpenError, ApiThrottledError) as e:
+                    log.debug("Backing off for {0} sec: {1}".format(e.retry_after, e))
+                    pause, backing_off = max(mdelay, e.retry_after), True
+                    rv = None
                 except retry_exception:
                     pass
                 else:
@@ -65,11 +76,24 @@ def retry(tries=10, delay=1, backoff=2, retry_exception=None):
                     return False
                 if mtries is 0 and catching_mode:
                     return f(*args, **kwargs)  # extra try, to avoid except-raise syntax
-                log.debug("{0} try, sleeping for {1} sec".format(tries-mtries, mdelay))
+                log.debug("{0} try, sleeping for {1} sec".format(tries-mtries, pause))
             raise Exception("unreachable code")
         return f_retry
     return deco_retry
 
+def read_status(instance, tries=3):
+    """
+    Reads status of instance, backing off as tenant asks, while circuit is open or call is throttled
+    :return: status in upper case, 'UNKNOWN' if it is not read in tries
+    """
+    for _ in range(tries):
+        try:
+            return (instance.status or 'Unknown').upper()
+        except (ApiCircuitOpenError, ApiThrottledError) as e:
+            log.debug("Backing off for {0} sec: {1}".format(e.retry_after, e))
+            back_off(e.retry_after)
+    return 'UNKNOWN'
+
 def waitForStatus(instance, final='Active', accepted=None, timeout=(20, 10, 1)):
     started = time.time()
     info = '%s (%s)' % (instance.name, instance.id)
@@ -87,12 +111,12 @@ def waitForStatus(instance, final='Active', accepted=None, timeout=(20, 10, 1)):
         We have to deal with lag when projection updates instance.
         :return:
         """
-        return instance.status.upper() not in final or instance._is_projection_updated_instance()
+        return read_status(instance) not in final or instance._is_projection_updated_instance()
     projection_update_monitor()
 
     @retry(*timeout)  # ask status 20 times every 10 sec.
     def instance_status_waiter():
-        cur_status = instance.status.upper()
+        cur_status = read_status(instance)
         if cur_status in final:
             log.debug('Instance %s got expected status: %s, continue' % (info, cur_status))
             return True
@@ -106,7 +130,7 @@ def waitForStatus(instance, final='Active', accepted=None, timeout=(20, 10, 1)):
     instance_status_waiter()
     # We here, means we reached timeout or got status we are waiting for.
     # Check it again to be sure
-    cur_status = instance.status.upper()
+    cur_status = read_status(instance)
     log.info('Instance %s final status: %s, expected status: %s, elapsed time: %s sec.' % (info, cur_status, final, int(time.time()-started)))
     instance._last_workflow_started_time = time.gmtime(time.time())
     if cur_status in final:
@@ -142,6 +166,63 @@ def waitForStatus(instance, final='Active', accepted=None, timeout=(20, 10, 1)):
     return False
 
 
+def wait_for_statuses(instances, final=('Active', 'Running'), accepted=('Launching', 'Requested', 'Executing', 'Unknown'),
+                      timeout=3, interval=3, clock=time.time, sleep=None):
+    """
+    Waits for several instances at once. Every interval statuses of all of them are read by one dashboard query
+    per organization, instances missing there (submodules, destroyed ones) are asked one by one.
+    Instance is not waited any more, when it gets final status, or status, that is neither final nor accepted.
+    Instance, which status is not read due to open circuit or throttling, stays pending, next poll is delayed
+    as tenant asks. Missing status is 'Unknown'.
+    :param int timeout: minutes
+    :param sleep: time.sleep by default, looked up on call, so that accounting of waits can replace it
+    :return: dict of instance id to its last status
+    """
+    sleep = sleep or time.sleep
+    final = [x.upper() for x in final]
+    waited = [x.upper() for x in accepted]
+    pending = dict((instance.instanceId, instance) for instance in instances)
+    statuses = {}
+    started = clock()
+    while True:
+        pause = 0  # asked by tenant
+        by_organization = {}
+        for instance in pending.values():
+            by_organization.setdefault(instance.organizationId, []).append(instance)
+        for org_instances in by_organization.values():
+            try:
+                listed = dict((i.get('id') or i.get('instanceId'), i.get('status'))
+                              for i in org_instances[0].organization.list_instances_json())
+            except Exception as e:
+                log.debug("Dashboard is not read, asking instances one by one: %s" % e)
+                listed = {}
+            for instance in org_instances:
+                status = listed.get(instance.instanceId)
+                if not status:
+                    try:
+                        status = instance.status
+                    except (ApiCircuitOpenError, ApiThrottledError) as e:
+                        log.debug("Status of %s is not read, backing off for %s sec: %s" % (
+                            instance.instanceId, e.retry_after, e))
+                        pause = max(pause, e.retry_after)
+                        statuses.setdefault(instance.instanceId, 'Unknown')
+                        continue
+                status = status or 'Unknown'
+                statuses[instance.instanceId] = status
+                if status.upper() not in waited:
+                    instance._last_workflow_started_time = time.gmtime(time.time())  # same as waitForStatus
+                    del pending[instance.instanceId]
+        if not pending or clock() - started >= timeout * 60:
+            break
+        sleep(interval)
+        if pause > interval:
+            back_off(pause - interval)
+    reached = len([s for s in statuses.values() if s.upper() in final])
+    log.info('%s of %s instances got one of %s statuses, elapsed time: %s sec.' % (
+        reached, len(statuses), list(final), int(clock() - started)))
+    return statuses
+
+
 def dump(node):
     """ Dump initialized object structure to yaml
     """
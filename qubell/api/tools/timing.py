@@ -0,0 +1,295 @@
+# Copyright (c) 2013 Qubell Inc., http://qubell.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Timing and API call accounting of test suites, see TimingPlugin.
+For every test class and test it records wall time of setup_once, test body and teardown_once, time slept in waits,
+time of API calls and their number by route. Sleeps of client side throttling and back off, asked by tenant,
+are counted as throttle time, apart from waits.
+Sleeps and API calls are counted for whole process, so ones of parallel threads are summed and may exceed wall time.
+Plugin also waits for background verification of sandbox destroy and lists instances left in its report.
+Module does not import testing package, so that loading of plugin by nose does not configure logging.
+"""
+import cgi
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from collections import OrderedDict
+
+from nose.plugins import Plugin
+
+from qubell.api.provider import routes_stat
+from qubell.api.provider.ratelimit import is_backing_off
+
+PHASES = ("setup_once", "teardown_once")
+SANDBOX_MODULE = "qubell.api.private.testing.sandbox_testcase"
+
+
+class SleepMeter(object):
+    """
+    Replaces time.sleep with one, that sums time slept by all threads: waits in total, throttling in throttled
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.throttled = 0.0
+        self._lock = threading.Lock()
+        self._sleep = None
+
+    def install(self):
+        self._sleep = time.sleep
+        time.sleep = self.sleep
+
+    def uninstall(self):
+        if self._sleep:
+            time.sleep = self._sleep
+            self._sleep = None
+
+    def sleep(self, seconds):
+        started = time.time()
+        try:
+            self._sleep(seconds)
+        finally:
+            with self._lock:
+                if is_backing_off():
+                    self.throttled += time.time() - started
+                else:
+                    self.total += time.time() - started
+
+
+def usage(before, after):
+    """
+    :return: wall, sleep, throttle and http seconds, number of API calls and calls by route between two snapshots
+    """
+    routes = {}
+    http = 0
+    for route, stat in after["routes"].items():
+        old = before["routes"].get(route) or {"count": 0, "total": 0}
+        if stat["count"] > old["count"]:
+            routes[route] = stat["count"] - old["count"]
+            http += stat["total"] - old["total"]
+    return {"wall": after["time"] - before["time"], "sleep": after["sleep"] - before["sleep"],
+            "throttle": after["throttle"] - before["throttle"],
+            "http": http / 1000.0, "calls": sum(routes.values()), "routes": routes}
+
+
+def subtract(total, part):
+    """
+    :return: usage of total without part of it
+    """
+    routes = dict((route, count - part["routes"].get(route, 0)) for route, count in total["routes"].items())
+    result = dict((key, total[key] - part[key]) for key in ("wall", "sleep", "throttle", "http", "calls"))
+    result["routes"] = dict((route, count) for route, count in routes.items() if count)
+    return result
+
+
+class TimingRecorder(object):
+    """
+    Collects usage of test classes and tests, independent of test runner.
+    Classes, that have setup_once/teardown_once (SetupOnce), get them timed while class runs.
+    """
+
+    def __init__(self, sleep_meter=None, clock=time.time):
+        self.meter = sleep_meter or SleepMeter()
+        self.clock = clock
+        self.classes = OrderedDict()
+        self._test = None
+
+    def snapshot(self):
+        return {"time": self.clock(), "sleep": self.meter.total, "throttle": self.meter.throttled,
+                "routes": routes_stat()}
+
+    def _record(self, name):
+        if name not in self.classes:
+            self.classes[name] = {"name": name, "tests": [], "usage": None, "_started": self.snapshot(),
+                                  "_originals": {}}
+        return self.classes[name]
+
+    def start_class(self, cls):
+        record = self._record("%s.%s" % (cls.__module__, cls.__name__))
+        for phase in PHASES:
+            method = getattr(cls, phase, None)
+            if method is not None and phase not in record["_originals"]:
+                record["_originals"][phase] = cls.__dict__.get(phase)
+                setattr(cls, phase, self._timed(record, phase, method))
+
+    def stop_class(self, cls):
+        record = self._record("%s.%s" % (cls.__module__, cls.__name__))
+        record["usage"] = usage(record["_started"], self.snapshot())
+        for phase, original in record.pop("_originals").items():
+            if original is None:
+                delattr(cls, phase)
+            else:
+                setattr(cls, phase, original)
+        del record["_started"]
+
+    def _timed(self, record, phase, method):
+        def timed(test, *args, **kwargs):
+            before = self.snapshot()
+            try:
+                return method(test, *args, **kwargs)
+            finally:
+                record[phase] = usage(before, self.snapshot())
+                if self._test is not None:
+                    self._test["_phases"].append(record[phase])
+        return timed
+
+    def start_test(self, class_name, name):
+        self._test = {"class": class_name, "name": name, "_phases": [], "_started": self.snapshot()}
+
+    def stop_test(self):
+        test, self._test = self._test, None
+        if test is None:
+            return
+        spent = usage(test.pop("_started"), self.snapshot())
+        for phase in test.pop("_phases"):
+            spent = subtract(spent, phase)
+        test.update(spent)
+        self._record(test["class"])["tests"].append(test)
+
+    def results(self, top=5):
+        """
+        :return: usage of classes and tests, the slowest sandboxes by setup_once and teardown_once,
+                 and the most chatty tests by API calls
+        """
+        classes = [dict((k, v) for k, v in record.items() if not k.startswith("_")) for record in self.classes.values()]
+        sandboxes = [{"name": c["name"], "wall": sum(c[phase]["wall"] for phase in PHASES if phase in c),
+                      "setup_once": c["setup_once"]["wall"] if "setup_once" in c else None,
+                      "teardown_once": c["teardown_once"]["wall"] if "teardown_once" in c else None}
+                     for c in classes if any(phase in c for phase in PHASES)]
+        tests = [{"name": "%s.%s" % (t["class"], t["name"]), "calls": t["calls"], "wall": t["wall"]}
+                 for c in classes for t in c["tests"] if t["calls"]]
+        return {"classes": classes,
+                "slowest_sandboxes": sorted(sandboxes, key=lambda s: -s["wall"])[:top],
+                "chattiest_tests": sorted(tests, key=lambda t: -t["calls"])[:top]}
+
+
+def join_reapers():
+    """
+    Waits for background verification of sandbox destroy, if sandboxes are used
+    :return: messages about instances, that are not destroyed
+    """
+    module = sys.modules.get(SANDBOX_MODULE)
+    return module.join_reapers() if module else []
+
+
+def _seconds(value):
+    return "" if value is None else "%.1f" % value
+
+
+def _escape(value):
+    return cgi.escape(str(value), quote=True)
+
+
+def html_report(results):
+    """
+    :return: html page of results
+    """
+    def row(cells, header=False):
+        tag = "th" if header else "td"
+        return "<tr>%s</tr>" % "".join("<%s>%s</%s>" % (tag, _escape(cell), tag) for cell in cells)
+
+    rows = [row(["name", "setup_once, s", "test, s", "teardown_once, s", "sleep, s", "throttle, s", "http, s",
+                 "API calls", "calls by route"], header=True)]
+    for c in results["classes"]:
+        spent = c["usage"] or {}
+        rows.append(row([c["name"], _seconds((c.get("setup_once") or {}).get("wall")), "",
+                         _seconds((c.get("teardown_once") or {}).get("wall")), _seconds(spent.get("sleep")),
+                         _seconds(spent.get("throttle")), _seconds(spent.get("http")), spent.get("calls", ""), ""],
+                        header=True))
+        for t in c["tests"]:
+            routes = ", ".join("%s: %s" % (r, n) for r, n in sorted(t["routes"].items(), key=lambda x: -x[1]))
+            rows.append(row([t["name"], "", _seconds(t["wall"]), "", _seconds(t["sleep"]), _seconds(t["throttle"]),
+                             _seconds(t["http"]), t["calls"], routes]))
+    sandboxes = "".join("<li>%s s %s</li>" % (_seconds(s["wall"]), _escape(s["name"]))
+                        for s in results["slowest_sandboxes"])
+    chatty = "".join("<li>%s calls %s</li>" % (t["calls"], _escape(t["name"])) for t in results["chattiest_tests"])
+    return ("<html><head><meta charset='utf-8'><title>Test timing</title></head><body>"
+            "<h2>Slowest sandboxes</h2><ol>%s</ol><h2>Most chatty tests</h2><ol>%s</ol>"
+            "<h2>Classes and tests</h2><table border='1'>%s</table></body></html>" % (sandboxes, chatty, "".join(rows)))
+
+
+class TimingPlugin(Plugin):
+    """
+    Writes JSON and HTML report of time and API calls of test classes and tests.
+    Instances, that sandboxes left not destroyed, are listed in the report.
+    """
+    name = "qubell-timing"
+
+    def options(self, parser, env=os.environ):
+        super(TimingPlugin, self).options(parser, env)
+        parser.add_option("--qubell-timing-report", dest="qubell_timing_report",
+                          default=env.get("QUBELL_TIMING_REPORT", "qubell-timing"),
+                          help="Path of report without extension, .json and .html are written "
+                               "[QUBELL_TIMING_REPORT, default: qubell-timing]")
+        parser.add_option("--qubell-timing-top", dest="qubell_timing_top", type="int", default=5,
+                          help="Number of the slowest sandboxes and the most chatty tests to flag [default: 5]")
+
+    def configure(self, options, conf):
+        super(TimingPlugin, self).configure(options, conf)
+        if self.enabled:
+            self.path = options.qubell_timing_report
+            self.top = options.qubell_timing_top
+            self.recorder = TimingRecorder()
+
+    def begin(self):
+        self.recorder.meter.install()
+
+    def startContext(self, context):
+        if inspect.isclass(context):
+            self.recorder.start_class(context)
+
+    def stopContext(self, context):
+        if inspect.isclass(context):
+            self.recorder.stop_class(context)
+
+    def startTest(self, test):
+        case = getattr(test, "test", test)
+        if isinstance(case, unittest.TestCase):
+            self.recorder.start_test("%s.%s" % (case.__class__.__module__, case.__class__.__name__),
+                                     case._testMethodName)
+        else:
+            class_name, _, name = test.id().rpartition(".")
+            self.recorder.start_test(class_name, name)
+
+    def stopTest(self, test):
+        self.recorder.stop_test()
+
+    def report(self, stream):
+        failures = join_reapers()
+        results = self.recorder.results(self.top)
+        results["not_destroyed"] = failures
+        with open(self.path + ".json", "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        with open(self.path + ".html", "w") as f:
+            f.write(html_report(results))
+        stream.writeln("Timing report: %s.json, %s.html" % (self.path, self.path))
+        stream.writeln("Slowest sandboxes:")
+        for s in results["slowest_sandboxes"]:
+            stream.writeln("  %8s s  %s (setup_once %s s, teardown_once %s s)" % (
+                _seconds(s["wall"]), s["name"], _seconds(s["setup_once"]), _seconds(s["teardown_once"])))
+        stream.writeln("Most chatty tests:")
+        for t in results["chattiest_tests"]:
+            stream.writeln("  %8s calls  %s" % (t["calls"], t["name"]))
+        if failures:
+            stream.writeln("Not destroyed by sandboxes:")
+            for failure in failures:
+                stream.writeln("  %s" % failure)
+
+    def finalize(self, result):
+        self.recorder.meter.uninstall()
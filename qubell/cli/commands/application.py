@@ -0,0 +1,268 @@
+import click
+import re
+import yaml
+from os.path import basename, join
+from qubell.api.globals import QUBELL
+from qubell.api.private.exceptions import NotFoundError
+from qubell.api.private.manifest import Manifest
+from qubell.api.provider.batch import DEFAULT_MAX_IN_FLIGHT
+from qubell.cli.common import STATUS_COLORS, _color, _get_application, _get_platform, _remember
+from qubell.cli.output import output_option, writer
+from qubell.cli.yamlutils import DuplicateAnchorLoader
+
+
+@click.group()
+def application_cli():
+    pass
+
+
+@application_cli.command(name="list", help="List applications in organization")
+@click.option('-v', '--verbose', is_flag=True, default=False, help="Verbose output")
+@output_option
+def list_apps(verbose, output):
+    _platform = _get_platform()
+
+    assert QUBELL["organization"], "Organization should be provided"
+    org = _platform.get_organization(QUBELL["organization"])
+    json = org.list_applications_json()
+    out = writer(output, ["id", "name"] + (verbose and ["instances"] or []))
+    for app_json in json:
+        app_id, app_name = app_json['id'], app_json['name']
+
+        if verbose:
+            app = org.get_application(app_id)
+            instances = app.instances
+            by_status = {}
+            by_status['DESTROYED'] = len(app.destroyed_instances)
+            for instance in instances:
+                key = instance.status.upper()
+                by_status[key] = by_status.get(key, 0) + 1
+            if out:
+                out.row(dict(app_json, instances=by_status))
+                continue
+            for (status, color) in STATUS_COLORS.iteritems():
+                by_status[status] = _color(color, str(by_status.get(status, 0)))
+            click.echo(app.id + " " +
+                       "(%(ACTIVE)s/%(LAUNCHING)s/%(EXECUTING)s/%(DESTROYING)s/%(FAILED)s/%(DESTROYED)s) " % by_status +
+                       _color("BLUE", app.name))
+        elif out:
+            out.row(app_json)
+        else:
+            click.echo(app_id + " " + _color("BLUE", app_name))
+    if out:
+        out.finish()
+    _remember(org, "application", json)
+
+
+# child reference on a line of its own, as platform saves it; other forms are left to yaml parser
+LOCATOR_ATTR = "__locator.application-id"
+LOCATOR_RE = re.compile(r"""^[ \t-]*["']?__locator\.application-id["']?[ \t]*:[ \t]*["']?([\w.-]+)["']?[ \t]*(#.*)?$""",
+                        re.MULTILINE)
+
+
+def _locators(manifest_yml):
+    if isinstance(manifest_yml, dict):
+        if LOCATOR_ATTR in manifest_yml:
+            return [manifest_yml[LOCATOR_ATTR]]
+        return [app for value in manifest_yml.itervalues() for app in _locators(value)]
+    elif isinstance(manifest_yml, list):
+        return [app for item in manifest_yml for app in _locators(item)]
+    return []
+
+
+def child_applications(manifest):
+    """
+    Ids of applications manifest refers to, in order of appearance, without duplicates
+    """
+    children = [match.group(1) for match in LOCATOR_RE.finditer(manifest)]
+    if len(children) != manifest.count(LOCATOR_ATTR):
+        children = _locators(yaml.load(manifest, DuplicateAnchorLoader))
+    unique = []
+    for child in children:
+        if child not in unique:
+            unique.append(child)
+    return unique
+
+
+@application_cli.command(name="export", help="Save manifest of applications to files")
+@click.argument("applications", nargs=-1)
+@click.option("--recursive", is_flag=True, default=False, help="Recursively also dependencies")
+@click.option("--output-dir", default="", help="Output directory for manifest files, current by default")
+@click.option("--stdout", default=False, help="Print manifest to stdout instead of saving to file")
+@click.option("--version", '-v', default=None, help="Manifest version to export. Default is last available")
+@click.option("--jobs", "-j", default=DEFAULT_MAX_IN_FLIGHT, type=click.IntRange(1, None),
+              help="Download up to N manifests at once")
+def export_app(recursive, applications, output_dir, version, stdout, jobs):
+    if stdout and recursive:
+        click.echo("Using --recursive with --stdout is not supported")
+        exit(1)
+
+    platform = _get_platform()
+
+    def echo_progress(*args, **kwargs):
+        if not stdout:
+            click.echo(*args, **kwargs)
+
+    def _save_manifest(app, manifest, filename=None):
+        if stdout:
+            click.echo(manifest["manifest"])
+        else:
+            filename = filename or "%s-v%s.yml" % (app.name, manifest["version"])
+            if output_dir:
+                filename = join(output_dir, filename)
+            click.echo("=> " + filename, nl=False)
+            with open(filename, "w") as f:
+                f.write(manifest["manifest"])
+
+    org = platform.get_organization(QUBELL["organization"])
+
+    def fetch(current_app, current_version):
+        current_app = _get_application(org, current_app)
+        if not current_version:
+            manifest = current_app.get_manifest_latest()
+        else:
+            manifest = current_app.get_manifest(current_version)
+        children = recursive and child_applications(manifest["manifest"]) or []
+        return current_app, manifest, children
+
+    assert applications, "Application ID or name should be provided"
+    # dependency graph is walked level by level, manifests of a level are downloaded concurrently,
+    # and printed in order; application shared by several parents, or in a cycle, is exported once
+    requested = set()
+    exported = set()
+    level = []
+    for app in applications:
+        if (app, version) not in requested:
+            requested.add((app, version))
+            level.append((app, version))
+    while level:
+        next_level = []
+        with platform.batch(jobs) as batch:
+            calls = [batch.submit(fetch, app, app_version) for app, app_version in level]
+            for (app, app_version), call in zip(level, calls):
+                if isinstance(call.exception(), (IOError, NotFoundError)):
+                    echo_progress("Saving " + _color("BLUE", app) + " ", nl=False)
+                    click.echo(_color("RED", " FAIL"))
+                    continue
+                current_app, manifest, children = call.result()
+                if (current_app.id, manifest["version"]) in exported:
+                    continue
+                exported.add((current_app.id, manifest["version"]))
+                echo_progress("Saving " + _color("BLUE", app) + " ", nl=False)
+                echo_progress(_color("BLUE", "v" + str(manifest["version"])) + " ", nl=False)
+                try:
+                    _save_manifest(current_app, manifest)
+                except IOError:
+                    click.echo(_color("RED", " FAIL"))
+                    continue
+                echo_progress(_color("GREEN", " OK"))
+                for child in children:
+                    if (child, None) not in requested:
+                        requested.add((child, None))
+                        next_level.append((child, None))
+        level = next_level
+
+
+@application_cli.command(name="import",
+                         help="Upload manifest to application. If no name or id provided, application will be created by file name")
+@click.argument("files", nargs=-1)
+@click.option("--category", default=None, help="Category name in which app will be created. "
+                                               "If app already exists, its category will be updated.")
+@click.option("--id", "-i", default=None,
+              help="Application id, allowed only if one filename given. Disables --app-name if provided."
+                   "If app with such id not found, new app won't be created.")
+@click.option("--name", "-n", default=None,
+              help="Application name, allowed only if one filename given. Is ignored if --app-id is provided."
+                   "Has higher priority than file name.")
+@click.option("--overwrite", "-w", is_flag=True, default=False,
+              help="Upload manifest for already existing applications")
+@click.option("--jobs", "-j", default=DEFAULT_MAX_IN_FLIGHT, type=click.IntRange(1, None),
+              help="Upload up to N files at once")
+def import_app(files, category, overwrite, id, name, jobs):
+    """ Upload application from file.
+
+    By default, file name will be used as application name, with "-vXX.YYY" suffix stripped.
+    Application is looked up by one of these classifiers, in order of priority:
+    app-id, app-name, filename.
+
+    If app-id is provided, looks up existing application and updates its manifest.
+    If app-id is NOT specified, looks up by name, or creates new application.
+
+    Files are uploaded concurrently, results are printed in order of files.
+    """
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    if category:
+        category = org.categories[category]
+    regex = re.compile(r"^(.*?)(-v(\d+)|)\.[^.]+$")
+    if (id or name) and len(files) > 1:
+        raise Exception("--id and --name are supported only for single-file mode")
+
+    def do_import(filename):
+        """
+        Runs in worker thread, so output is formatted by caller
+        :return: (application name, application, error)
+        """
+        app_name = name
+        if not app_name:
+            match = regex.match(basename(filename))
+            if not match:
+                return None, None, "unknown filename format"
+            app_name = match.group(1)
+        app = None
+        try:
+            app = org.get_application(id=id, name=app_name)
+            if app and not overwrite:
+                return app.name, app, "already exists"
+        except NotFoundError:
+            if id:
+                return app_name, None, "not found"
+        try:
+            with file(filename, "r") as f:
+                if app:
+                    app.update(name=app.name,
+                               category=category and category.id or app.category,
+                               manifest=Manifest(content=f.read()))
+                else:
+                    app = org.application(id=id, name=app_name, manifest=Manifest(content=f.read()))
+                    if category:
+                        app.update(category=category.id)
+            return app_name, app, None
+        except IOError as e:
+            return app_name, app, str(e)
+
+    failed = False
+    with platform.batch(jobs) as batch:
+        calls = batch.map(do_import, files)
+        for filename, call in zip(files, calls):
+            app_name, app, error = call.result()
+            failed = failed or bool(error)
+            if not app_name:
+                click.echo("Importing %s %s %s" % (filename, _color("RED", "FAIL"), error))
+            elif error in ("already exists", "not found"):
+                click.echo("Importing %s => %s %s %s %s" % (
+                    filename, app and app.id or id or "", _color("BLUE", app_name), error, _color("RED", "FAIL")))
+            elif error:
+                click.echo("Importing %s => %s %s %s" % (
+                    filename, _color("BLUE", app_name), _color("RED", "FAIL"), error))
+            else:
+                click.echo("Importing %s => %s %s%s" % (
+                    filename, _color("BLUE", app_name), app.id, _color("GREEN", " OK")))
+    if failed:
+        exit(1)
+
+
+@application_cli.command(name="delete", help="Delete application")
+@click.argument("applications", nargs=-1)
+def delete_app(applications):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    results = platform.parallel_map(org.delete_application, applications, return_exceptions=True)
+    for app, result in zip(applications, results):
+        click.echo("Deleting %s" % (_color("BLUE", app)), nl=False)
+        if isinstance(result, Exception):
+            click.echo(_color("RED", " FAILED ") + str(result))
+        else:
+            click.echo(_color("GREEN", " OK"))
+    if any(isinstance(result, Exception) for result in results):
+        exit(1)
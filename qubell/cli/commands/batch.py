@@ -0,0 +1,112 @@
+import click
+import shlex
+import time
+from qubell.cli import runner
+from qubell.cli.common import _color, keep_platforms_warm
+
+JOB_COLORS = {
+    "ok": "GREEN",
+    "failed": "RED",
+    "skipped": "YELLOW",
+}
+
+# commands, that make no sense inside of batch
+NOT_IN_BATCH = ["bat", "she", "dae"]
+
+
+def _split(command):
+    args = shlex.split(command) if isinstance(command, basestring) else [str(arg) for arg in command or []]
+    if not args:
+        raise ValueError("Empty command")
+    if args[0].startswith("-"):
+        raise ValueError("Global options are set for whole batch, like 'nomi --organization ORG batch FILE': %s" %
+                         " ".join(args))
+    if any(args[0].startswith(prefix) for prefix in NOT_IN_BATCH):
+        raise ValueError("Command '%s' can not be run in batch" % args[0])
+    return args
+
+
+def parse_lines(text):
+    """
+    Command per line, commands after 'wait' line run when all commands before it have succeeded
+    """
+    jobs = []
+    barrier = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "wait":
+            barrier = [job.name for job in jobs]
+            continue
+        jobs.append(runner.Job(str(number), _split(line), barrier))
+    return jobs
+
+
+def parse_yaml(data):
+    """
+    List of commands, every one is string or mapping with 'command' and optional 'name' and 'after'
+    """
+    if isinstance(data, dict):
+        data = data.get("commands")
+    if not isinstance(data, list):
+        raise ValueError("List of commands expected")
+    jobs = []
+    for index, item in enumerate(data, 1):
+        if not isinstance(item, dict):
+            item = {"command": item}
+        after = item.get("after") or []
+        if not isinstance(after, list):
+            after = [after]
+        jobs.append(runner.Job(str(item.get("name", index)), _split(item.get("command")), [str(a) for a in after]))
+    return jobs
+
+
+def parse(text, file_format="auto"):
+    if file_format == "lines":
+        return parse_lines(text)
+    import yaml
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        if file_format == "yaml":
+            raise ValueError("Invalid YAML: %s" % e)
+        data = None
+    if file_format == "yaml" or isinstance(data, (list, dict)):
+        return parse_yaml(data)
+    return parse_lines(text)
+
+
+@click.command(help="Run commands from FILENAME in one process with shared session, independent ones concurrently. "
+                    "FILENAME is YAML list of commands, or of mappings with 'command', 'name' and 'after' "
+                    "(names of commands to run after), or text with command per line, "
+                    "where 'wait' line waits for all commands before it. "
+                    "Exit status is 0 only if all commands succeeded.")
+@click.option("--jobs", "-j", default=4, type=click.IntRange(1, None), help="Run up to N commands at once")
+@click.option("--format", "file_format", default="auto", type=click.Choice(["auto", "yaml", "lines"]),
+              help="Format of FILENAME, detected by default")
+@click.option("--fail-fast", is_flag=True, default=False, help="Skip commands not started before first failure")
+@click.argument("filename", type=click.File("r"))
+def batch_cli(filename, jobs, file_format, fail_fast):
+    try:
+        job_list = parse(filename.read(), file_format)
+        runner.check_jobs(job_list)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    def report(job):
+        timing = "" if job.skipped else " (%.2fs)" % job.elapsed
+        click.echo("%s %s%s: nomi %s" % (_color(JOB_COLORS[job.status], "[%s]" % job.status), job.name, timing,
+                                        " ".join(job.args)))
+        if job.output:
+            click.echo(job.output.rstrip("\n"))
+
+    keep_platforms_warm(jobs)
+    started = time.time()
+    runner.run_jobs(job_list, jobs, fail_fast, report)
+    elapsed = time.time() - started
+
+    counts = dict((status, len([job for job in job_list if job.status == status])) for status in JOB_COLORS)
+    click.echo("%s ok, %s failed, %s skipped in %.2fs, commands took %.2fs" % (
+        counts["ok"], counts["failed"], counts["skipped"], elapsed, sum(job.elapsed for job in job_list)))
+    exit(0 if counts["ok"] == len(job_list) else 1)
@@ -0,0 +1,37 @@
+import click
+import os
+from qubell.cli import server
+
+
+@click.command(help="Serve nomi commands in background process, keeping platform connection and caches warm. "
+                    "While daemon is running, nomi forwards commands to it, set NOMI_DAEMON=off to bypass it. "
+                    "Commands of clients with the same settings, environment and directory run concurrently, "
+                    "each with own output, and share one warm platform per credentials; "
+                    "commands with other settings wait for them, commands with global options run alone. "
+                    "Long-running commands (--follow, --wait, wait-status) are not forwarded.")
+@click.option("--socket", "socket_path", default=None, help="Unix socket to listen, NOMI_SOCKET by default")
+@click.option("--idle-timeout", default=3600, type=int, help="Stop after so many seconds without commands, "
+                                                              "0 to run until stopped")
+@click.option("--detach", is_flag=True, default=False, help="Run in background")
+@click.option("--stop", is_flag=True, default=False, help="Stop running daemon")
+@click.option("--status", is_flag=True, default=False, help="Check if daemon is running")
+def daemon_cli(socket_path, idle_timeout, detach, stop, status):
+    path = socket_path or server.default_socket_path()
+    if stop:
+        if not server.stop(path):
+            click.echo("nomi daemon is not running", err=True)
+            exit(1)
+        return
+    running = server.is_running(path)
+    if status or running:
+        click.echo("nomi daemon is %s on %s" % ("running" if running else "not running", path))
+        exit(0 if status == running else 1)
+    if detach:
+        if os.fork():
+            click.echo("nomi daemon is started on %s" % path)
+            return
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
+    server.serve(path, idle_timeout)
@@ -0,0 +1,227 @@
+import click
+import sys
+from qubell.api.globals import QUBELL
+from qubell.cli.common import STATUS_COLORS, _color, _columns, _get_environment, _get_platform, _remember
+from qubell.cli.nameindex import completion
+from qubell.cli.output import output_option, write_object, writer
+
+
+@click.group()
+def environment_cli():
+    pass
+
+
+@environment_cli.command("list", help="List environments")
+@output_option
+def list_envs(output):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    out = writer(output, ["id", "name", "isOnline", "isDefault"])
+    # environments are loaded concurrently and printed in order, as soon as each is loaded
+    listed = []
+    with platform.batch() as batch:
+        for call in batch.map(lambda env: env.json(), list(org.environments)):
+            env = call.result()
+            listed.append(env)
+            if out:
+                out.row(env)
+                continue
+            status = env['isOnline'] and _color("GREEN", "ONLINE") or _color("RED", "FAILED")
+            click.echo(env['id'] + " " + _color("BLUE", env['name']) + " " + status, nl=False)
+            if env['isDefault']:
+                click.echo(" " + _color("BLUE", "DEFAULT"))
+            else:
+                click.echo()
+    if out:
+        out.finish()
+    _remember(org, "environment", listed)
+
+
+@environment_cli.command("clear", help="Clean environment. Remove all services in environment")
+@click.option("--destroy-services/--keep-services", default=False, help="Destroy services")
+@click.option("--fallback-force/--no-fallback-force", default=False, help="Use force-remove if destroy failed")
+@click.option("--force/--no-force", default=False, help="Use force-remove instead of destroy")
+@click.argument("environment", autocompletion=completion("environment"))
+def clear_env(environment, destroy_services, force, fallback_force):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    if destroy_services:
+        for service in env.services:
+            click.echo(service.id + " " + _color("BLUE", service.name) + " ", nl=False)
+            env.remove_service(service)
+            if not force:
+                try:
+                    service.destroy()
+                    service.destroyed()
+                except AssertionError:
+                    if fallback_force:
+                        service.force_remove()
+            else:
+                service.force_remove()
+            click.echo(_color(STATUS_COLORS["DESTROYED"], "DESTROYED"))
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    env.clean()
+    click.echo(_color("GREEN", "CLEANED"))
+
+
+@environment_cli.command("init", help="Add basic services to environment (WF, CA, KS services)")
+@click.option("--zone", default=None, help="In what zone services should be launched")
+@click.option("--without-cloud-account", is_flag=True, default=False, help="Whether init-ca should be performed")
+@click.argument("environment", default="default", autocompletion=completion("environment"))
+def init_env(environment, without_cloud_account, zone):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    env.init_common_services(with_cloud_account=not (without_cloud_account), zone_name=zone)
+    click.echo(_color("GREEN", "OK"))
+
+
+@environment_cli.command("create", help="Create environment")
+@click.option("--default/--no-default", default=False, help="Make created environment default")
+@click.option("--zone", default=None, help="Zone for environment. "
+                                           "When performing init-env, services will be launched in that zone")
+@click.option("--init", is_flag=True, default=False, help="Perform init-env after creation")
+@click.option("--without-cloud-account", default=True,
+              help="If performing init-env, whether init-ca should be performed")
+@click.argument("name")
+def create_env(name, init, zone, default, without_cloud_account):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = org.create_environment(name, default, zone)
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    if init:
+        env.init_common_services(with_cloud_account=not (without_cloud_account), zone_name=zone)
+    click.echo(_color("GREEN", "CREATED"))
+
+
+@environment_cli.command("delete", help="Delete environment")
+@click.argument("environment", autocompletion=completion("environment"))
+def delete_env(environment):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    env.delete()
+    click.echo(_color("GREEN", "DELETED"))
+
+
+@environment_cli.command("clone", help="Copy environment")
+@click.option("--wait", is_flag=True, default=False, help="Wait for environment to become ONLINE")
+@click.option("--zone", default=None, help="Zone for environment")
+@click.argument("environment", autocompletion=completion("environment"))
+@click.argument("newname", default=None, required=False)
+def clone_env(environment, newname, wait, zone):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    orig_env = _get_environment(org, environment)
+    if not newname:
+        newname = "Clone of " + orig_env.name
+    env = org.create_environment(newname, False, zone or orig_env.zoneId)
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    env.restore(orig_env.json())
+    if wait:
+        env.ready()
+        click.echo(_color("GREEN", "ONLINE"))
+    else:
+        click.echo(_color("GREEN", "CREATED"))
+
+
+@environment_cli.command("describe", help="Show services, markers and properties of environment")
+@click.argument("environment", default="default", autocompletion=completion("environment"))
+@output_option
+def describe_env(environment, output):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    if output != "text":
+        write_object(output, env.json())
+        return
+    click.echo("Environment " + env.id + "  " + _color("BLUE", env.name))
+    click.echo("Status      " + (env.isOnline and _color("GREEN", "ONLINE") or _color("RED", "OFFLINE")))
+    click.echo("Backend     " + env.zoneId + "  " + _color("BLUE", org.zones[env.zoneId].name))
+    if env.services:
+        click.echo("Services")
+
+        def service_text(s):
+            try:
+                env_text = s.json()['environment']['name']
+            except Exception:
+                env_text = ""
+            return _color("BLUE", s.name) + " @ " + env_text
+
+        _columns(env.services, lambda s: "    " + s.id, service_text)
+    if env.policies:
+        click.echo("Policies")
+        _columns(env.policies, lambda s: "    %(action)s.%(parameter)s" % s, lambda s: s['value'])
+    if env.markers:
+        click.echo("Markers")
+        _columns(env.markers, lambda s: "    %(name)s" % s, lambda s: "")
+    if env.properties:
+        click.echo("Properties")
+        _columns(env.properties, lambda s: "    %(type)s %(name)s" % s, lambda s: s['value'])
+
+
+@environment_cli.command("export", help="Save environment to file")
+@click.argument("environment", default="default", autocompletion=completion("environment"))
+@click.argument("filename", default=None, required=False)
+def export_env(environment, filename):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    if filename:
+        click.echo("Exporting %s to %s " % (_color("BLUE", env.name), filename), nl=False)
+        f = open(filename, "w")
+        click.echo(_color("GREEN", "OK"), err=True)
+    else:
+        f = sys.stdout
+    f.write(env.export_yaml())
+
+
+@environment_cli.command("import", help="Import environment from file")
+@click.option("--merge", is_flag=True, default=True, help="Merge or replace file contents with existing environment.")
+@click.option("--create", is_flag=True, default=True, help="")
+@click.argument("environment", autocompletion=completion("environment"))
+@click.argument("filename", default=None, required=False)
+def import_env(environment, filename, merge, create):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    if create:
+        env = org.get_or_create_environment(environment)
+    else:
+        env = _get_environment(org, environment)
+    env_file = filename and open(filename, "r") or sys.stdin
+    if not filename:
+        filename = "stdin"
+    click.echo("Importing %s to %s " % (filename, _color("BLUE", env.name),), nl=False)
+    env.import_yaml(env_file, merge=merge)
+    click.echo(_color("GREEN", "OK"))
+
+
+@environment_cli.command("make-default", help="Set environment as 'default'")
+@click.argument("environment", default='default', autocompletion=completion("environment"))
+def make_default(environment):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+    click.echo(env.id + " " + _color("BLUE", env.name) + " ", nl=False)
+    env.set_as_default()
+    click.echo(_color("GREEN", "DEFAULT"))
+
+
+@environment_cli.command("get-keypair", help="Get private key from environment")
+@click.argument("environment", default='default', autocompletion=completion("environment"))
+@click.argument("filename", default=None, required=False)
+def get_keypair(environment, filename):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    env = _get_environment(org, environment)
+
+    if filename:
+        click.echo("Exporting %s to %s " % (_color("BLUE", env.name), filename), nl=False)
+        f = open(filename, "w")
+        f.write(env.get_default_private_key())
+        click.echo(_color("GREEN", "OK"), err=True)
+    else:
+        sys.stdout.write(env.get_default_private_key())
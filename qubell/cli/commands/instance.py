@@ -0,0 +1,526 @@
+import click
+import itertools
+import time
+from qubell.api.globals import QUBELL
+from qubell.api.tools import waitForStatus
+from qubell.cli.common import SEVERITIES, SEVERITY_COLORS, STATUS_COLORS, _color, _color_status, _columns, \
+    _get_application, _get_environment, _get_instance, _get_platform, _map_opt, _remember, fmt_time, request_stats
+from qubell.cli import logtail
+from qubell.cli.nameindex import completion
+from qubell.cli.output import output_option, write_object, writer
+
+
+@click.group()
+def instance_cli():
+    pass
+
+
+@instance_cli.command("list", help="List instances in current organization or application")
+@click.argument("application", default=None, required=False, autocompletion=completion("application"))
+@click.option("--status", default="!DESTROYED",
+              help="Filter by statuses, one of "
+                   "REQUESTED, LAUNCHING, ACTIVE, EXECUTING, FAILED, DESTROYING, DESTROYED."
+                   "Several statuses can be listed using comma. !STATUS_NAME to invert match.")
+@output_option
+def list_instances(application, status, output):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    filters = []
+    for status_filter in status.split(","):
+        if not status_filter:
+            continue
+        if status_filter[0] == "!":
+            filters.append(lambda s: s.upper() != status_filter[1:].upper())
+        else:
+            def match(f):
+                return lambda s: s.upper() == f.upper()
+
+            filters.append(match(status_filter))
+    if application:
+        application = _get_application(org, application)
+
+    # instances are printed page by page, as platform returns them
+    pages = [org.iter_instances_json(application=application)]
+    if any(map(lambda p: p("DESTROYED"), filters)):
+        pages.append(org.iter_instances_json(application=application, show_only_destroyed=True))
+    out = writer(output, ["id", "name", "status"])
+    listed = []
+    for record in itertools.chain(*pages):
+        row = dict(record, id=record.get('id') or record.get('instanceId'))
+        if not row.get('status'):
+            row['status'] = org.get_instance(row['id']).status
+        if row['status'] != 'Destroyed':
+            listed.append(row)
+        if not any(map(lambda p: p(row['status']), filters)):
+            continue
+        if out:
+            out.row(row)
+        else:
+            click.echo(row['id'] + " " + _color("BLUE", row['name']) + " " +
+                       _color(STATUS_COLORS.get(row['status'].upper(), "BLACK"), row['status'].upper()))
+    if out:
+        out.finish()
+    _remember(org, "instance", listed)
+
+
+def _describe_instance_short(inst):
+    click.echo(inst.id + " " +
+               _color("BLUE", inst.name) + " " +
+               _color(STATUS_COLORS.get(inst.status.upper(), "BLACK"), inst.status.upper()))
+
+
+@instance_cli.command("describe", help="Show details about instance")
+@click.argument("instance", autocompletion=completion("instance"))
+@click.option("--json", is_flag=True, default=False, help="Print raw json")
+@click.option("--stats", is_flag=True, default=False, help="Print number and time of platform requests to stderr")
+@output_option
+def describe_instance(instance, json, output, stats, localtime=True):
+    platform = _get_platform()
+    with request_stats(stats):
+        org = platform.get_organization(QUBELL["organization"])
+        with platform.snapshot():
+            inst = _get_instance(org, instance)
+            if json:
+                click.echo(inst._router.get_instance(org_id=inst.organizationId, instance_id=inst.instanceId).text)
+            elif output != "text":
+                write_object(output, inst.json())
+            else:
+                _describe_instance(inst, localtime)
+
+
+def _calc_title(items, template="%s (%s)"):
+    """
+    :return: copies of items with '_title', items may be json shared by response cache and are not changed
+    """
+    titled = []
+    for value in items:
+        if value.get('id') != value.get('name') and value.get('name'):
+            titled.append(dict(value, _title=template % (value['id'], value['name'])))
+        else:
+            titled.append(dict(value, _title=value['id']))
+    return titled
+
+
+def _all_submodules(submodules):
+    for submodule in submodules:
+        yield submodule
+        for child in _all_submodules(submodule.get("submodules", [])):
+            yield child
+
+
+def _load_instance(inst):
+    """
+    Reads instance json once, then application, environment and submodule instances concurrently
+    :return: dict of instance, application, environment json and submodule json by instance id
+    """
+    router = inst._router
+    j = inst.json()
+    org_id = inst.organizationId
+    submodule_ids = [s["instanceId"] for s in _all_submodules(j.get("submodules", [])) if s.get("instanceId")]
+    with router.batch() as batch:
+        app = batch.submit(lambda: router.get_application(org_id=org_id, app_id=inst.applicationId).json())
+        env = batch.submit(lambda: router.get_environment(org_id=org_id, env_id=inst.environmentId).json())
+        submodules = batch.map(lambda i: router.get_instance(org_id=org_id, instance_id=i).json(), submodule_ids)
+    return {
+        "instance": j,
+        "application": app.result(),
+        "environment": env.result(),
+        # submodule, that is gone already, is shown without status
+        "submodules": dict((i, call.result()) for i, call in zip(submodule_ids, submodules) if not call.exception()),
+    }
+
+
+def _describe_instance(inst, localtime=None):
+    with inst._router.snapshot():
+        loaded = _load_instance(inst)
+        return_values = inst.return_values
+    j = loaded["instance"]
+    click.echo("Instance    %s  %s  %s" % (inst.id, _color("BLUE", j["name"]), _color_status(j["status"])))
+    app = loaded["application"]
+    click.echo("Application %s  %s" % (inst.applicationId, _color("BLUE", app["name"])))
+    env = loaded["environment"]
+    click.echo("Environment " + inst.environmentId + "  " + _color("BLUE", env["name"]))
+    time_f = localtime and time.localtime or time.gmtime
+    click.echo("Launched    " + fmt_time(time_f(j["createdAt"] / 1000)))
+    if j.get("destroyAt"):
+        click.echo("Destroy     " + fmt_time(time_f(j["destroyAt"] / 1000)))
+    else:
+        click.echo("Destroy     " + "not scheduled")
+    pad = "    "
+    if j.get("config"):
+        click.echo("Config: ")
+        config = _calc_title(j["config"])
+        _columns(config, lambda o: pad + str(o['_title']), lambda o: pad + str(o['value']))
+    if return_values:
+        click.echo("Return values: ")
+        endpoints = _calc_title([{'id': k, 'value': v} for k, v in return_values.iteritems()])
+        _columns(endpoints, lambda o: pad + str(o['_title']), lambda o: str(o['value']))
+    workflows = j.get("workflowsInfo", {}).get('availableWorkflows', [])
+    if workflows:
+        click.echo("Workflows: ")
+        for workflow in workflows:
+            if workflow['parameters']:
+                args = "(" + ", ".join(map(lambda param: "%(type)s %(id)s" % param, workflow['parameters'])) + ")"
+            else:
+                args = ""
+            click.echo(pad + "%s%s" % (workflow['name'], args))
+    if j.get("serviceIn"):
+        click.echo("Service in:")
+        _columns(j["serviceIn"], lambda o: pad + o['id'], lambda o: _color("BLUE", o['name']))
+    if j.get("submodules", []):
+        click.echo("Structure:")
+        _describe_submodules("", j.get("submodules", []), level=1, loaded=loaded["submodules"])
+
+
+_MODULE_TYPES = {
+    "submodule": "Module"
+}
+
+
+def _describe_submodules(path, submodules, level, loaded=None):
+    for submodule in submodules:
+        if path:
+            module_path = path + "." + submodule['componentId']
+        else:
+            module_path = submodule['componentId']
+        name = submodule.get("name", "")
+        instanceId = submodule.get("instanceId", "")
+        moduleType = _MODULE_TYPES.get(submodule.get("moduleType"), submodule.get("moduleType").capitalize())
+        status = instanceId in (loaded or {}) and " " + _color_status(loaded[instanceId]["status"]) or ""
+        click.echo("    " * level + "%s: %s %s %s%s" % (moduleType, module_path, _color("BLUE", name), instanceId,
+                                                     status))
+        _describe_submodules(module_path, submodule.get("submodules", []), level + 1, loaded)
+
+
+@instance_cli.command("launch", help="Launch instance in application")
+@click.option("--revision", default=None, help="Revision to launch")
+@click.option("--environment", default=None, help="Environment used to launch instance")
+@click.option("--destroy", default=60 * 60, help="Schedule destroy (seconds)")
+@click.option("--parameter", default=False, type=(unicode, unicode), multiple=True, help="Parameter value")
+@click.argument("application", autocompletion=completion("application"))
+@click.argument("name", default=None, required=False)
+def launch_instance(revision, environment, destroy, application, name, parameter):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    app = _get_application(org, application)
+    env = _map_opt(environment, lambda e: _get_environment(org, e))
+    parameters = dict()
+    submodules = dict()
+
+    def _get_module(modules, name):
+        path = name.split(".", 1)
+        module = modules['submodules'].get(path[0], {"submodules": {}, "parameters": {}})
+        modules['submodules'][path[0]] = module
+        if len(path) == 2:
+            return _get_module(module, path[1])
+        else:
+            return module
+
+    for (param_name, param_value) in parameter:
+        if ":" in param_name:
+            (module_name, module_param_name) = param_name.split(":", 1)
+            module = _get_module({'submodules': submodules}, module_name)
+            module['parameters'][module_param_name] = param_value
+        else:
+            parameters[param_name] = param_value
+
+    inst = org.create_instance(application=app, revision=revision, environment=env,
+                               name=name, parameters=parameters, destroyInterval=destroy * 1000,
+                               submodules=submodules)
+    _describe_instance(inst, True)
+
+
+@instance_cli.command("reconfigure", help="Reconfigure running instance")
+@click.option("--version", default=None, help="Target manifest version")
+@click.option("--revision", default=None, help="Target revision")
+@click.option("--parameter", default=False, type=(unicode, unicode), multiple=True, help="Parameter value")
+@click.argument("instance", autocompletion=completion("instance"))
+def reconfigure_instance(version, revision, instance, parameter):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    inst = _get_instance(org, instance)
+    parameters = dict()
+    submodules = dict()
+
+    def _get_module(modules, name):
+        path = name.split(".", 1)
+        module = modules['submodules'].get(path[0], {"submodules": {}, "parameters": {}})
+        modules['submodules'][path[0]] = module
+        if len(path) == 2:
+            return _get_module(module, path[1])
+        else:
+            return module
+
+    for (param_name, param_value) in parameter:
+        if ":" in param_name:
+            (module_name, module_param_name) = param_name.split(":", 1)
+            module = _get_module({'submodules': submodules}, module_name)
+            module['parameters'][module_param_name] = param_value
+        else:
+            parameters[param_name] = param_value
+
+    inst.reconfigure(parameters=parameters, submodules=submodules, revision=revision, manifestVersion=version)
+    _describe_instance(inst, True)
+
+
+@instance_cli.command("reschedule", help="Reschedule workflow for instance")
+@click.option("--workflow", default="destroy", help="Workflow to reschedule.")
+@click.option("--schedule", default=60 * 60, help="Schedule workflow run (seconds) [-1 to disable]")
+@click.argument("instance", autocompletion=completion("instance"))
+def reschedule_instance(workflow, schedule, instance):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    inst = _get_instance(org, instance)
+    timestamp = (schedule * 1000) if (schedule != -1) else -1
+    inst.reschedule_workflow(workflow_name=workflow, timestamp=timestamp)
+        
+
+@instance_cli.command("parameters", help="Get default launch parameters for application")
+@click.argument("application", autocompletion=completion("application"))
+def show_instance_parameters(application):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    app = _get_application(org, application)
+    params = platform._router.post_organization_launch_parameters(org_id=org.id, app_id=app.id).json()
+
+    def _render_parameters(path, module):
+        parameters = module.get("parameters", [])
+        submodules = module.get("submodules", [])
+        child_instances = filter(lambda m: m["componentType"] == "Instance", submodules)
+        if not parameters and not submodules:
+            return
+        if path:
+            click.echo("Module: " + path)
+        else:
+            click.echo("Parameters:")
+        if parameters:
+            _columns(parameters,
+                     lambda p: "  %(valueType)10s %(id)s" % p,
+                     lambda p: p["value"])
+        else:
+            click.echo("    <no parameters>")
+        click.echo()
+        if path:
+            path += "."
+        for submodule in child_instances:
+            _render_parameters(path + submodule["name"], submodule)
+
+    _render_parameters("", params.get("componentTree", {}))
+
+
+@instance_cli.command("destroy", help="Destroy instance")
+@click.option("--wait/--no-wait", default=False, help="Wait for DESTROYED status")
+@click.option("--timeout", default=3, type=int, help="Timeout in minutes")
+@click.argument("instance", autocompletion=completion("instance"))
+def destroy_instance(instance, timeout, wait):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    inst = _get_instance(org, instance)
+    inst.destroy()
+    _describe_instance_short(inst)
+    if wait:
+        inst.destroyed(timeout)
+        _describe_instance_short(inst)
+
+
+@instance_cli.command("wait-status", help="Wait until instance status becomes 'Status' or timeout reached")
+@click.option("--timeout", default=3, type=int, help="Timeout in minutes")
+@click.option("--status", "-s", default="Active",
+              help="Status to wait (Requested, Launching, Active, Executing, Destroying, Destroyed, Unknown)")
+@click.argument("instance", autocompletion=completion("instance"))
+def wait_status(instance, status, timeout):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    inst = _get_instance(org, instance)
+    timeout = int(timeout)
+    # TODO case-insensitive
+    accepted_states = ['Launching', 'Destroying', 'Active', 'Running', 'Executing', 'Unknown', 'Requested']
+    res = False
+    try:
+        res = waitForStatus(instance=inst, final=status, accepted=accepted_states, timeout=[timeout * 20, 3, 1])
+    finally:
+        _describe_instance_short(inst)
+    if not res:  # Exit non-zero if status not reached
+        exit(1)
+
+
+@instance_cli.command("remove", help="Force remove instance")
+@click.option("--force", is_flag=True, default=False, help="Wait for DESTROYED status")
+@click.argument("instance", autocompletion=completion("instance"))
+def destroy_instance(instance, force):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    inst = _get_instance(org, instance)
+    if not force:
+        # TODO
+        raise NotImplementedError("non-force removal is not supported yet")
+    else:
+        inst.force_remove()
+
+
+def _pad(string, length):
+    return ("%-" + str(length) + "s") % string
+
+
+def _parse_timestamp(datetime, localtime=False):
+    time_t = datetime
+    try:
+        time_t = int(datetime)
+    except Exception:
+        pass
+    try:
+        time_t = time.strptime(datetime, "%Y-%m-%d %H:%M:%S")
+    except Exception:
+        pass
+    if not time_t:
+        raise ValueError("unknown timestamp format: " + str(datetime))
+    if not localtime:
+        time_shift = time.mktime(time.localtime()) - time.mktime(time.gmtime())
+    else:
+        time_shift = 0
+    return time.mktime(time_t) + time_shift
+
+
+class _LogPrinter(object):
+    """
+    Prints log items in columns. Columns only widen, so followed log stays aligned without re-reading it.
+    """
+
+    def __init__(self, localtime, hide_multiline, labels):
+        self.time_f = localtime and time.localtime or time.gmtime
+        self.hide_multiline = hide_multiline
+        self.labels = labels
+        self.widths = {}
+        self.vertical_padding_before = False
+
+    def _columns(self, item):
+        columns = [("severity", item['severity']),
+                   ("source", item.get('source', "") or (item.get("self") and "self") or " "),
+                   ("eventTypeText", item['eventTypeText'])]
+        if self.labels:
+            columns.insert(0, ("instance", item.get("instance", "")))
+        return columns
+
+    def echo(self, items):
+        rows = [(item, self._columns(item)) for item in items]
+        for _, columns in rows:
+            for name, value in columns:
+                self.widths[name] = max(self.widths.get(name, 0), len(value))
+        for item, columns in rows:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", self.time_f(item['time'] / 1000))
+            cells = [_pad(value, self.widths[name]) for name, value in columns]
+            cells = [_color(SEVERITY_COLORS.get(item['severity'], "BLACK"), cell) if name == "severity" else cell
+                     for (name, _), cell in zip(columns, cells)]
+            padding = len(timestamp) + sum(self.widths[name] for name, _ in columns) + 2 * (len(columns) + 1)
+            multiline = "\n" in item['description']
+            if multiline and not self.vertical_padding_before and not self.hide_multiline:
+                click.echo()
+            click.echo("  ".join([timestamp] + cells) + "  ", nl=False)
+            if not multiline:
+                click.echo(item['description'])
+                self.vertical_padding_before = False
+            else:
+                lines = item['description'].split("\n")
+                click.echo(lines[0])
+                if not self.hide_multiline:
+                    for line in lines[1:]:
+                        click.echo(padding * " " + line)
+                    click.echo()
+                    self.vertical_padding_before = True
+
+
+@instance_cli.command("logs", help="Show activity log of instances, logs of several instances are merged by time")
+@click.option("--severity", default="INFO", help="Logs severity.")
+@click.option("--localtime/--utctime", default=True, help="Use local or UTC time.")
+@click.option("--sort-by", default="time",
+              help="Sort by time/severity/source/eventTypeText/description. Prefix with minus for inverted order. "
+                   "Followed messages are always shown in order of time.")
+@click.option("--hide-multiline", is_flag=True, default=True, help="Show only first line of multi-line message")
+@click.option("--filter-text", default=None, help="Filter by full text, including source and event name")
+@click.option("--filter-regex", default=None, help="Filter by regular expression, searched in the same text")
+@click.option("--max-items", default=30,
+              help="Limit number of items to show. Positive integer for tail, negative integer for head.")
+@click.option("--follow", is_flag=True, default=False, help="Wait for new messages to appear.")
+@click.option("--interval", default=2, help="Seconds between polls while workflows run, when following.")
+@click.option("--max-interval", default=30, help="Seconds between polls of idle instances, when following.")
+@click.option("--submodules", is_flag=True, default=False, help="Also show logs of submodule instances.")
+@click.option("--show-all", is_flag=True, default=False, help="Show all messages, overrides --max-items.")
+@click.option("--before", default=None, help="Show messages before TIMESTAMP")
+@click.option("--after", default=None, help="Show messages after TIMESTAMP")
+@output_option
+@click.argument("instances", nargs=-1, required=True, autocompletion=completion("instance"))
+def show_logs(instances, localtime, severity, sort_by, hide_multiline, filter_text, filter_regex, max_items, show_all,
+              follow, interval, max_interval, submodules, before, after, output):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    accepted_severities = list(itertools.takewhile(lambda x: x != severity, SEVERITIES)) + [severity]
+
+    if after:
+        after = int(_parse_timestamp(after, localtime)) * 1000
+    if before:
+        before = int(_parse_timestamp(before, localtime)) * 1000
+
+    with platform.snapshot():
+        targets = [(_get_instance(org, instance), None) for instance in instances]
+        if submodules:
+            for inst, _ in list(targets):
+                for submodule in _all_submodules(inst.json().get("submodules", [])):
+                    if submodule.get("instanceId"):
+                        targets.append((org.get_instance(submodule["instanceId"]),
+                                        submodule.get("name") or submodule["componentId"]))
+        merged = len(targets) > 1
+        cursors = [logtail.LogCursor(inst, accepted_severities, after=after, before=before,
+                                     label=merged and (label or inst.name) or None)
+                   for inst, label in targets]
+
+    matches = logtail.compile_filter(filter_text, filter_regex)
+    out = writer(output, (merged and ["instance"] or []) + ["time", "severity", "source", "eventTypeText",
+                                                            "description"])
+    printer = _LogPrinter(localtime, hide_multiline, merged)
+
+    def show(items):
+        if out:
+            for item in items:
+                out.row(item)
+        else:
+            printer.echo(items)
+
+    try:
+        items = [item for item in logtail.poll_all(platform, cursors) if matches(item)]
+        reverse = sort_by[0] == "-"
+        sort_by_key = sort_by.lstrip("-")
+        items.sort(key=lambda i: i.get(sort_by_key), reverse=reverse)
+        if not show_all and max_items:
+            if max_items > 0:
+                items = items[-max_items:]
+            else:
+                items = items[:-max_items]
+        show(items)
+        if follow:
+            logtail.follow(platform, cursors, lambda new_items: show([item for item in new_items if matches(item)]),
+                           logtail.PollInterval(interval, max_interval))
+    finally:
+        if out:
+            out.finish()
+
+@instance_cli.command("runworkflow", help="Run workflow on instance")
+@click.option("--parameter", default=False, type=(unicode, unicode), multiple=True, help="Parameter for workflow run")
+@click.option("--status", is_flag=True, default=False, help="Display instance status after workflow run")
+@click.option("--schedule", default=None, help="Schedule workflow run (seconds)")
+@click.argument("instance", autocompletion=completion("instance"))
+@click.argument("workflow")
+def run_workflow(instance, workflow, parameter, status, schedule):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    ins = _get_instance(org, instance)
+    parameters = dict()
+
+    for (param_name, param_value) in parameter:
+            parameters[param_name] = param_value
+
+    if schedule:
+        ins.schedule_workflow(name=workflow, timestamp=schedule*1000, parameters=parameters)
+    else:
+        ins.run_workflow(name=workflow, parameters=parameters)
+    if status:
+        _describe_instance(ins, True)
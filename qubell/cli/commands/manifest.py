@@ -0,0 +1,29 @@
+import click
+import sys
+from qubell.api.private.manifest import Manifest
+from qubell.cli.common import _color, _get_platform, _print_message
+
+
+@click.group()
+def manifest_cli():
+    pass
+
+
+@manifest_cli.command("validate", help="Perform manifest validation")
+@click.argument("filename", required=False, default=None)
+def validate_manifest(filename):
+    platform = _get_platform()
+    if filename:
+        manifest = Manifest(file=filename)
+    else:
+        manifest = Manifest(content=sys.stdin.read())
+    result = platform.validate(manifest)
+    errors = result.get("errors", [])
+    warnings = result.get("warnings", [])
+    for error in errors:
+        _print_message(error, "RED")
+    for warning in result.get("warnings", []):
+        _print_message(warning, "YELLOW")
+    if not errors and not warnings:
+        click.echo(_color("GREEN", "NO WARNINGS"))
+    exit(errors and 1 or 0)
@@ -0,0 +1,113 @@
+import click
+import logging as log
+from qubell.api.globals import PROVIDER, QUBELL
+from qubell.api.private.exceptions import NotFoundError
+from qubell.api.private.service import CLOUD_ACCOUNT_TYPE, system_application_types
+from qubell.api.tools import load_env
+from qubell.cli.common import _color, _get_environment, _get_platform, provider_config
+from qubell.cli.nameindex import completion
+from qubell.cli.output import output_option, writer
+
+
+@click.group()
+def organization_cli():
+    pass
+
+
+@organization_cli.command(name="create", help="Create organization")
+@click.argument("organization")
+def create_org(organization):
+    platform = _get_platform()
+
+    click.echo(organization + " ", nl=False)
+    try:
+        org = platform.get_organization(organization)
+        click.echo(_color("YELLOW", org.id) + " already exists")
+        return 1
+    except NotFoundError:
+        try:
+            org = platform.create_organization(organization)
+            click.echo(_color("GREEN", org.id))
+        except AssertionError:
+            org = platform.get_organization(organization)
+            click.echo(_color("YELLOW", org.id) + " still initializing")
+
+
+# TODO: Dup of env.init ??
+@organization_cli.command(name="init", help="Initialize cloud account service")
+@click.option("--type", default="", help="Provider name (for example, aws-ec2, openstack, etc)")
+@click.option("--identity", default="", help="Provider identity or login, PROVIDER_IDENTITY by default")
+@click.option("--credential", default="",
+              help="Provider credential or secrete key or password, PROVIDER_CREDENTIAL by default")
+@click.option("--region", default="", help="Provider region (for example, us-east-1), PROVIDER_REGION by default")
+@click.option("--security-group", default="default", help="Default security group, \"default\" if not set")
+@click.option("--environment", default="default", help="Account environment")
+@click.argument("account_name")
+def init_ca(account_name, environment, **kwargs):
+    platform = _get_platform()
+    for (k, v) in kwargs.iteritems():
+        if v:
+            PROVIDER["provider_" + k] = v
+    click.echo(account_name + " ", nl=False)
+    org = platform.get_organization(QUBELL["organization"])
+
+    def type_to_app(t):
+        return org.applications[system_application_types.get(t, t)]
+
+    env = _get_environment(org, environment)
+    try:
+        cloud_account_service = org.service(
+            name=account_name,
+            application=type_to_app(CLOUD_ACCOUNT_TYPE),
+            environment=env,
+            parameters=provider_config())
+        click.echo(_color("GREEN", cloud_account_service.id))
+    except IOError:
+        click.echo(_color("RED", "FAILED"))
+
+
+@organization_cli.command("list", help="List organizations")
+@output_option
+def list_orgs(output):
+    platform = _get_platform()
+    out = writer(output, ["id", "name"])
+    for org in platform.list_organizations_json():
+        if out:
+            out.row(org)
+        else:
+            click.echo(org['id'] + " " + _color("BLUE", org['name']))
+    if out:
+        out.finish()
+
+
+@organization_cli.command(name="restore", help="Restore configuration from ENV file")
+@click.argument("environment", autocompletion=completion("environment"))
+def restore_env(environment):
+    platform = _get_platform()
+    cfg = load_env(environment)
+    # Patch configuration to include provider and org info
+    cfg['organizations'][0].update({'providers': [provider_config()]})
+    if QUBELL['organization']:
+        cfg['organizations'][0].update({'name': QUBELL['organization']})
+
+    click.echo("Restoring env: " + _color("BLUE", environment) + " ", nl=False)
+    try:
+        platform.restore(cfg)
+        click.echo(_color("GREEN", "OK"))
+    except Exception as e:
+        click.echo(_color("RED", "FAIL"))
+        log.error("Failed to restore env", exc_info=e)
+
+
+
+@organization_cli.command("import-kit", help="Import starter kit from ULR")
+@click.option("--category", default=None, help="Category of uploaded applications")
+@click.argument("metadata_url")
+def import_kit(metadata_url, category):
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    if category:
+        category = org.categories[category]
+    click.echo("Importing from %s " % (_color("BLUE", metadata_url)), nl=False)
+    org.upload_applications(metadata_url, category)
+    click.echo(_color("GREEN", "OK"))
@@ -0,0 +1,46 @@
+import click
+from qubell.api.globals import PROVIDER, QUBELL
+
+
+@click.group()
+def platform_cli():
+    pass
+
+
+REVERSE_MAPPING = {
+    'tenant': 'QUBELL_TENANT',
+    'user': 'QUBELL_USER',
+    'password': 'QUBELL_PASSWORD',
+    'organization': 'QUBELL_ORGANIZATION'
+}
+
+
+REVERSE_PROVIDER_MAPPING = {
+    'provider_name': 'PROVIDER_NAME',
+    'provider_type': 'PROVIDER_TYPE',
+    'provider_identity': 'PROVIDER_IDENTITY',
+    'provider_credential': 'PROVIDER_CREDENTIAL',
+    'provider_region': 'PROVIDER_REGION',
+    'provider_security_group': 'PROVIDER_SECURITY_GROUP'
+}
+
+
+
+@platform_cli.command("show-account", help="Show credentials")
+def show_account():
+    """
+    Exports current account configuration in
+    shell-friendly form. Takes into account
+    explicit top-level flags like --organization.
+    """
+    click.echo("# tonomi api")
+    for (key, env) in REVERSE_MAPPING.items():
+        value = QUBELL.get(key, None)
+        if value:
+            click.echo("export %s='%s'" % (env, value))
+    if any(map(lambda x: PROVIDER.get(x), REVERSE_PROVIDER_MAPPING.keys())):
+        click.echo("# cloud account")
+        for (key, env) in REVERSE_PROVIDER_MAPPING.items():
+            value = PROVIDER.get(key, None)
+            if value:
+                click.echo("export %s='%s'" % (env, value))
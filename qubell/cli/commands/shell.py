@@ -0,0 +1,32 @@
+import click
+import shlex
+from qubell.cli import runner
+from qubell.cli.common import keep_platforms_warm
+
+
+@click.command(help="Interactive shell, platform connection and caches are kept between commands")
+def shell_cli():
+    try:
+        import readline  # noqa, enables line editing and history
+    except ImportError:
+        pass
+    keep_platforms_warm()
+    click.echo("Type nomi commands without 'nomi', 'exit' to quit")
+    while True:
+        try:
+            line = raw_input("nomi> ").strip()
+        except EOFError:
+            click.echo()
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+        if line in ("exit", "quit"):
+            break
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            click.echo("Error: %s" % e, err=True)
+            continue
+        if args:
+            runner.run(args)
@@ -0,0 +1,17 @@
+import click
+from qubell.api.globals import QUBELL
+from qubell.cli.common import _color, _columns, _get_platform
+
+
+@click.group()
+def zone_cli():
+    pass
+
+
+@zone_cli.command("list", help="List available zones")
+def list_zones():
+    platform = _get_platform()
+    org = platform.get_organization(QUBELL["organization"])
+    _columns(org.list_zones_json(),
+             lambda o: o['id'],
+             lambda o: _color("BLUE", o['name']) + (o['isDefault'] and " DEFAULT" or ""))
@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+from colorama import Fore, Style
+
+from qubell.api.globals import QUBELL, PROVIDER
+
+STATUS_COLORS = {
+    "ACTIVE": "GREEN",
+    "RUNNING": "GREEN",
+    "LAUNCHING": "CYAN",
+    "DESTROYING": "CYAN",
+    "EXECUTING": "CYAN",
+    "FAILED": "RED",
+    "ERROR": "RED",
+    "DESTROYED": "LIGHTBLACK_EX",
+}
+
+SEVERITIES = ['ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE']
+
+SEVERITY_COLORS = {
+    "ERROR": "RED",
+    "WARNING": "YELLOW",
+    "INFO": "BLACK",
+    "DEBUG": "LIGHTBLACK_EX",
+    "TRACE": "LIGHTBLACK_EX"
+}
+
+
+def provider_config():
+    return {
+        'configuration.provider': PROVIDER['provider_type'],
+        'configuration.legacy-regions': PROVIDER['provider_region'],
+        'configuration.endpoint-url': '',
+        'configuration.legacy-security-group': '',
+        'configuration.identity': PROVIDER['provider_identity'],
+        'configuration.credential': PROVIDER['provider_credential']
+    }
+
+
+# platforms kept between commands run in one process by nomi shell, daemon and batch, by credentials
+_warm_platforms = None
+_warm_pool_size = 0
+_warm_lock = threading.Lock()
+
+
+def keep_platforms_warm(pool_size=0):
+    """
+    Makes commands run in this process reuse authenticated platforms, their connection pools and response caches
+    :param int pool_size: connections to keep, when commands run concurrently
+    """
+    global _warm_platforms, _warm_pool_size
+    with _warm_lock:
+        if _warm_platforms is None:
+            _warm_platforms = {}
+        _warm_pool_size = max(_warm_pool_size, pool_size)
+
+
+def release_platforms():
+    """
+    Closes platforms kept warm, stopping their background token refresh
+    """
+    global _warm_platforms
+    with _warm_lock:
+        platforms, _warm_platforms = _warm_platforms or {}, None
+    for platform in platforms.values():
+        platform._router.close()
+
+
+def _credentials():
+    return tuple(QUBELL[k] for k in ["tenant", "user", "password", "token", "refresh_token"])
+
+
+class UserContext(object):
+    """
+    Platform connection of current nomi call.
+    Api is imported on first use, so commands not working with platform start fast.
+    """
+
+    def __init__(self, colorize=True):
+        self.platform = None
+        self.unauthenticated_platform = None
+        self.colorize = colorize
+
+    def get_platform(self):
+        if not self.platform and _warm_platforms is not None:
+            # concurrent commands wait for one sign in
+            with _warm_lock:
+                self.platform = _warm_platforms.get(_credentials()) or self._connect()
+        if not self.platform:
+            self.platform = self._connect()
+        return self.platform
+
+    def _connect(self):
+        assert QUBELL["tenant"], "No platform URL provided. Set QUBELL_TENANT or use --tenant option."
+        if not (QUBELL["token"] or QUBELL["refresh_token"]):
+            assert QUBELL["user"], "No username. Set QUBELL_USER or use --user option."
+            assert QUBELL["password"], "No password provided. Set QUBELL_PASSWORD or use --password option."
+
+        if QUBELL["token"] or os.getenv("QUBELL_SESSION_CACHE") == "off":
+            from qubell.api.private.platform import QubellPlatform
+            platform = QubellPlatform.connect(
+                tenant=QUBELL["tenant"],
+                user=QUBELL["user"],
+                password=QUBELL["password"],
+                token=QUBELL["token"],
+                refresh_token=QUBELL["refresh_token"])
+        else:
+            platform = self._get_cached_platform()
+        if _warm_platforms is not None:
+            platform._router.enable_cache()
+            platform._router._ensure_pool_size(_warm_pool_size)
+            previous = _warm_platforms.get(_credentials())
+            if previous and previous is not platform:
+                previous._router.close()
+            _warm_platforms[_credentials()] = platform
+        return platform
+
+    def _get_cached_platform(self):
+        from qubell.api.private.platform import QubellPlatform
+        from qubell.api.provider.router import PrivatePath
+        from qubell.cli.session import SessionCache, session_user
+
+        # session is reused between nomi calls, it is saved again if renewed or created
+        tenant = QUBELL["tenant"]
+        user = session_user(QUBELL["user"], QUBELL["refresh_token"])
+        cache = SessionCache(os.getenv("QUBELL_SESSION_CACHE"))
+        router = PrivatePath(tenant)
+        state = cache.load(tenant, user)
+        if state:
+            router.restore_session(state, QUBELL["user"], QUBELL["password"], QUBELL["refresh_token"])
+        else:
+            router.connect(QUBELL["user"], QUBELL["password"], refresh_token=QUBELL["refresh_token"])
+            cache.save(tenant, user, router.session_state())
+        generation = router.auth_generation
+
+        def save_renewed():
+            if router.auth_generation != generation:
+                cache.save(tenant, user, router.session_state())
+
+        click.get_current_context().call_on_close(save_renewed)
+        return QubellPlatform().init_router(router)
+
+    def get_unauthenticated_platform(self):
+        if not self.unauthenticated_platform:
+            assert QUBELL["tenant"], "No platform URL provided. Set QUBELL_TENANT or use --tenant option."
+            from qubell.api.private.platform import QubellPlatform
+
+            self.unauthenticated_platform = QubellPlatform.connect(tenant=QUBELL["tenant"])
+
+        return self.unauthenticated_platform
+
+
+def _get_platform(authenticated=True):
+    context_obj = click.get_current_context().obj
+    return context_obj.get_platform() if authenticated else context_obj.get_unauthenticated_platform()
+
+
+def _color(color, text):
+    colorize = click.get_current_context().obj.colorize
+    if colorize:
+        if not isinstance(text, basestring):
+            text = str(text)
+        return getattr(Fore, color) + text + Style.RESET_ALL
+    else:
+        return text
+
+
+def _color_status(status):
+    return _color(STATUS_COLORS.get(status.upper(), "BLACK"), status)
+
+
+def _print_message(message, color="BLACK"):
+    if "message" in message:
+        click.echo(_color(color, message["message"]))
+    elif isinstance(message, basestring):
+        click.echo(_color(color, message))
+    else:
+        click.echo(_color(color, "<error format not supported by this version of cli>"))
+
+
+def fmt_time(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", t)
+
+
+def _columns(iterable, key, value):
+    key_length = max(map(lambda o: len(str(key(o))), iterable) + [0])
+    for item in iterable:
+        key_string = str(key(item))
+        value_string = str(value(item))
+        click.echo(key_string + (key_length - len(key_string)) * " " + "  " + value_string)
+
+
+def _map_opt(value_or_none, function):
+    if value_or_none is None:
+        return None
+    else:
+        return function(value_or_none)
+
+
+@contextmanager
+def request_stats(enabled=True):
+    """
+    Prints to stderr number and time of platform requests made inside the block, by route.
+    Statistics are process wide, so concurrent commands of nomi daemon or batch are counted too.
+    """
+    if not enabled:
+        yield
+        return
+    from qubell.api.provider import routes_stat
+
+    before = routes_stat()
+    started = time.time()
+    yield
+    wall = time.time() - started
+    rows = []
+    for route_str, stat in routes_stat().items():
+        last = before.get(route_str, {})
+        count = stat["count"] - last.get("count", 0)
+        if count:
+            rows.append((route_str, count, stat["total"] - last.get("total", 0)))
+    click.echo("Requests: %s, %.0f ms in requests, %.0f ms total" % (
+        sum(r[1] for r in rows), sum(r[2] for r in rows), wall * 1000), err=True)
+    for route_str, count, total in sorted(rows, key=lambda r: -r[2]):
+        click.echo("  %4s  %6s ms  %s" % (count, total, route_str), err=True)
+
+
+def _resolver(org):
+    """
+    :return: nameindex.Resolver of organization, or None if NOMI_NAME_INDEX=off
+    """
+    from qubell.cli.nameindex import NameIndex, Resolver, is_enabled, is_id
+
+    if not is_enabled():
+        return None
+    index = NameIndex(QUBELL["tenant"])
+    org_name = QUBELL["organization"]
+    # organization name is kept for completion, which runs without platform
+    if org_name and not is_id(org_name) and index.name("", "organization", org.organizationId) != org_name:
+        index.add("", "organization", [(org.organizationId, org_name)])
+    return Resolver(org, index)
+
+
+def _get_entity(org, kind, value):
+    """
+    Instance, application or environment of organization by id or name
+    """
+    from qubell.cli.nameindex import is_id
+
+    resolver = _resolver(org)
+    if resolver:
+        return resolver.get(kind, value)
+    if kind == "instance":
+        return is_id(value) and org.get_instance(id=value) or org.get_instance(name=value)
+    return {"application": org.get_application,
+            "environment": org.get_environment}[kind](value)
+
+
+def _get_instance(org, value):
+    return _get_entity(org, "instance", value)
+
+
+def _get_application(org, value):
+    return _get_entity(org, "application", value)
+
+
+def _get_environment(org, value):
+    return _get_entity(org, "environment", value)
+
+
+def _remember(org, kind, entries):
+    """
+    Adds entities listed by command to name index
+    """
+    resolver = _resolver(org)
+    if resolver:
+        resolver.remember(kind, entries)
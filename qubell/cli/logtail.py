@@ -0,0 +1,133 @@
+"""
+Incremental reading of instance activity logs for `nomi instance logs --follow`.
+Every poll returns only items not seen yet, logs of several instances are merged by time.
+"""
+import itertools
+import re
+import time
+
+# new items are expected while some workflow runs, polls are frequent then
+_WORKFLOW_STARTED = "workflow started"
+_WORKFLOW_FINISHED = "workflow finished"
+
+
+def _searchable(item):
+    return u"\t".join([item.get("severity") or "", item.get("source") or "", item.get("eventTypeText") or "",
+                       item.get("description") or ""])
+
+
+def compile_filter(text=None, regex=None):
+    """
+    Builds predicate for log items, text and regex are searched in severity, source, event type and description
+    :param str text: substring to find
+    :param str regex: regular expression to search, compiled once
+    """
+    checks = []
+    if text:
+        checks.append(lambda line: text in line)
+    if regex:
+        checks.append(re.compile(regex).search)
+    if not checks:
+        return lambda item: True
+    return lambda item: all(check(_searchable(item)) for check in checks)
+
+
+def _key(item):
+    return item["time"], item.get("source"), item.get("eventTypeText"), item.get("description")
+
+
+class LogCursor(object):
+    """
+    Position in activity log of one instance.
+    Items with the time of the last seen one are remembered, so they are neither lost nor shown twice.
+    """
+
+    def __init__(self, instance, severity=None, after=None, before=None, label=None):
+        """
+        :param qubell.api.private.instance.Instance instance:
+        :param list severity: severities to return
+        :param int after: ms, skip older items
+        :param int before: ms, skip newer items
+        :param str label: added to items as "instance", when logs of several instances are merged
+        """
+        self.instance = instance
+        self.severity = severity
+        self.after = after
+        self.before = before
+        self.label = label
+        self.running = 0  # workflows started and not finished yet
+        self._edge = set()
+
+    def poll(self):
+        """
+        :return: new items sorted by time
+        """
+        # severity is not passed to platform, workflow events are tracked on every level
+        items = self.instance.get_activitylog(after=self.after, end=self.before).log
+        fresh = [item for item in items
+                 if (self.after is None or item["time"] >= self.after) and _key(item) not in self._edge]
+        if not fresh:
+            return []
+        last = fresh[-1]["time"]
+        if last != self.after:
+            self._edge = set()
+            self.after = last
+        self._edge.update(_key(item) for item in fresh if item["time"] == last)
+        for item in fresh:
+            event = item.get("eventTypeText")
+            if event == _WORKFLOW_STARTED:
+                self.running += 1
+            elif event == _WORKFLOW_FINISHED:
+                self.running = max(0, self.running - 1)
+        if self.severity:
+            fresh = [item for item in fresh if item["severity"] in self.severity]
+        if self.label:  # decoded json may be shared by response cache, it is not modified
+            fresh = [dict(item, instance=self.label) for item in fresh]
+        return fresh
+
+
+class PollInterval(object):
+    """
+    Delay before next poll: minimal while instances are busy, doubled up to maximal while they are idle
+    """
+
+    def __init__(self, minimum=2, maximum=30):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.current = minimum
+
+    def next(self, busy):
+        self.current = self.minimum if busy else min(self.current * 2, self.maximum)
+        return self.current
+
+
+def poll_all(platform, cursors):
+    """
+    Polls cursors concurrently
+    :param platform: QubellPlatform or Router, whose batch runs polls
+    :return: new items of all cursors merged by time
+    """
+    if len(cursors) == 1:
+        return cursors[0].poll()
+    with platform.batch(len(cursors)) as batch:
+        calls = batch.map(lambda cursor: cursor.poll(), cursors)
+    polled = [call.result() for call in calls]
+    # concatenation of sorted runs is merged by timsort in linear time
+    return sorted(itertools.chain(*polled), key=lambda item: item["time"])
+
+
+def follow(platform, cursors, emit, interval=None, sleep=time.sleep, rounds=None):
+    """
+    Polls cursors until interrupted, passing new items to emit in order of time.
+    First poll is delayed, items already in logs are expected to be shown by caller.
+    :param callable emit: called with list of new items after every poll, possibly empty
+    :param PollInterval interval: delays between polls
+    :param int rounds: stop after that many polls, endless by default
+    """
+    interval = interval or PollInterval()
+    busy = any(cursor.running for cursor in cursors)
+    for _ in itertools.count() if rounds is None else range(rounds):
+        sleep(interval.next(busy))
+        items = poll_all(platform, cursors)
+        emit(items)
+        busy = bool(items) or any(cursor.running for cursor in cursors)
@@ -0,0 +1,259 @@
+"""
+Local index of names and ids of instances, applications and environments.
+nomi resolves names and completes arguments from it, without listing entities on platform.
+Index is a SQLite database under user cache dir, entries are kept per tenant and organization.
+Names missing in index are refreshed from platform, names found there are validated on use.
+"""
+import logging as log
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+
+from qubell.api.globals import QUBELL
+
+KINDS = ["organization", "instance", "application", "environment"]
+FULL_REFRESH_AGE = 24 * 60 * 60  # instances are listed completely at least daily, incrementally otherwise
+
+_ID_RE = re.compile(u'[A-Fa-f0-9]{24}')  # as qubell.api.tools.is_bson_id, api is not loaded for completion
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (
+    tenant TEXT NOT NULL, org TEXT NOT NULL, kind TEXT NOT NULL, id TEXT NOT NULL, name TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (tenant, org, kind, id));
+CREATE INDEX IF NOT EXISTS names_by_name ON names (tenant, org, kind, name);
+CREATE TABLE IF NOT EXISTS refreshes (
+    tenant TEXT NOT NULL, org TEXT NOT NULL, kind TEXT NOT NULL, refreshed_at REAL NOT NULL,
+    PRIMARY KEY (tenant, org, kind));
+"""
+
+
+def is_id(value):
+    return bool(_ID_RE.match(value))
+
+
+def default_index_path():
+    if os.getenv("NOMI_NAME_INDEX_PATH"):
+        return os.getenv("NOMI_NAME_INDEX_PATH")
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'nomi', 'names.sqlite')
+
+
+def is_enabled():
+    """
+    Index is used unless NOMI_NAME_INDEX=off, its file is NOMI_NAME_INDEX_PATH
+    """
+    return os.getenv("NOMI_NAME_INDEX") != "off"
+
+
+class NameIndex(object):
+    """
+    Names and ids of entities of one tenant, organizations themselves are kept with empty organization.
+    Connection is opened per call, so index is safe to use from threads and concurrent nomi processes.
+    Index is only a hint: database errors are logged and treated as missing entries.
+    """
+
+    def __init__(self, tenant, path=None):
+        self.tenant = tenant
+        self.path = path or default_index_path()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, 0700)
+        db = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            db.executescript(_SCHEMA)
+            self._ready = True
+        return db
+
+    def _read(self, query, args):
+        try:
+            with closing(self._connect()) as db:
+                return db.execute(query, args).fetchall()
+        except (sqlite3.Error, OSError) as e:
+            log.warning("Name index is not readable: %s" % e)
+            return []
+
+    def _write(self, statements):
+        try:
+            with closing(self._connect()) as db:
+                with db:  # one transaction
+                    for query, args in statements:
+                        db.execute(query, args)
+        except (sqlite3.Error, OSError) as e:
+            log.warning("Name index is not updated: %s" % e)
+
+    def ids(self, org, kind, name):
+        """
+        :return: ids of entities with the name, recently seen first
+        """
+        rows = self._read("SELECT id FROM names WHERE tenant=? AND org=? AND kind=? AND name=? ORDER BY seen_at DESC",
+                          (self.tenant, org, kind, name))
+        return [row[0] for row in rows]
+
+    def names(self, org, kind, prefix=""):
+        """
+        :return: sorted names starting with prefix
+        """
+        rows = self._read("SELECT DISTINCT name FROM names WHERE tenant=? AND org=? AND kind=? "
+                          "AND substr(name, 1, ?)=? ORDER BY name",
+                          (self.tenant, org, kind, len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    def add(self, org, kind, entries):
+        """
+        Remembers entities
+        :param list entries: pairs of id and name
+        """
+        now = time.time()
+        self._write([("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?, ?)",
+                      (self.tenant, org, kind, id, name, now)) for id, name in entries])
+
+    def replace(self, org, kind, entries, refreshed_at=None):
+        """
+        Replaces entities of kind with complete list of them
+        """
+        now = time.time()
+        self._write([("DELETE FROM names WHERE tenant=? AND org=? AND kind=?", (self.tenant, org, kind))] +
+                    [("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?, ?)",
+                      (self.tenant, org, kind, id, name, now)) for id, name in entries] +
+                    [("INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?, ?)",
+                      (self.tenant, org, kind, refreshed_at or now))])
+
+    def name(self, org, kind, id):
+        rows = self._read("SELECT name FROM names WHERE tenant=? AND org=? AND kind=? AND id=?",
+                          (self.tenant, org, kind, id))
+        return rows and rows[0][0] or None
+
+    def forget(self, org, kind, id):
+        self._write([("DELETE FROM names WHERE tenant=? AND org=? AND kind=? AND id=?",
+                      (self.tenant, org, kind, id))])
+
+    def refreshed_at(self, org, kind):
+        """
+        :return: time of last complete listing, or None
+        """
+        rows = self._read("SELECT refreshed_at FROM refreshes WHERE tenant=? AND org=? AND kind=?",
+                          (self.tenant, org, kind))
+        return rows and rows[0][0] or None
+
+
+class Resolver(object):
+    """
+    Finds entities of organization by id or name.
+    Ids are used as is. Names are looked up in index and checked against platform,
+    index is refreshed when name is missing or stale.
+    """
+
+    def __init__(self, org, index):
+        """
+        :param qubell.api.private.organization.Organization org:
+        :param NameIndex index:
+        """
+        self.org = org
+        self.index = index
+
+    def _entity(self, kind, id):
+        from qubell.api.private.application import Application
+        from qubell.api.private.environment import Environment
+        from qubell.api.private.instance import Instance
+        clz = {"instance": Instance, "application": Application, "environment": Environment}[kind]
+        return clz(organization=self.org, id=id).init_router(self.org._router)
+
+    def _valid(self, kind, entity, name):
+        from qubell.api.private import exceptions
+        try:
+            j = entity.json()
+        except (exceptions.ApiNotFoundError, exceptions.NotFoundError):
+            return False
+        return j.get("name") == name and (kind != "instance" or j.get("status") != "Destroyed")
+
+    def _lookup(self, kind, name, validate=True):
+        for id in self.index.ids(self.org.organizationId, kind, name):
+            entity = self._entity(kind, id)
+            if not validate or self._valid(kind, entity, name):
+                return entity
+            self.index.forget(self.org.organizationId, kind, id)
+        return None
+
+    def refresh(self, kind):
+        """
+        Lists entities of kind on platform. Instances are listed from the newest ones, till already known.
+        """
+        org_id = self.org.organizationId
+        if kind != "instance":
+            list_json = {"application": self.org.list_applications_json,
+                         "environment": self.org.list_environments_json}[kind]
+            self.index.replace(org_id, kind, [(e["id"], e["name"]) for e in list_json()])
+            return
+        started = time.time()
+        refreshed_at = self.index.refreshed_at(org_id, kind)
+        if not refreshed_at or refreshed_at < started - FULL_REFRESH_AGE:
+            self.index.replace(org_id, kind, [(i["id"], i["name"]) for i in self.org.iter_instances_json()],
+                               refreshed_at=started)
+            return
+        fresh = []
+        for instance in self.org.iter_instances_json():
+            if self.index.name(org_id, kind, instance["id"]) == instance["name"]:
+                break
+            fresh.append((instance["id"], instance["name"]))
+        self.index.add(org_id, kind, fresh)
+
+    def remember(self, kind, entries):
+        """
+        Adds entities listed by command, id and name are taken from dicts
+        """
+        self.index.add(self.org.organizationId, kind, [(e["id"], e["name"]) for e in entries if e.get("name")])
+
+    def get(self, kind, value):
+        """
+        :param str kind: instance, application or environment
+        :param str value: id or name
+        """
+        if is_id(value):
+            return self._entity(kind, value)
+        entity = self._lookup(kind, value)
+        if entity:
+            return entity
+        self.refresh(kind)
+        entity = self._lookup(kind, value, validate=False)
+        if entity:
+            return entity
+        if kind != "instance":
+            from qubell.api.private import exceptions
+            raise exceptions.NotFoundError("None of '%s' in %s list" % (value, kind))
+        # instance may be older than incremental refresh, it is searched on platform as before
+        entity = self.org.get_instance(name=value)
+        self.index.add(self.org.organizationId, kind, [(entity.id, value)])
+        return entity
+
+
+def _option(args, name):
+    for i, arg in enumerate(args[:-1]):
+        if arg == name:
+            return args[i + 1]
+    return None
+
+
+def completion(kind):
+    """
+    :return: click autocompletion callback, suggesting names of kind from index
+    """
+
+    def complete(ctx, args, incomplete):
+        # group callback is not run during completion, global options are read from args
+        tenant = _option(args, "--tenant") or QUBELL["tenant"]
+        org = _option(args, "--organization") or QUBELL["organization"]
+        if not (tenant and org and is_enabled()):
+            return []
+        index = NameIndex(tenant)
+        if not is_id(org):
+            org = next(iter(index.ids("", "organization", org)), None)
+        return org and index.names(org, kind, incomplete) or []
+
+    return complete
@@ -0,0 +1,101 @@
+"""
+Machine readable output of nomi commands.
+Rows are written as soon as they are available, so long listings stream with constant memory.
+"""
+import click
+import simplejson
+
+FORMATS = ["text", "json", "ndjson", "tsv"]
+
+output_option = click.option("--output", "-o", default="text", type=click.Choice(FORMATS),
+                             help="Output format: colored text, json array, json object per line, "
+                                  "or tab separated values with header")
+
+
+class JsonWriter(object):
+    """
+    Writes rows as elements of json array, array is closed by finish()
+    """
+
+    def __init__(self, columns=None):
+        self.rows = 0
+
+    def row(self, row):
+        click.echo(("[" if not self.rows else ",") + simplejson.dumps(row, sort_keys=True))
+        self.rows += 1
+
+    def finish(self):
+        click.echo("]" if self.rows else "[]")
+
+
+class NdjsonWriter(object):
+    """
+    Writes json object per line
+    """
+
+    def __init__(self, columns=None):
+        pass
+
+    def row(self, row):
+        click.echo(simplejson.dumps(row, sort_keys=True))
+
+    def finish(self):
+        pass
+
+
+def _tsv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = simplejson.dumps(value, sort_keys=True)
+    elif not isinstance(value, basestring):
+        value = unicode(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class TsvWriter(object):
+    """
+    Writes header and values of given columns, tabs and new lines in values are escaped
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        click.echo("\t".join(columns))
+
+    def row(self, row):
+        click.echo("\t".join(_tsv_value(row.get(column)) for column in self.columns))
+
+    def finish(self):
+        pass
+
+
+WRITERS = {
+    "json": JsonWriter,
+    "ndjson": NdjsonWriter,
+    "tsv": TsvWriter,
+}
+
+
+def writer(output, columns):
+    """
+    :param str output: one of FORMATS
+    :param list columns: keys of row to write in tsv
+    :return: writer with row() and finish(), or None for text output
+    """
+    if output == "text":
+        return None
+    return WRITERS[output](columns)
+
+
+def write_object(output, obj):
+    """
+    Writes single object: indented json, json on one line, or tsv of its keys and values
+    """
+    if output == "json":
+        click.echo(simplejson.dumps(obj, sort_keys=True, indent=2))
+    elif output == "ndjson":
+        click.echo(simplejson.dumps(obj, sort_keys=True))
+    else:
+        out = TsvWriter(["key", "value"])
+        for key in sorted(obj):
+            out.row({"key": key, "value": obj[key]})
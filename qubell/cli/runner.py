@@ -0,0 +1,254 @@
+import logging as log
+import sys
+import threading
+import time
+import traceback
+from Queue import Queue
+from StringIO import StringIO
+
+import click
+
+from qubell.api.globals import QUBELL, PROVIDER, DEFAULT_CLOUD_ACCOUNT_SERVICE
+
+# global settings nomi reads from environment, with defaults of qubell.api.globals
+ENV_SETTINGS = [
+    (QUBELL, 'tenant', 'QUBELL_TENANT', 'http://localhost:9000'),
+    (QUBELL, 'user', 'QUBELL_USER', None),
+    (QUBELL, 'password', 'QUBELL_PASSWORD', None),
+    (QUBELL, 'token', 'QUBELL_TOKEN', None),
+    (QUBELL, 'refresh_token', 'QUBELL_REFRESH_TOKEN', None),
+    (QUBELL, 'organization', 'QUBELL_ORGANIZATION', None),
+    (PROVIDER, 'provider_name', 'PROVIDER_NAME', DEFAULT_CLOUD_ACCOUNT_SERVICE()),
+    (PROVIDER, 'provider_type', 'PROVIDER_TYPE', 'aws-ec2'),
+    (PROVIDER, 'provider_identity', 'PROVIDER_IDENTITY', 'FAKE'),
+    (PROVIDER, 'provider_credential', 'PROVIDER_CREDENTIAL', 'FAKE'),
+    (PROVIDER, 'provider_region', 'PROVIDER_REGION', 'us-east-1'),
+]
+ENV_NAMES = [name for _, _, name, _ in ENV_SETTINGS]
+
+
+class ThreadLocalStream(object):
+    """
+    Replacement of sys.stdout/stderr/stdin, that is redirected separately in every thread.
+    Threads without redirection use original stream.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self._local = threading.local()
+
+    @property
+    def target(self):
+        return getattr(self._local, 'stream', None) or self.default
+
+    def redirect(self, stream):
+        self._local.stream = stream
+
+    def __getattr__(self, item):
+        return getattr(self.target, item)
+
+    def __iter__(self):
+        return iter(self.target)
+
+
+_install_lock = threading.Lock()
+
+
+def install_streams():
+    """
+    Makes sys.stdout, sys.stderr and sys.stdin redirectable per thread, once per process
+    """
+    with _install_lock:
+        for name in ['stdout', 'stderr', 'stdin']:
+            if not isinstance(getattr(sys, name), ThreadLocalStream):
+                setattr(sys, name, ThreadLocalStream(getattr(sys, name)))
+
+
+def apply_env(env):
+    """
+    Sets global settings from environment of client process
+    :param dict env: variables from ENV_NAMES, missing ones are reset to defaults
+    """
+    for settings, key, name, default in ENV_SETTINGS:
+        settings[key] = env.get(name, default)
+    QUBELL['tenant'] = QUBELL['tenant'].rstrip('/')
+
+
+def run(args, stdout=None, stderr=None, stdin=None, env=None):
+    """
+    Runs nomi command in current process, so platform connection and caches survive between commands.
+    Global settings changed by command are restored after it.
+    :param list args: command line arguments, without program name
+    :param stdout: stream to write output to, current one by default
+    :param dict env: environment variables of client, see apply_env
+    :return: exit code
+    """
+    from qubell.cli.__main__ import entity
+
+    install_streams()
+    saved = save_settings()
+    streams = [(sys.stdout, stdout), (sys.stderr, stderr), (sys.stdin, stdin)]
+    for proxy, stream in streams:
+        proxy.redirect(stream)
+    try:
+        if env is not None:
+            apply_env(env)
+        entity.main(args, prog_name="nomi", standalone_mode=False)
+        return 0
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        click.echo(e.code, err=True)
+        return 1
+    except Exception:
+        log.debug("nomi %s failed" % " ".join(args), exc_info=True)
+        click.echo(traceback.format_exc().rstrip(), err=True)
+        return 1
+    finally:
+        for proxy, _ in streams:
+            proxy.redirect(None)
+        restore_settings(saved)
+
+
+def save_settings():
+    return dict(QUBELL), dict(PROVIDER)
+
+
+def restore_settings(saved):
+    _restore(QUBELL, saved[0])
+    _restore(PROVIDER, saved[1])
+
+
+def _restore(settings, saved):
+    # only changed keys are set back, so commands running concurrently never see settings half restored
+    for key in set(settings) - set(saved):
+        del settings[key]
+    for key, value in saved.items():
+        if settings.get(key) != value:
+            settings[key] = value
+
+
+class Job(object):
+    """
+    Command of nomi batch, started when commands it runs after succeeded
+    """
+
+    def __init__(self, name, args, after=()):
+        self.name = name
+        self.args = args
+        self.after = list(after)
+        self.code = None
+        self.skipped = False
+        self.output = ""
+        self.elapsed = 0
+
+    @property
+    def status(self):
+        if self.skipped:
+            return "skipped"
+        if self.code is None:
+            return None
+        return "ok" if self.code == 0 else "failed"
+
+    def run(self):
+        output = StringIO()
+        started = time.time()
+        try:
+            # output of command is kept together, so concurrent commands do not mix it
+            self.code = run(self.args, stdout=output, stderr=output, stdin=StringIO())
+        finally:
+            self.elapsed = time.time() - started
+            self.output = output.getvalue()
+
+
+def check_jobs(jobs):
+    """
+    :raise ValueError: on duplicate names, unknown or circular dependencies
+    """
+    by_name = {}
+    for job in jobs:
+        if job.name in by_name:
+            raise ValueError("Command '%s' is defined twice" % job.name)
+        by_name[job.name] = job
+    for job in jobs:
+        for name in job.after:
+            if name not in by_name:
+                raise ValueError("Command '%s' runs after unknown command '%s'" % (job.name, name))
+
+    checked = set()
+
+    def visit(job, path):
+        if job.name in path:
+            raise ValueError("Circular dependency: %s" % " -> ".join(path + [job.name]))
+        if job.name not in checked:
+            for name in job.after:
+                visit(by_name[name], path + [job.name])
+            checked.add(job.name)
+
+    for job in jobs:
+        visit(job, [])
+
+
+def run_jobs(jobs, max_in_flight=1, fail_fast=False, callback=None):
+    """
+    Runs commands in this process, independent ones concurrently.
+    Commands running after failed or skipped ones are skipped, after first failure all pending are skipped if fail_fast.
+    :param callback: called in this thread with every job finished or skipped, in order of completion
+    """
+    from qubell.api.provider.batch import Batch
+
+    check_jobs(jobs)
+    by_name = dict((job.name, job) for job in jobs)
+    pending = list(jobs)
+    finished = Queue()
+    state = {"running": 0, "failed": False}
+    reported = set()
+
+    def report(job):
+        reported.add(job.name)
+        if callback:
+            callback(job)
+
+    def execute(job):
+        try:
+            job.run()
+        finally:
+            finished.put(job)
+
+    def schedule(batch):
+        progress = True
+        while progress:
+            progress = False
+            for job in list(pending):
+                # job finished in worker counts only once reported, so report order follows dependencies
+                statuses = [by_name[name].status if name in reported else None for name in job.after]
+                if (fail_fast and state["failed"]) or "failed" in statuses or "skipped" in statuses:
+                    job.skipped = True
+                elif all(status == "ok" for status in statuses) and state["running"] < max_in_flight:
+                    # submitted only when worker is free, so fail_fast skips everything not started yet
+                    batch.submit(execute, job)
+                    state["running"] += 1
+                else:
+                    continue
+                pending.remove(job)
+                progress = True
+                if job.skipped:
+                    report(job)
+
+    with Batch(max_in_flight) as batch:
+        schedule(batch)
+        while state["running"]:
+            job = finished.get()
+            state["running"] -= 1
+            state["failed"] = state["failed"] or job.code != 0
+            report(job)
+            schedule(batch)
+    return jobs
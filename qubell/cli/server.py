@@ -0,0 +1,273 @@
+"""
+nomi daemon: runs commands sent over local Unix socket in one long living process,
+so authenticated platform, connection pool and response caches are reused between nomi calls.
+
+Client sends one json line {"args", "env", "cwd", "tty"} and reads json lines {"out"}, {"err"},
+ending with {"exit": code}. When command reads stdin, daemon sends {"read_stdin": true}, and client answers
+with {"stdin"} line of its whole input. Client part is kept free of heavy imports, as it runs on every nomi call.
+"""
+import json
+import os
+import socket
+import sys
+
+ENV_PREFIXES = ("QUBELL_", "PROVIDER_", "NOMI_")
+
+
+def default_socket_path():
+    if os.getenv("NOMI_SOCKET"):
+        return os.getenv("NOMI_SOCKET")
+    base = os.getenv("XDG_RUNTIME_DIR") or os.getenv("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "nomi", "daemon.sock")
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+def _request(sock, message):
+    sock.sendall(json.dumps(message) + "\n")
+    reader = sock.makefile("r")
+    try:
+        for line in reader:
+            reply = json.loads(line)
+            if "out" in reply:
+                sys.stdout.write(reply["out"].encode("utf-8"))
+                sys.stdout.flush()
+            elif "err" in reply:
+                sys.stderr.write(reply["err"].encode("utf-8"))
+                sys.stderr.flush()
+            elif "read_stdin" in reply:
+                sock.sendall(json.dumps({"stdin": _read_stdin()}) + "\n")
+            elif "exit" in reply:
+                return reply["exit"]
+    finally:
+        reader.close()
+        sock.close()
+    return 1  # daemon died while running command
+
+
+def _read_stdin():
+    # read only when command asks for input, so it waits for late pipe just like command run locally
+    try:
+        data = sys.stdin.read()
+    except (IOError, ValueError):
+        return ""
+    return data.decode("utf-8", "replace") if isinstance(data, str) else data
+
+
+def is_running(path=None):
+    sock = _connect(path or default_socket_path())
+    if sock:
+        sock.close()
+    return bool(sock)
+
+
+def forward(args, path=None):
+    """
+    Runs command in daemon, if one is running
+    :return: exit code, or None if there is no daemon
+    """
+    sock = _connect(path or default_socket_path())
+    if not sock:
+        return None
+    env = dict((k, v) for k, v in os.environ.items() if k.startswith(ENV_PREFIXES))
+    return _request(sock, {
+        "args": args,
+        "env": env,
+        "cwd": os.getcwd(),
+        "tty": sys.stdout.isatty(),
+    })
+
+
+def stop(path=None):
+    """
+    :return: True if daemon was running
+    """
+    sock = _connect(path or default_socket_path())
+    if not sock:
+        return False
+    _request(sock, {"stop": True})
+    return True
+
+
+def serve(path=None, idle_timeout=None):
+    """
+    Serves commands until stopped or idle for idle_timeout seconds.
+    Settings, environment variables and working directory are global to process, so commands of clients with the
+    same ones run concurrently, and others wait until they finish. Commands with global options run alone.
+    """
+    import SocketServer
+    import threading
+    import time
+    from StringIO import StringIO
+    from contextlib import contextmanager
+
+    from qubell.cli import runner
+    from qubell.cli.__main__ import split_args
+    from qubell.cli.common import keep_platforms_warm, release_platforms
+
+    path = path or default_socket_path()
+    changed = threading.Condition()
+    state = {"last_call": time.time(), "running": 0, "waiting": 0, "key": None}
+
+    @contextmanager
+    def client_settings(key, env, cwd):
+        """
+        Applies settings of client for the block, key is None for command, that changes them itself
+        """
+        with changed:
+            joins = lambda: not state["running"] or (key is not None and key == state["key"])
+            if not joins() or state["waiting"]:  # new commands do not overtake waiting ones
+                state["waiting"] += 1
+                while not joins():
+                    changed.wait()
+                state["waiting"] -= 1
+            if not state["running"]:
+                state["key"] = key
+                state["saved"] = runner.save_settings(), os.getcwd(), \
+                    dict((k, v) for k, v in os.environ.items() if k.startswith(ENV_PREFIXES))
+                for name in state["saved"][2]:
+                    del os.environ[name]
+                os.environ.update((k.encode("utf-8"), v.encode("utf-8")) for k, v in env.items())
+                runner.apply_env(env)
+                if cwd and os.path.isdir(cwd):
+                    os.chdir(cwd)
+            state["running"] += 1
+            state["last_call"] = time.time()
+        try:
+            yield
+        finally:
+            with changed:
+                state["running"] -= 1
+                state["last_call"] = time.time()
+                if not state["running"]:
+                    settings, cwd, environ = state.pop("saved")
+                    runner.restore_settings(settings)
+                    os.chdir(cwd)
+                    for name in [k for k in os.environ if k.startswith(ENV_PREFIXES)]:
+                        del os.environ[name]
+                    os.environ.update(environ)
+                    changed.notify_all()
+
+    class ClientStream(object):
+        encoding = "utf-8"
+
+        def __init__(self, wfile, kind, tty):
+            self.wfile = wfile
+            self.kind = kind
+            self.tty = tty
+
+        def write(self, data):
+            if isinstance(data, str):
+                data = data.decode("utf-8", "replace")
+            self.wfile.write(json.dumps({self.kind: data}) + "\n")
+
+        def flush(self):
+            self.wfile.flush()
+
+        def isatty(self):
+            return self.tty
+
+    class ClientStdin(object):
+        """
+        Input of client, asked from it on first read
+        """
+
+        def __init__(self, rfile, wfile):
+            self.rfile = rfile
+            self.wfile = wfile
+            self._data = None
+
+        def _input(self):
+            if self._data is None:
+                self.wfile.write(json.dumps({"read_stdin": True}) + "\n")
+                line = self.rfile.readline()
+                self._data = StringIO(line and json.loads(line).get("stdin") or "")
+            return self._data
+
+        def read(self, *args):
+            return self._input().read(*args)
+
+        def readline(self, *args):
+            return self._input().readline(*args)
+
+        def readlines(self, *args):
+            return self._input().readlines(*args)
+
+        def __iter__(self):
+            return iter(self._input())
+
+        def isatty(self):
+            return False
+
+    class Handler(SocketServer.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return  # connection check
+            request = json.loads(line)
+            if request.get("stop"):
+                self.wfile.write(json.dumps({"exit": 0}) + "\n")
+                threading.Thread(target=server.shutdown).start()
+                return
+            tty = request.get("tty", False)
+            env = request.get("env", {})
+            global_args, _ = split_args(request["args"])
+            key = None if global_args else (tuple(sorted(env.items())), request.get("cwd"))
+            with client_settings(key, env, request.get("cwd")):
+                try:
+                    code = runner.run(request["args"],
+                                      stdout=ClientStream(self.wfile, "out", tty),
+                                      stderr=ClientStream(self.wfile, "err", tty),
+                                      stdin=ClientStdin(self.rfile, self.wfile))
+                except socket.error:
+                    return  # client is gone
+            self.wfile.write(json.dumps({"exit": code}) + "\n")
+
+    class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+    if is_running(path):
+        raise RuntimeError("nomi daemon is already running on %s" % path)
+    if os.path.exists(path):
+        os.remove(path)  # left by killed daemon
+
+    umask = os.umask(0177)  # socket is accessible only by owner
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+
+    def watch_idle():
+        while not stopped.wait(10):
+            if time.time() - state["last_call"] > idle_timeout and not state["running"]:
+                server.shutdown()
+                return
+
+    stopped = threading.Event()
+    if idle_timeout:
+        watcher = threading.Thread(target=watch_idle, name="nomi-idle")
+        watcher.daemon = True
+        watcher.start()
+
+    keep_platforms_warm()
+    runner.install_streams()
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        server.server_close()
+        release_platforms()
+        if os.path.exists(path):
+            os.remove(path)
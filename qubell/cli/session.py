@@ -0,0 +1,76 @@
+import hashlib
+import logging as log
+import os
+import tempfile
+import time
+
+import simplejson
+
+SESSION_TTL = 60 * 60  # for sessions, which expiration time is unknown
+EXPIRY_MARGIN = 60
+
+
+def default_cache_dir():
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'nomi', 'sessions')
+
+
+class SessionCache(object):
+    """
+    On-disk cache of authenticated sessions, so nomi does not sign in on every invocation.
+    Sessions are stored per tenant and user in files readable only by owner.
+    """
+
+    def __init__(self, path=None, ttl=SESSION_TTL):
+        self.path = path or default_cache_dir()
+        self.ttl = ttl
+
+    def _file(self, tenant, user):
+        key = hashlib.sha1("%s\n%s" % (tenant, user)).hexdigest()
+        return os.path.join(self.path, key + '.json')
+
+    def load(self, tenant, user):
+        """
+        :return: session state, saved by Router.session_state, or None if there is no live session
+        """
+        path = self._file(tenant, user)
+        try:
+            with open(path) as f:
+                entry = simplejson.load(f)
+        except (IOError, ValueError):
+            return None
+        expires_at = entry.get('expires_at') or entry.get('saved_at', 0) + self.ttl
+        if entry.get('tenant') != tenant or expires_at - EXPIRY_MARGIN < time.time():
+            self.forget(tenant, user)
+            return None
+        return entry['state']
+
+    def save(self, tenant, user, state):
+        if not state:
+            return
+        entry = {'tenant': tenant, 'saved_at': time.time(), 'expires_at': state.get('expires_at'), 'state': state}
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0700)
+            # written to temporary file and renamed, so concurrent nomi calls never read half of it
+            fd, tmp = tempfile.mkstemp(dir=self.path)  # created with 0600
+            with os.fdopen(fd, 'w') as f:
+                simplejson.dump(entry, f)
+            os.rename(tmp, self._file(tenant, user))
+        except (IOError, OSError) as e:
+            log.warning("Session is not cached: %s" % e)
+
+    def forget(self, tenant, user):
+        try:
+            os.remove(self._file(tenant, user))
+        except OSError:
+            pass
+
+
+def session_user(user=None, refresh_token=None):
+    """
+    Identity session is cached for: user email, or digest of refresh token
+    """
+    if refresh_token:
+        return "refresh:" + hashlib.sha1(refresh_token).hexdigest()
+    return user
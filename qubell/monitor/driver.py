@@ -0,0 +1,182 @@
+"""
+Event loop driver of performance monitor.
+One thread runs launch/destroy cycles of all monitors as state machines, statuses of all instances come from one
+dashboard query per poll, and launch, reschedule and remove requests go to a bounded pool of connections.
+So hundreds of monitors do not need a thread and a polling loop each.
+"""
+import heapq
+import logging
+import time
+
+from qubell.monitor.load import LoadGenerator, arrival_time
+from qubell.monitor.stats import Phases, Sample
+
+ACTIVE_STATUSES = ('Active', 'Running')
+FAILED_STATUSES = ('Error', 'Failed')
+
+
+class Cycle(object):
+    """
+    Launch/destroy cycle of one monitor instance, see Monitor.launch.
+    Every step either waits for request in flight, or for status reported by poller.
+    """
+
+    def __init__(self, worker, clock, timeout):
+        self.worker = worker
+        self.clock = clock
+        self.timeout = timeout * 60
+        self.phases = Phases(clock)
+        self.instance = None
+        self.call = None
+        self.waiting = None
+        self.deadline = None
+        self.seen = False
+        self.ok = False
+        self.error = None
+
+    def wait(self, step, call=None):
+        self.waiting = step
+        self.call = call
+        self.deadline = self.clock() + self.timeout
+
+    def fail(self, error):
+        self.waiting = None
+        self.error = error
+
+    @property
+    def done(self):
+        return self.waiting is None
+
+    def sample(self):
+        return Sample(self.worker, self.phases.started, self.clock() - self.phases.started, self.ok, self.error,
+                      self.phases.durations())
+
+
+class EventLoopDriver(LoadGenerator):
+    """
+    Same load models and samples as LoadGenerator, but phases are measured with precision of poll_interval.
+    """
+
+    tick = 0.1  # seconds between checks of requests in flight
+
+    def __init__(self, monitor, concurrency=1, rate=None, ramp_up=0, duration=None, cycles=1, timeout=10,
+                 clock=time.time, sleep=time.sleep, on_sample=None, poll_interval=5, max_in_flight=16):
+        """
+        :param float poll_interval: seconds between dashboard queries
+        :param int max_in_flight: limit of simultaneous launch, reschedule and remove requests
+        """
+        super(EventLoopDriver, self).__init__(monitor, concurrency, rate, ramp_up, duration, cycles, timeout,
+                                              clock, sleep, on_sample)
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self.polls = 0
+        self._starts = []
+        self._done = {}
+        self._cycles = []
+        self._batch = None
+        self._next_poll = 0
+
+    def _schedule(self, offset, worker):
+        if self.duration is None or offset < self.duration:
+            heapq.heappush(self._starts, (offset, worker))
+
+    def _start_due(self, now):
+        while self._starts and self._starts[0][0] <= now - self.started:
+            offset, worker = heapq.heappop(self._starts)
+            cycle = Cycle(worker, self.clock, self.timeout)
+            cycle.wait("accepted", self._batch.submit(self.monitor.app.launch, environment=self.monitor.env))
+            self._cycles.append(cycle)
+            if self.rate and (self.cycles is None or worker + 1 < self.cycles):
+                self._schedule(arrival_time(worker + 1, self.rate, self.ramp_up), worker + 1)
+
+    def _finish(self, cycle):
+        if cycle.error:
+            logging.error("Monitor cycle of worker %s failed: %s" % (cycle.worker, cycle.error))
+        self._record(cycle.sample())
+        if not self.rate:
+            self._done[cycle.worker] = self._done.get(cycle.worker, 0) + 1
+            if self.cycles is None or self._done[cycle.worker] < self.cycles:
+                self._schedule(self.clock() - self.started, cycle.worker)
+
+    def _request_done(self, cycle):
+        exception = cycle.call.exception()
+        if exception:
+            return cycle.fail("%s: %s" % (exception.__class__.__name__, exception))
+        cycle.phases.mark(cycle.waiting)
+        if cycle.waiting == "accepted":
+            cycle.instance = cycle.call.result()
+            cycle.wait("launching")
+        elif cycle.waiting == "destroy_scheduled":
+            cycle.wait("destroyed")
+        elif cycle.waiting == "removed":
+            cycle.ok = True
+            cycle.waiting = None
+
+    def _status(self, cycle, status):
+        """
+        Advances cycle waiting for status, status is None when instance is not listed
+        """
+        if status is not None:
+            cycle.seen = True
+        elif cycle.seen:
+            status = 'Destroyed'  # dashboard does not list destroyed instances
+        if cycle.waiting == "launching" and status not in (None, 'Requested'):
+            cycle.phases.mark("launching")
+            cycle.wait("active")
+        if cycle.waiting == "active":
+            if status in ACTIVE_STATUSES:
+                cycle.phases.mark("active")
+                cycle.wait("destroy_scheduled", self._batch.submit(
+                    cycle.instance.reschedule_workflow, workflow_name='destroy',
+                    timestamp=self.monitor.destroy_interval))
+            elif status in FAILED_STATUSES or status == 'Destroyed':
+                cycle.fail("AssertionError: Monitor didn't get Active state, got %s" % status)
+        elif cycle.waiting == "destroyed" and status == 'Destroyed':
+            cycle.phases.mark("destroyed")
+            cycle.wait("removed", self._batch.submit(cycle.instance.force_remove))
+
+    def _poll(self):
+        self.polls += 1
+        try:
+            listed = self.monitor.org.list_instances_json(application=self.monitor.app)
+        except Exception as e:
+            logging.warning("Monitor statuses are not polled: %s" % e)
+            return
+        statuses = dict((i.get('id') or i.get('instanceId'), i.get('status')) for i in listed)
+        for cycle in self._cycles:
+            if cycle.instance is not None and cycle.call is None:
+                self._status(cycle, statuses.get(cycle.instance.instanceId))
+
+    def _step(self, now):
+        self._start_due(now)
+        for cycle in self._cycles:
+            if cycle.call is not None and cycle.call.done():
+                self._request_done(cycle)
+        if now >= self._next_poll and any(c.instance is not None and c.call is None for c in self._cycles):
+            self._next_poll = now + self.poll_interval
+            self._poll()
+        for cycle in self._cycles:
+            if not cycle.done and cycle.call is None and now > cycle.deadline:
+                cycle.fail("AssertionError: Monitor didn't get %s in %s min" % (cycle.waiting, self.timeout))
+        for cycle in [c for c in self._cycles if c.done]:
+            self._cycles.remove(cycle)
+            self._finish(cycle)
+
+    def run(self):
+        """
+        Runs load and waits for all started cycles
+        :return: list of Sample
+        """
+        self.started = self.clock()
+        if self.rate:
+            self._schedule(arrival_time(0, self.rate, self.ramp_up), 0)
+        else:
+            for worker in range(self.concurrency):
+                self._schedule(self.ramp_up * worker / self.concurrency, worker)
+        with self.monitor.org._router.batch(self.max_in_flight) as batch:
+            self._batch = batch
+            while self._starts or self._cycles:
+                self._step(self.clock())
+                self.sleep(self.tick)
+        self.elapsed = self.clock() - self.started
+        return self.samples
@@ -0,0 +1,128 @@
+"""
+Load generator of performance monitor.
+Monitor clones run repeated launch/destroy cycles, keeping either target concurrency or arrival rate.
+"""
+import logging
+import math
+import threading
+import time
+
+from qubell.monitor.stats import Sample, summarize
+
+
+def arrival_time(n, rate, ramp_up=0):
+    """
+    Time of n-th arrival (from 0), when rate grows linearly from zero during ramp up
+    :param float rate: arrivals per minute after ramp up
+    :param float ramp_up: seconds
+    :return: seconds since start
+    """
+    per_second = rate / 60.0
+    if ramp_up and n <= per_second * ramp_up / 2:
+        return math.sqrt(2.0 * ramp_up * n / per_second)
+    return ramp_up / 2.0 + n / per_second
+
+
+class LoadGenerator(object):
+    """
+    Closed model: `concurrency` workers, each runs cycles one after another.
+    Open model: cycles start at `rate` per minute, each by its own worker, no matter how long others last.
+    """
+
+    def __init__(self, monitor, concurrency=1, rate=None, ramp_up=0, duration=None, cycles=1, timeout=10,
+                 clock=time.time, sleep=time.sleep, on_sample=None):
+        """
+        :param monitor: prepared Monitor, it is cloned for every worker
+        :param int concurrency: workers running in parallel, used when rate is not set
+        :param float rate: cycles started per minute
+        :param float ramp_up: seconds to reach full concurrency or rate
+        :param float duration: seconds to start new cycles, unlimited by default
+        :param int cycles: cycles of every worker in closed model, cycles in total in open model,
+                           None to run until duration passes
+        :param int timeout: minutes to wait for every instance status
+        :param on_sample: called with every Sample, when its cycle ends
+        :raise ValueError: if neither cycles nor duration is set
+        """
+        if not (cycles or duration):
+            raise ValueError("Either number of cycles or duration should be set")
+        self.monitor = monitor
+        self.concurrency = concurrency
+        self.rate = rate
+        self.ramp_up = ramp_up or 0
+        self.duration = duration
+        self.cycles = cycles
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.on_sample = on_sample
+        self.samples = []
+        self.started = None
+        self.elapsed = 0
+        self._lock = threading.Lock()
+
+    def _time_left(self):
+        return self.duration is None or self.clock() - self.started < self.duration
+
+    def _cycle(self, worker, monitor):
+        started = self.clock()
+        try:
+            monitor.launch(timeout=self.timeout)
+            ok, error = monitor.status, None
+        except Exception as e:
+            logging.error("Monitor cycle of worker %s failed: %s" % (worker, e))
+            ok, error = False, "%s: %s" % (e.__class__.__name__, e)
+        phases = getattr(monitor, "phases", None)
+        sample = Sample(worker, started, self.clock() - started, bool(ok), error, phases and phases.durations())
+        self._record(sample)
+
+    def _record(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+        if self.on_sample:
+            self.on_sample(sample)
+
+    def _worker(self, worker):
+        self.sleep(self.ramp_up * worker / self.concurrency)
+        monitor = self.monitor.clone()
+        done = 0
+        while (self.cycles is None or done < self.cycles) and self._time_left():
+            self._cycle(worker, monitor)
+            done += 1
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True  # interrupted load test does not wait for instances
+        thread.start()
+        return thread
+
+    def _arrivals(self):
+        threads = []
+        n = 0
+        while (self.cycles is None or n < self.cycles) and self._time_left():
+            delay = arrival_time(n, self.rate, self.ramp_up) - (self.clock() - self.started)
+            if delay > 0:
+                self.sleep(delay)
+                if not self._time_left():
+                    break
+            threads.append(self._start(self._cycle, n, self.monitor.clone()))
+            n += 1
+        return threads
+
+    def run(self):
+        """
+        Runs load and waits for all started cycles
+        :return: list of Sample
+        """
+        self.started = self.clock()
+        if self.rate:
+            threads = self._arrivals()
+        else:
+            threads = [self._start(self._worker, worker) for worker in range(self.concurrency)]
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)  # join without timeout is not interruptible
+        self.elapsed = self.clock() - self.started
+        return self.samples
+
+    def summary(self):
+        return summarize(self.samples, self.elapsed)
@@ -1,13 +1,17 @@
 import os
 from requests import RequestException
-from qubell.api.private import exceptions
+from qubell.api.private import exceptions, setup_logging
 from qubell.api.private.manifest import Manifest
 from qubell.api.private.platform import QubellPlatform
 from qubell.api.provider.router import PrivatePath
+from qubell.monitor.driver import EventLoopDriver
+from qubell.monitor.load import LoadGenerator
+from qubell.monitor.prober import Prober, default_probes
+from qubell.monitor.sinks import AsyncPublisher, publish_results, result_tags, sinks_from_env
+from qubell.monitor.stats import Phases, format_phases, format_summary, write_report
 import argparse
 import logging
 import time
-import threading
 import traceback
 import sys
 
@@ -24,6 +28,27 @@ Monitor can act as continuous performance monitor. It measures time of monitor e
 Use -x option to set number of monitor instances launched.
 If set env var 'RESULT_DATADOG_API_KEY' and 'RESULT_DATADOG_APP_KEY' results will be pushed to datadog with name monitor.execution_duration.ZONE.
 Also, results will be stored in 'perfrep.ZONE' file that file in csv format. Set 'RESULT_FILE' to ovveride file name.
+Results can also go to Prometheus textfile 'RESULT_PROMETHEUS_FILE' or pushgateway 'RESULT_PUSHGATEWAY_URL',
+StatsD 'RESULT_STATSD' (host:port) and JSON lines file 'RESULT_JSONL', tagged with 'RESULT_TAGS' (name:value,...).
+Every cycle is published as monitor.cycle_duration when it ends, and summary when load is over.
+
+Load generator:
+Workers repeat launch/destroy cycles, -x sets their number, or --rate sets cycles started per minute.
+Load grows during --ramp-up and lasts --duration, or till every worker runs --cycles.
+Percentiles of cycle duration, throughput and error rate are printed, --report saves every cycle in csv or json.
+Example:
+  python monitor.py -x 20 --ramp-up 300 --duration 3600 --cycles 0 --report load.json
+With --event-loop all cycles run in one thread, and statuses of all instances are polled by one dashboard query,
+so hundreds of monitors can run from one box. Phases are measured with --poll-interval precision then.
+Example:
+  python monitor.py -x 500 --event-loop --poll-interval 5 --report load.csv
+
+API prober:
+With --probe, instead of launching instances, read routes (organizations, dashboard, environment, activity log)
+are called every --probe-interval seconds for --duration (till interrupted by default), and their latency
+percentiles are published to the same destinations every minute, as monitor.api.p50 and others, tagged by probe.
+Example:
+  python monitor.py --probe --probe-interval 10
 
 """
 parser = argparse.ArgumentParser(description=help_string, formatter_class=argparse.RawTextHelpFormatter)
@@ -37,6 +62,15 @@ parser.add_argument('-t', '--tenant', help='Url to platform')
 parser.add_argument('-o', '--org', help='Organization name to use. Default is -=Monitor=-')
 parser.add_argument('-z', '--zone', help='Zone name to use. Default is root zone')
 parser.add_argument('-x', '--performance', help='Measure performance. Launch this number of instances in parallel and measure report time.')
+parser.add_argument('--rate', type=float, help='Start this number of monitor cycles per minute, instead of -x workers')
+parser.add_argument('--ramp-up', type=float, default=0, help='Seconds to reach full number of workers or rate')
+parser.add_argument('--duration', type=float, help='Seconds to start new cycles')
+parser.add_argument('--cycles', type=int, default=1, help='Cycles of every worker, or in total with --rate. 0 to run for --duration')
+parser.add_argument('--event-loop', action='store_true', help='Run all cycles in one thread with shared status polling')
+parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between status polls of --event-loop')
+parser.add_argument('--probe', action='store_true', help='Probe latency of API read routes, do not launch monitor')
+parser.add_argument('--probe-interval', type=float, default=30, help='Seconds between rounds of --probe')
+parser.add_argument('--report', help='Save every cycle to this file, json if it ends with .json, csv otherwise')
 
 loglevel = logging.WARNING
 args = parser.parse_args()
@@ -48,6 +82,7 @@ elif args.debug:
     loglevel =logging.DEBUG
 
 #logger = logging.getLogger("qubell.stories")
+setup_logging()
 logging.getLogger().setLevel(loglevel)
 
 user = args.user or os.getenv('QUBELL_USER')
@@ -120,6 +155,7 @@ class Monitor(object):
     """
 
     destroy_interval = "100000"  # ms, keep it as a string
+    appear_poll_interval = 0.5  # seconds
 
     def __init__(self, org=None, app=None, env=None):
         if not all([org, app, env]):
@@ -134,27 +170,49 @@ class Monitor(object):
         self.status = False
         self.start_time = 0
         self.end_time = 0
+        self.phases = Phases()
 
     def launch(self, timeout=2):
         """
         Hierapp instance, with environment dependencies:
         - can be launched within short timeout
         - auto-destroys shortly
+        Time of every phase is kept in self.phases
         """
-        self.start_time = time.time()
-        self.end_time = time.time()
+        self.phases = Phases()
+        self.start_time = self.end_time = self.phases.started
         instance = self.app.launch(environment=self.env)
-        time.sleep(2) # Instance need time to appear in ui
+        self.phases.mark("accepted")
+        self.wait_appeared(instance, timeout)
+        self.phases.mark("launching")
 
         assert instance.running(timeout=timeout), "Monitor didn't get Active state"
         launched = instance.status == 'Active'
+        self.phases.mark("active")
         instance.reschedule_workflow(workflow_name='destroy', timestamp=self.destroy_interval)
+        self.phases.mark("destroy_scheduled")
         assert instance.destroyed(timeout=timeout), "Monitor didn't get Destroyed after short time"
         stopped = instance.status == 'Destroyed'
+        self.phases.mark("destroyed")
         instance.force_remove()
+        self.phases.mark("removed")
         self.end_time = time.time()
         self.status = launched and stopped
 
+    def wait_appeared(self, instance, timeout):
+        """
+        Instance needs time to appear in ui, it is polled till it gets out of Requested status
+        """
+        deadline = time.time() + timeout * 60
+        while True:
+            try:
+                if instance.status != 'Requested':
+                    return
+            except (exceptions.ApiNotFoundError, exceptions.NotFoundError):
+                pass
+            assert time.time() < deadline, "Monitor didn't appear in ui"
+            time.sleep(self.appear_poll_interval)
+
     def download_key(self):
         """
         Private key can be downloaded from environment
@@ -173,101 +231,90 @@ class Monitor(object):
         return Monitor(org=self.org, app=self.app, env=self.env)
 
 
-
-class LaunchThread(threading.Thread):
-    def __init__(self, flow):
-        super(LaunchThread, self).__init__()
-        self.flow = flow
-
-    def run(self):
-        try:
-            self.flow.launch(timeout=10)
-        except:
-            log_exception(*sys.exc_info())
-
-    def __getattr__(self, key):
-        return self.flow.__getattribute__(key)
-
 class PerformanceMonitor(object):
+    """
+    Launches count clones of monitor in parallel and measures their execution time.
+    Kept for compatibility, LoadGenerator runs the load.
+    """
+
     def __init__(self, monitor, count=5):
-        """
-        Launch N instances of monitor, measure execution time
-        :param n: This number of monitors should be started
-        :return:
-        """
-        self.count = count
-        self.monitors = []
+        self.count = int(count)
+        self.load = LoadGenerator(monitor, concurrency=self.count)
         self.statuses = []
         self.exec_time = []
-        for x in range(0, int(count)):
-            self.monitors.append(LaunchThread(monitor.clone()))
 
     def launch(self):
-        for mon in self.monitors:
-            mon.start()
-
-        for mon in self.monitors:
-            mon.join()
-            self.statuses.append(mon.status)
-            self.exec_time.append(mon.end_time - mon.start_time)
-
-def publish_results(value):
-    dd_api_key = os.environ.get('RESULT_DATADOG_API_KEY')
-    dd_app_key = os.environ.get('RESULT_DATADOG_APP_KEY')
-    file = os.environ.get('RESULT_FILE', 'perfrep.%s' % zone_name)
-
-
-    if dd_api_key and dd_app_key:
-        logging.info('Publishing results: %s' % value)
-        from datadog import initialize, api
-        now = time.time()
-        initialize(api_key=dd_api_key, app_key=dd_app_key)
-        api.Metric.send(metric='monitor.execution_duration.%s' % zone_name, points=(now, value), tags=["stack:dev", "tenant:staging", "zone:%s" % zone_name], host="staging.dev.tonomi.com")
-
-    if file:
-        logging.info('Saving to file: %s' % value)
-        f = open(file, 'w')
-        f.write('seconds\n')
-        f.write('%s\n' % value)
-        f.close()
-
+        samples = self.load.run()
+        self.statuses = [s.ok for s in samples]
+        self.exec_time = [s.duration for s in samples]
 
 
 def main():
     if not user:
         parser.print_help()
         return 1
+    if args.cycles == 0 and not args.duration:
+        parser.error("--cycles 0 needs --duration")
     errmsg = "User, password and tenant should be provided"
     assert password, errmsg
     assert tenant, errmsg
     status = -1
 
-    if not(args.create_only or args.dryrun):
+    if args.probe:
+        mnt = Monitor()
+        publisher = AsyncPublisher(sinks_from_env(zone_name))
+        probes = default_probes(mnt.org._router, mnt.org.organizationId, mnt.env.environmentId)
+        try:
+            Prober(probes, publisher, interval=args.probe_interval, tags=result_tags(zone_name)).run(args.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            publisher.close()
+        status = 0
+    elif not(args.create_only or args.dryrun):
         mnt = Monitor()
         try:
             mnt.download_key()
             mnt.launch(timeout=10)
         except:
             log_exception(*sys.exc_info())
+        logging.info("phases: %s" % mnt.phases.durations())
 
         status = 0 if mnt.status else 1
 
-        if args.performance and status == 0:
-            perfmnt = PerformanceMonitor(mnt, int(args.performance))
-            perfmnt.launch()
-            logging.info("statuses: %s" % perfmnt.statuses)
-            logging.info("exec_times: %s" % perfmnt.exec_time)
+        if (args.performance or args.rate) and status == 0:
+            tags = result_tags(zone_name)
+            publisher = AsyncPublisher(sinks_from_env(zone_name))
+
+            def on_sample(sample):
+                publisher.publish("monitor.cycle_duration", sample.duration, dict(tags, ok=str(sample.ok).lower()),
+                                  sample.started + sample.duration)
 
-            if all(perfmnt.statuses): # All monitors passed
-                publish_results(int(sum(perfmnt.exec_time) / len(perfmnt.exec_time)))
+            options = dict(concurrency=int(args.performance or 1), rate=args.rate, ramp_up=args.ramp_up,
+                           duration=args.duration, cycles=args.cycles or None, on_sample=on_sample)
+            if args.event_loop:
+                load = EventLoopDriver(mnt, poll_interval=args.poll_interval, **options)
+            else:
+                load = LoadGenerator(mnt, **options)
+            samples = load.run()
+            summary = load.summary()
+            logging.info("statuses: %s" % [s.ok for s in samples])
+            logging.info("exec_times: %s" % [s.duration for s in samples])
+            sys.stdout.write(format_summary(summary) + "\n")
+            sys.stdout.write(format_phases(summary) + "\n")
+            if args.report:
+                write_report(args.report, samples, summary)
+
+            if samples and not summary["errors"]:  # All monitors passed
+                publish_results(publisher, int(summary["mean"]), tags, summary)
                 status = 0
-            elif any(perfmnt.statuses):
-                times = [x for x in perfmnt.exec_time if x > 0]
-                publish_results(int(sum(times) / len(times)))
+            elif summary["errors"] < summary["count"]:
+                publish_results(publisher, int(summary["mean"]), tags, summary)
                 status = 1
             else:
-                publish_results(0)
+                publish_results(publisher, 0, tags, summary)
                 status = 2
+            publisher.close()
     exit(status)
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Synthetic prober of platform API.
+Calls a set of read routes on schedule, and publishes their latency percentiles, estimated from histograms of
+route statistics, to monitor sinks. Memory does not grow with time: route statistics keep fixed histograms,
+and prober keeps only statistics of previous report to subtract.
+Route statistics are shared by process, so prober should not run along with other load in it.
+"""
+import logging
+import time
+
+from qubell.api.provider import histogram_percentile, routes_stat
+
+PERCENTILES = [50, 90, 99]
+
+
+class Probe(object):
+    def __init__(self, name, route, call):
+        """
+        :param str name: short name, used as tag of metrics
+        :param str route: route string of called route, like "GET /organizations{ctype}", to find its statistics
+        :param call: function without arguments, that calls route
+        """
+        self.name = name
+        self.route = route
+        self.call = call
+
+
+def default_probes(router, org_id, env_id=None, instance_id=None):
+    """
+    Organizations list, instances dashboard, environment and activity log of instance.
+    Instance is the first one of dashboard, if not given, activity log is not probed when there is none.
+    """
+    def dashboard():
+        return router.get_instances(org_id=org_id, params={'sortBy': 'byCreation', 'descending': 'true',
+                                                           'mode': 'short', 'from': '0', 'to': '20'})
+
+    probes = [Probe("organizations", "GET /organizations{ctype}", router.get_organizations),
+              Probe("dashboard", "GET /organizations/{org_id}/dashboard{ctype}", dashboard)]
+    if env_id:
+        probes.append(Probe("environment", "GET /organizations/{org_id}/environments/{env_id}{ctype}",
+                            lambda: router.get_environment(org_id=org_id, env_id=env_id)))
+    if not instance_id:
+        resp_json = dashboard().json()
+        if type(resp_json) == dict:
+            instances = [instance for g in resp_json['groups'] for instance in g['records']]
+        else:  # platform < 37.1
+            instances = resp_json
+        instance_id = instances and (instances[0].get('id') or instances[0].get('instanceId'))
+    if instance_id:
+        probes.append(Probe("activitylog", "GET /organizations/{org_id}/instances/{instance_id}/activitylog{ctype}",
+                            lambda: router.get_instance_activitylog(org_id=org_id, instance_id=instance_id,
+                                                                    params={'max': 20})))
+    return probes
+
+
+def window(before, after):
+    """
+    :return: statistics of calls made between two route statistics: count, total ms and histogram
+    """
+    histogram = after.get("histogram") or []
+    old = (before or {}).get("histogram") or [0] * len(histogram)
+    return {"count": after["count"] - (before or {}).get("count", 0),
+            "total": after["total"] - (before or {}).get("total", 0),
+            "histogram": [a - b for a, b in zip(histogram, old)]}
+
+
+class Prober(object):
+    def __init__(self, probes, publisher=None, interval=30, report_interval=60, tags=None,
+                 clock=time.time, sleep=time.sleep):
+        """
+        :param list probes: list of Probe
+        :param publisher: AsyncPublisher of monitor sinks
+        :param float interval: seconds between rounds of probes
+        :param float report_interval: seconds between reports
+        :param dict tags: tags of every metric, route name is added as probe tag
+        """
+        self.probes = probes
+        self.publisher = publisher
+        self.interval = interval
+        self.report_interval = report_interval
+        self.tags = tags or {}
+        self.clock = clock
+        self.sleep = sleep
+        self.errors = dict((probe.name, 0) for probe in probes)
+        self._last = self._stat()
+
+    def _stat(self):
+        stat = routes_stat()
+        return dict((probe.name, stat.get(probe.route)) for probe in self.probes)
+
+    def probe(self):
+        """
+        Calls every probe once, failures are counted and logged
+        """
+        for probe in self.probes:
+            try:
+                probe.call()
+            except Exception as e:
+                self.errors[probe.name] += 1
+                logging.warning("Probe %s failed: %s" % (probe.name, e))
+
+    def report(self):
+        """
+        Publishes statistics of probes since previous report
+        :return: dict by probe name of count, errors, avg and percentiles in ms
+        """
+        stat = self._stat()
+        report = {}
+        for probe in self.probes:
+            if not stat[probe.name] and not self.errors[probe.name]:
+                continue
+            calls = window(self._last[probe.name], stat[probe.name] or {"count": 0, "total": 0})
+            result = {"count": calls["count"], "errors": self.errors[probe.name],
+                      "avg": calls["count"] and float(calls["total"]) / calls["count"] or None}
+            for p in PERCENTILES:
+                result["p%s" % p] = histogram_percentile(calls["histogram"], p)
+            report[probe.name] = result
+            self.errors[probe.name] = 0
+        self._last = stat
+        if self.publisher:
+            for name, result in report.items():
+                tags = dict(self.tags, probe=name)
+                for key, value in sorted(result.items()):
+                    if value is not None:
+                        self.publisher.publish("monitor.api.%s" % key, value, tags)
+        logging.info("Probes: %s" % report)
+        return report
+
+    def run(self, duration=None, rounds=None):
+        """
+        Probes every interval and reports every report_interval, until duration passes or rounds are done
+        :return: number of rounds
+        """
+        started = self.clock()
+        next_report = started + self.report_interval
+        done = 0
+        while (rounds is None or done < rounds) and (duration is None or self.clock() - started < duration):
+            round_started = self.clock()
+            self.probe()
+            done += 1
+            if self.clock() >= next_report:
+                self.report()
+                next_report += self.report_interval
+            if rounds is None or done < rounds:
+                self.sleep(max(round_started + self.interval - self.clock(), 0))
+        self.report()
+        return done
@@ -0,0 +1,290 @@
+"""
+Sinks of monitor metrics: Prometheus text format (textfile collector or pushgateway), StatsD over UDP,
+JSON lines file, Datadog, and the plain file with last duration.
+AsyncPublisher buffers metrics and flushes them to sinks from background thread, so publishing never blocks monitor.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+
+class Metric(object):
+    def __init__(self, name, value, timestamp=None, tags=None):
+        """
+        :param str name: dotted name, like monitor.execution_duration
+        :param float value: gauge value
+        :param float timestamp: unix time, now by default
+        :param dict tags: tag name to value
+        """
+        self.name = name
+        self.value = value
+        self.timestamp = timestamp or time.time()
+        self.tags = tags or {}
+
+    def as_dict(self):
+        return {"metric": self.name, "value": self.value, "timestamp": self.timestamp, "tags": self.tags}
+
+
+class Sink(object):
+    """
+    Receives batches of metrics from publisher thread
+    """
+
+    def send(self, metrics):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(Sink):
+    """
+    Appends metric per line: {"metric": ..., "value": ..., "timestamp": ..., "tags": {...}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, metrics):
+        with open(self.path, "a") as f:
+            for metric in metrics:
+                f.write(json.dumps(metric.as_dict(), sort_keys=True) + "\n")
+
+
+class LastValueSink(Sink):
+    """
+    Keeps last value of one metric in file, as monitor always did with perfrep.ZONE
+    """
+
+    def __init__(self, path, name="monitor.execution_duration", header="seconds"):
+        self.path = path
+        self.name = name
+        self.header = header
+
+    def send(self, metrics):
+        values = [m.value for m in metrics if m.name == self.name]
+        if values:
+            with open(self.path, "w") as f:
+                f.write("%s\n%s\n" % (self.header, values[-1]))
+
+
+def prometheus_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def prometheus_text(series):
+    """
+    :param dict series: (name, sorted tags) to value
+    :return: Prometheus text exposition format, without timestamps, which neither textfile collector
+             nor pushgateway accepts
+    """
+    lines = []
+    for name in sorted(set(name for name, _ in series)):
+        lines.append("# TYPE %s gauge" % name)
+        for (metric, tags), value in sorted(series.items()):
+            if metric != name:
+                continue
+            labels = ",".join('%s="%s"' % (prometheus_name(k), str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                              for k, v in tags)
+            lines.append("%s%s %r" % (name, labels and "{%s}" % labels, float(value)))
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusSink(Sink):
+    """
+    Writes last value of every series to file for node exporter textfile collector,
+    or posts them to pushgateway, when url is given.
+    """
+
+    def __init__(self, path=None, url=None, job="qubell_monitor", timeout=10):
+        assert path or url, "Either file or pushgateway url should be set"
+        self.path = path
+        self.url = url and "%s/metrics/job/%s" % (url.rstrip("/"), job)
+        self.timeout = timeout
+        self.series = {}
+
+    def send(self, metrics):
+        for metric in metrics:
+            self.series[(prometheus_name(metric.name), tuple(sorted(metric.tags.items())))] = metric.value
+        text = prometheus_text(self.series)
+        if self.path:
+            # collector should never read half written file
+            temp = "%s.%s.tmp" % (self.path, os.getpid())
+            with open(temp, "w") as f:
+                f.write(text)
+            os.rename(temp, self.path)
+        if self.url:
+            import requests
+            requests.post(self.url, data=text, timeout=self.timeout).raise_for_status()
+
+
+class StatsdSink(Sink):
+    """
+    Sends gauges over UDP. Tags are sent in DogStatsD format, when dogstatsd is set, and dropped otherwise.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="", dogstatsd=False):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.dogstatsd = dogstatsd
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format(self, metric):
+        line = "%s%s:%s|g" % (self.prefix, metric.name, metric.value)
+        if self.dogstatsd and metric.tags:
+            line += "|#" + ",".join("%s:%s" % tag for tag in sorted(metric.tags.items()))
+        return line
+
+    def send(self, metrics):
+        for metric in metrics:
+            self.socket.sendto(self.format(metric), self.address)
+
+    def close(self):
+        self.socket.close()
+
+
+class DatadogSink(Sink):
+    """
+    Sends metrics with datadog library, which is not a dependency of client.
+    :param suffix_tag: value of this tag is appended to metric name, like monitor.execution_duration.ZONE
+    """
+
+    def __init__(self, api_key, app_key, host=None, suffix_tag=None):
+        from datadog import initialize
+        initialize(api_key=api_key, app_key=app_key)
+        self.host = host
+        self.suffix_tag = suffix_tag
+
+    def send(self, metrics):
+        from datadog import api
+        series = []
+        for metric in metrics:
+            name = metric.name
+            if self.suffix_tag in metric.tags:
+                name = "%s.%s" % (name, metric.tags[self.suffix_tag])
+            series.append({"metric": name, "points": [(metric.timestamp, metric.value)], "host": self.host,
+                           "tags": ["%s:%s" % tag for tag in sorted(metric.tags.items())]})
+        api.Metric.send(metrics=series)
+
+
+class AsyncPublisher(object):
+    """
+    Buffers published metrics and sends them to every sink from background thread, every flush_interval,
+    or when buffer gets max_batch metrics. Failure of sink is logged and does not affect others.
+    Metrics published while buffer is full are dropped.
+    """
+
+    def __init__(self, sinks, flush_interval=10, max_batch=500, max_buffer=100000):
+        self.sinks = sinks
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dropped = 0
+        self._queue = Queue(max_buffer)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-publisher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def publish(self, name, value, tags=None, timestamp=None):
+        try:
+            self._queue.put_nowait(Metric(name, value, timestamp, tags))
+        except Full:
+            self.dropped += 1
+
+    def _take(self, deadline):
+        metrics = []
+        while len(metrics) < self.max_batch:
+            try:
+                metrics.append(self._queue.get(timeout=0.1))
+            except Empty:
+                if self._closed.is_set():
+                    break  # drained
+            if time.time() >= deadline and not self._closed.is_set():
+                break
+        return metrics
+
+    def _flush(self, metrics):
+        for sink in self.sinks:
+            try:
+                sink.send(metrics)
+            except Exception as e:
+                logging.warning("Metrics are not sent to %s: %s" % (sink.__class__.__name__, e))
+
+    def _run(self):
+        while True:
+            metrics = self._take(time.time() + self.flush_interval)
+            if metrics:
+                self._flush(metrics)
+            elif self._closed.is_set():
+                return
+
+    def close(self, timeout=60):
+        """
+        Flushes buffered metrics and closes sinks
+        """
+        self._closed.set()
+        self._thread.join(timeout)
+        for sink in self.sinks:
+            sink.close()
+        if self.dropped:
+            logging.warning("%s metrics were dropped, buffer was full" % self.dropped)
+
+
+def sinks_from_env(zone_name, environ=os.environ):
+    """
+    RESULT_DATADOG_API_KEY and RESULT_DATADOG_APP_KEY (and optional RESULT_DATADOG_HOST) - Datadog
+    RESULT_FILE - file with last execution duration, perfrep.ZONE by default, empty to disable
+    RESULT_JSONL - JSON lines file
+    RESULT_PROMETHEUS_FILE - file for node exporter textfile collector
+    RESULT_PUSHGATEWAY_URL - Prometheus pushgateway
+    RESULT_STATSD - host:port of StatsD, RESULT_STATSD_DOGSTATSD=true to send tags
+    """
+    sinks = []
+    if environ.get("RESULT_DATADOG_API_KEY") and environ.get("RESULT_DATADOG_APP_KEY"):
+        sinks.append(DatadogSink(environ["RESULT_DATADOG_API_KEY"], environ["RESULT_DATADOG_APP_KEY"],
+                                 host=environ.get("RESULT_DATADOG_HOST", "staging.dev.tonomi.com"), suffix_tag="zone"))
+    result_file = environ.get("RESULT_FILE", "perfrep.%s" % zone_name)
+    if result_file:
+        sinks.append(LastValueSink(result_file))
+    if environ.get("RESULT_JSONL"):
+        sinks.append(JsonLinesSink(environ["RESULT_JSONL"]))
+    if environ.get("RESULT_PROMETHEUS_FILE") or environ.get("RESULT_PUSHGATEWAY_URL"):
+        sinks.append(PrometheusSink(environ.get("RESULT_PROMETHEUS_FILE"), environ.get("RESULT_PUSHGATEWAY_URL")))
+    if environ.get("RESULT_STATSD"):
+        host, _, port = environ["RESULT_STATSD"].partition(":")
+        sinks.append(StatsdSink(host, port or 8125, dogstatsd=environ.get("RESULT_STATSD_DOGSTATSD") == "true"))
+    return sinks
+
+
+def result_tags(zone_name, environ=os.environ):
+    """
+    Tags of every monitor metric: zone, and RESULT_TAGS as comma separated name:value pairs
+    """
+    tags = dict(tag.split(":", 1) for tag in environ.get("RESULT_TAGS", "stack:dev,tenant:staging").split(",")
+                if ":" in tag)
+    tags["zone"] = zone_name
+    return tags
+
+
+def publish_results(publisher, value, tags, summary=None):
+    """
+    :param value: mean execution duration, 0 when all monitors failed
+    :param dict summary: load summary, its error rate, throughput and percentiles are published too
+    """
+    logging.info('Publishing results: %s' % value)
+    publisher.publish("monitor.execution_duration", value, tags)
+    if summary:
+        for key in ["error_rate", "throughput", "p50", "p90", "p99"]:
+            if summary.get(key) is not None:
+                publisher.publish("monitor.%s" % key, summary[key], tags)
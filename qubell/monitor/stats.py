@@ -0,0 +1,191 @@
+"""
+Statistics of monitor runs: latency percentiles, throughput, error rate, phase histograms,
+and their CSV and JSON reports.
+"""
+import bisect
+import csv
+import json
+import math
+import time
+
+PERCENTILES = [50, 90, 99]
+
+# phases of monitor cycle, each is measured from the end of previous one:
+#   accepted - launch request returned, launching - platform shows instance, active - instance is provisioned,
+#   destroy_scheduled - destroy is rescheduled, destroyed - instance is destroyed, removed - instance is removed
+PHASES = ["accepted", "launching", "active", "destroy_scheduled", "destroyed", "removed"]
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 30, 60, 120, 300, 600]  # upper bounds, seconds
+
+
+class Phases(object):
+    """
+    Times when monitor cycle reached its phases
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.marks = []
+
+    def mark(self, phase):
+        self.marks.append((phase, self.clock()))
+
+    def durations(self):
+        """
+        :return: dict of seconds spent in every reached phase
+        """
+        durations = {}
+        previous = self.started
+        for phase, at in self.marks:
+            durations[phase] = at - previous
+            previous = at
+        return durations
+
+
+class Sample(object):
+    """
+    One launch/destroy cycle of monitor
+    """
+
+    def __init__(self, worker, started, duration, ok, error=None, phases=None):
+        """
+        :param int worker: number of worker, that ran the cycle
+        :param float started: unix time
+        :param float duration: seconds
+        :param bool ok: instance became Active and Destroyed
+        :param str error: exception of failed cycle
+        :param dict phases: seconds spent in phases reached, see Phases.durations
+        """
+        self.worker = worker
+        self.started = started
+        self.duration = duration
+        self.ok = ok
+        self.error = error
+        self.phases = phases or {}
+
+    def as_dict(self):
+        return {"worker": self.worker, "started": self.started, "duration": self.duration, "ok": self.ok,
+                "error": self.error, "phases": self.phases}
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile
+    :param list values: sorted values
+    :param p: percent, 0 < p <= 100
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def histogram(values, buckets=HISTOGRAM_BUCKETS):
+    """
+    :param list buckets: sorted upper bounds
+    :return: list of [upper bound, number of values not greater than it, but greater than previous bound],
+             values above all bounds are counted in the last bucket, which bound is None
+    """
+    counts = [0] * (len(buckets) + 1)
+    for value in values:
+        counts[bisect.bisect_left(buckets, value)] += 1
+    return [[bound, count] for bound, count in zip(list(buckets) + [None], counts)]
+
+
+def summarize_phases(samples):
+    """
+    :return: dict by phase of count, percentiles, max and histogram of its durations, for cycles reached it
+    """
+    phases = {}
+    for phase in PHASES:
+        durations = sorted(s.phases[phase] for s in samples if phase in s.phases)
+        if not durations:
+            continue
+        phases[phase] = {"count": len(durations), "max": durations[-1], "histogram": histogram(durations)}
+        for p in PERCENTILES:
+            phases[phase]["p%s" % p] = percentile(durations, p)
+    return phases
+
+
+def summarize(samples, elapsed):
+    """
+    :param list samples: list of Sample
+    :param float elapsed: seconds the load lasted
+    :return: dict of count, errors, error_rate, throughput (cycles per minute),
+             min, mean, p50, p90, p99, max of successful cycle durations, and phases, see summarize_phases
+    """
+    durations = sorted(s.duration for s in samples if s.ok)
+    errors = len([s for s in samples if not s.ok])
+    summary = {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": float(errors) / len(samples) if samples else 0.0,
+        "throughput": len(durations) * 60.0 / elapsed if elapsed else 0.0,
+        "elapsed": elapsed,
+        "min": durations[0] if durations else None,
+        "mean": sum(durations) / len(durations) if durations else None,
+        "max": durations[-1] if durations else None,
+    }
+    for p in PERCENTILES:
+        summary["p%s" % p] = percentile(durations, p)
+    summary["phases"] = summarize_phases(samples)
+    return summary
+
+
+def _seconds(value):
+    return "-" if value is None else "%.1fs" % value
+
+
+def format_phases(summary, width=40):
+    """
+    :return: text with percentiles and histogram of every phase
+    """
+    lines = []
+    for phase in PHASES:
+        stat = summary["phases"].get(phase)
+        if not stat:
+            continue
+        lines.append("%s: count: %s, p50: %s, p90: %s, p99: %s, max: %s" % (
+            phase, stat["count"], _seconds(stat["p50"]), _seconds(stat["p90"]), _seconds(stat["p99"]),
+            _seconds(stat["max"])))
+        top = max(count for _, count in stat["histogram"])
+        for bound, count in stat["histogram"]:
+            if count:
+                lines.append("  <= %-6s %-*s %s" % (
+                    bound is None and "inf" or "%ss" % bound, width, "#" * max(1, count * width // top), count))
+    return "\n".join(lines)
+
+
+def format_summary(summary):
+    return "cycles: %s, errors: %s (%.0f%%), throughput: %.2f/min, min: %s, p50: %s, p90: %s, p99: %s, max: %s" % (
+        summary["count"], summary["errors"], summary["error_rate"] * 100, summary["throughput"],
+        _seconds(summary["min"]), _seconds(summary["p50"]), _seconds(summary["p90"]), _seconds(summary["p99"]),
+        _seconds(summary["max"]))
+
+
+def write_csv(path, samples):
+    """
+    Writes cycle per row
+    """
+    with open(path, "wb") as f:
+        writer = csv.writer(f)
+        writer.writerow(["worker", "started", "duration", "ok", "error"] + PHASES)
+        for s in samples:
+            writer.writerow([s.worker, "%.3f" % s.started, "%.3f" % s.duration, s.ok and 1 or 0, s.error or ""] +
+                            [phase in s.phases and "%.3f" % s.phases[phase] or "" for phase in PHASES])
+
+
+def write_json(path, samples, summary):
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "samples": [s.as_dict() for s in samples]}, f, indent=2, sort_keys=True)
+
+
+def write_report(path, samples, summary, format=None):
+    """
+    :param str format: csv or json, guessed from file extension by default
+    """
+    format = format or (path.endswith(".json") and "json" or "csv")
+    if format == "json":
+        write_json(path, samples, summary)
+    else:
+        write_csv(path, samples)
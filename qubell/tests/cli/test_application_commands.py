@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from mock import Mock, patch
+
+from qubell.api.private.exceptions import NotFoundError
+from qubell.api.provider.batch import Batch, parallel_map
+from qubell.cli import runner
+from qubell.cli.commands.application import child_applications
+
+MANIFESTS = {
+    "root": """
+application:
+  components:
+    first:
+      type: reference.Submodule
+      configuration:
+        __locator.application-id: "shared"
+    second:
+      type: reference.Submodule
+      configuration:
+        __locator.application-id: cyclic
+""",
+    "shared": "application: {}\n",
+    "cyclic": """
+application:
+  components:
+    back:
+      configuration:
+        __locator.application-id: 'root'
+    again:
+      configuration:
+        __locator.application-id: shared  # same child twice
+""",
+}
+
+
+class ChildApplicationsTests(unittest.TestCase):
+    def test_fast_path(self):
+        assert child_applications(MANIFESTS["root"]) == ["shared", "cyclic"]
+        assert child_applications(MANIFESTS["cyclic"]) == ["root", "shared"]
+        assert child_applications(MANIFESTS["shared"]) == []
+
+    def test_fallback_to_yaml_parser(self):
+        manifest = """
+application:
+  components:
+    first: {configuration: {__locator.application-id: flow}}
+    second:
+      configuration: &child
+        __locator.application-id: anchored
+    third:
+      configuration: *child
+"""
+        assert sorted(child_applications(manifest)) == ["anchored", "flow"]
+
+
+def fake_org():
+    apps = {}
+    for name, manifest in MANIFESTS.items():
+        app = Mock(id=name)
+        app.name = name
+        app.get_manifest_latest.return_value = {"version": 1, "manifest": manifest}
+        apps[name] = app
+
+    def get_application(id=None, name=None):
+        if (id or name) not in apps:
+            raise NotFoundError(id or name)
+        return apps[id or name]
+
+    org = Mock()
+    org.get_application.side_effect = get_application
+    return org, apps
+
+
+class ApplicationCommandsTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.org, self.apps = fake_org()
+        platform = Mock()
+        platform.get_organization.return_value = self.org
+        platform.batch.side_effect = Batch
+        platform.parallel_map.side_effect = parallel_map
+        for patcher in [patch("qubell.cli.commands.application._get_platform", return_value=platform),
+                        patch.dict(os.environ, {"NOMI_NAME_INDEX": "off"})]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def nomi(self, *args):
+        out = StringIO()
+        code = runner.run(["--uncolorize", "--organization", "org", "application"] + list(args), stdout=out, stderr=out)
+        return code, out.getvalue()
+
+    def test_recursive_export_visits_every_app_once(self):
+        code, output = self.nomi("export", "--recursive", "--output-dir", self.dir, "root", "shared", "missing")
+        assert code == 0
+        assert sorted(os.listdir(self.dir)) == ["cyclic-v1.yml", "root-v1.yml", "shared-v1.yml"]
+        lines = output.splitlines()
+        assert [line.split()[1] for line in lines] == ["root", "shared", "missing", "cyclic"]
+        assert lines[2].endswith("FAIL")
+        for name in MANIFESTS:
+            assert self.apps[name].get_manifest_latest.call_count == 1
+
+    def test_import_in_order_of_files(self):
+        files = []
+        for name in ["first-v2.yml", "second.yml", "third.yml"]:
+            path = os.path.join(self.dir, name)
+            with open(path, "w") as f:
+                f.write("application: {}\n")
+            files.append(path)
+        os.remove(files[2])
+        self.org.application.side_effect = lambda id, name, manifest: Mock(id="id-" + name)
+
+        code, output = self.nomi("import", "--jobs", "3", *files)
+        assert code == 1
+        lines = output.splitlines()
+        assert lines[0].endswith("first id-first OK")
+        assert lines[1].endswith("second id-second OK")
+        assert "third" in lines[2] and "FAIL" in lines[2]
+        assert self.org.application.call_count == 2
+
+    def test_delete_fails_when_any_app_is_not_deleted(self):
+        self.org.delete_application.side_effect = lambda name: self.apps[name]
+        code, output = self.nomi("delete", "root", "missing")
+        assert code == 1
+        lines = output.splitlines()
+        assert lines[0] == "Deleting root OK"
+        assert lines[1].startswith("Deleting missing FAILED")
+        assert self.nomi("delete", "root")[0] == 0
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from StringIO import StringIO
+
+from mock import patch
+
+from qubell.cli import common, runner
+from qubell.cli.commands.batch import parse, parse_lines, parse_yaml
+from qubell.cli.runner import Job, check_jobs, run_jobs
+
+
+class ParseTests(unittest.TestCase):
+    def test_lines_with_wait(self):
+        jobs = parse_lines("# launch\ninstance launch --application a\n\ninstance list\nwait\napp list\n")
+        assert [(job.name, job.args, job.after) for job in jobs] == [
+            ("2", ["instance", "launch", "--application", "a"], []),
+            ("4", ["instance", "list"], []),
+            ("6", ["app", "list"], ["2", "4"]),
+        ]
+
+    def test_yaml(self):
+        jobs = parse_yaml([
+            "app import --file 'a b.yml'",
+            {"name": "launch", "command": ["instance", "launch"], "after": 1},
+            {"command": "instance wait-status RUNNING", "after": ["launch"]},
+        ])
+        assert [(job.name, job.args, job.after) for job in jobs] == [
+            ("1", ["app", "import", "--file", "a b.yml"], []),
+            ("launch", ["instance", "launch"], ["1"]),
+            ("3", ["instance", "wait-status", "RUNNING"], ["launch"]),
+        ]
+
+    def test_format_detection(self):
+        assert [job.name for job in parse("- zone list\n- name: a\n  command: org list\n")] == ["1", "a"]
+        assert [job.args for job in parse("zone list\norg list\n")] == [["zone", "list"], ["org", "list"]]
+
+    def test_global_options_are_rejected(self):
+        self.assertRaises(ValueError, parse_lines, "--organization other instance list")
+        self.assertRaises(ValueError, parse_lines, "batch other.txt")
+
+    def test_dependencies_are_checked(self):
+        self.assertRaises(ValueError, check_jobs, [Job("a", ["zone"], ["b"])])
+        self.assertRaises(ValueError, check_jobs, [Job("a", ["zone"]), Job("a", ["org"])])
+        self.assertRaises(ValueError, check_jobs, [Job("a", ["zone"], ["c"]), Job("b", ["zone"], ["a"]),
+                                                   Job("c", ["zone"], ["b"])])
+
+
+@patch("qubell.cli.runner.run")
+class RunJobsTests(unittest.TestCase):
+    def test_independent_jobs_run_concurrently(self, run):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def command(args, **kwargs):
+            with lock:
+                running.append(args)
+                peak.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.remove(args)
+            return 0
+
+        run.side_effect = command
+        jobs = [Job(str(i), ["zone", "list"]) for i in range(6)]
+        run_jobs(jobs, max_in_flight=3)
+        assert max(peak) == 3
+        assert [job.status for job in jobs] == ["ok"] * 6
+
+    def test_order_and_skipping(self, run):
+        run.side_effect = lambda args, **kwargs: 1 if args == ["bad"] else 0
+        reported = []
+        jobs = [Job("d", ["ok"], ["c"]), Job("a", ["ok"]), Job("b", ["bad"], ["a"]), Job("c", ["ok"], ["b"]),
+                Job("e", ["ok"], ["a"])]
+        run_jobs(jobs, max_in_flight=4, callback=lambda job: reported.append((job.name, job.status)))
+        assert reported.index(("a", "ok")) < reported.index(("b", "failed")) < reported.index(("c", "skipped"))
+        assert reported.index(("c", "skipped")) < reported.index(("d", "skipped"))
+        assert ("e", "ok") in reported
+        assert len(reported) == 5
+
+    def test_fail_fast(self, run):
+        run.side_effect = lambda args, **kwargs: 1 if args == ["bad"] else 0
+        jobs = [Job("1", ["bad"]), Job("2", ["ok"], ["1"]), Job("3", ["ok"])]
+        run_jobs(jobs, max_in_flight=1, fail_fast=True)
+        assert [job.status for job in jobs] == ["failed", "skipped", "skipped"]
+
+
+class BatchCommandTests(unittest.TestCase):
+    def tearDown(self):
+        common._warm_platforms = None
+
+    def test_exit_status_and_timings(self):
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w") as f:
+            f.write("zone --help\norg no-such-command\nwait\ninstance --help\n")
+        out = StringIO()
+        try:
+            code = runner.run(["--uncolorize", "batch", "--jobs", "2", path], stdout=out, stderr=out)
+        finally:
+            os.remove(path)
+        output = out.getvalue()
+        assert code == 1
+        assert "[ok] 1 (" in output
+        assert "No such command" in output
+        assert "[skipped] 4: nomi instance --help" in output
+        assert "1 ok, 1 failed, 1 skipped in" in output
@@ -0,0 +1,154 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from StringIO import StringIO
+
+from mock import Mock, patch
+
+from qubell.api.globals import QUBELL
+from qubell.cli import common, runner, server
+from qubell.cli.__main__ import _command_name, main, split_args
+
+
+class RunnerTests(unittest.TestCase):
+    def run_nomi(self, *args, **kwargs):
+        out, err = StringIO(), StringIO()
+        code = runner.run(list(args), stdout=out, stderr=err, **kwargs)
+        return code, out.getvalue(), err.getvalue()
+
+    def test_output_is_captured(self):
+        code, out, err = self.run_nomi("--help")
+        assert code == 0
+        assert out.startswith("Usage: nomi")
+        assert err == ""
+
+    def test_usage_error(self):
+        code, out, err = self.run_nomi("org", "no-such-command")
+        assert code == 2
+        assert "No such command" in err
+
+    def test_failure_does_not_stop_process(self):
+        code, out, err = self.run_nomi("manifest", "validate", "/no/such/manifest.yml")
+        assert code != 0
+        assert err
+
+    def test_settings_are_restored(self):
+        saved = dict(QUBELL)
+        self.run_nomi("--tenant", "http://other", "--user", "someone", "org", "--help")
+        assert QUBELL == saved
+
+    def test_env_of_client(self):
+        settings = {}
+
+        def remember(*args, **kwargs):
+            settings.update(QUBELL)
+
+        with patch("qubell.cli.__main__.entity.main", side_effect=remember):
+            self.run_nomi("org", "list", env={"QUBELL_TENANT": "http://client/", "QUBELL_USER": "client"})
+        assert settings["tenant"] == "http://client"
+        assert settings["user"] == "client"
+        assert settings["password"] is None
+
+
+class CommandNameTests(unittest.TestCase):
+    def test_global_options_are_skipped(self):
+        assert _command_name(["--tenant", "http://t", "--debug", "ins", "list"]) == "instance"
+        assert _command_name(["--user", "shell", "shell"]) == "shell"
+        assert _command_name(["--help"]) is None
+        assert split_args(["--tenant", "http://t", "ins", "list"]) == (["--tenant", "http://t"], "instance")
+
+    def test_long_running_commands_are_not_forwarded(self):
+        with patch("qubell.cli.server.forward", return_value=0) as forward, \
+                patch("qubell.cli.__main__.entity") as entity:
+            for args in [["ins", "logs", "i1", "--follow"], ["ins", "wait-status", "i1", "Active"]]:
+                with patch.object(sys, "argv", ["nomi"] + args):
+                    main()
+        assert not forward.called
+        assert entity.call_count == 2
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "nomi.sock")
+        self.thread = threading.Thread(target=server.serve, args=(self.path,))
+        self.thread.daemon = True
+        self.thread.start()
+        for _ in range(50):
+            if server.is_running(self.path):
+                break
+            time.sleep(0.1)
+
+    def tearDown(self):
+        server.stop(self.path)
+        self.thread.join(5)
+        common._warm_platforms = None
+        shutil.rmtree(self.dir)
+
+    def test_forward(self):
+        out = StringIO()
+        with patch.object(sys, "stdout", out):
+            assert server.forward(["--help"], self.path) == 0
+        assert out.getvalue().startswith("Usage: nomi")
+
+    def test_exit_code_is_forwarded(self):
+        err = StringIO()
+        with patch.object(sys, "stderr", err):
+            assert server.forward(["org", "no-such-command"], self.path) == 2
+        assert "No such command" in err.getvalue()
+
+    def test_stop(self):
+        assert server.stop(self.path)
+        self.thread.join(5)
+        assert not self.thread.is_alive()
+        assert not os.path.exists(self.path)
+        assert server.forward(["--help"], self.path) is None
+
+    def test_stop_closes_warm_platforms(self):
+        platform = Mock()
+        common._warm_platforms[("tenant",)] = platform
+        assert server.stop(self.path)
+        self.thread.join(5)
+        assert platform._router.close.called
+        assert common._warm_platforms is None
+
+    def fake_run(self, args, stdout=None, stderr=None, stdin=None, env=None):
+        if args[0] == "slow":
+            self.release.wait(5)
+        elif args[0] == "cat":
+            stdout.write(stdin.read())
+        elif args[0] == "env":
+            stdout.write("%s %s" % (os.getenv("QUBELL_SESSION_CACHE"), QUBELL["user"]))
+        return 0
+
+    def forward(self, args, stdin=""):
+        out = StringIO()
+        with patch.object(sys, "stdout", out), patch.object(sys, "stdin", StringIO(stdin)):
+            code = server.forward(args, self.path)
+        return code, out.getvalue()
+
+    def test_commands_run_concurrently(self):
+        self.release = threading.Event()
+        with patch("qubell.cli.runner.run", self.fake_run):
+            slow = threading.Thread(target=self.forward, args=(["slow"],))
+            slow.start()
+            assert self.forward(["fast"]) == (0, "")
+            assert slow.is_alive()
+            self.release.set()
+            slow.join(5)
+
+    def test_stdin_is_read_when_command_asks(self):
+        with patch("qubell.cli.runner.run", self.fake_run):
+            assert self.forward(["cat"], stdin="name: app\n") == (0, "name: app\n")
+
+    def test_environment_of_client(self):
+        with patch("qubell.cli.runner.run", self.fake_run), \
+                patch.dict(os.environ, {"QUBELL_SESSION_CACHE": "off", "QUBELL_USER": "client"}):
+            assert self.forward(["env"]) == (0, "off client")
+        with patch("qubell.cli.runner.run", self.fake_run), patch.dict(os.environ, {"QUBELL_USER": "other"}):
+            os.environ.pop("QUBELL_SESSION_CACHE", None)
+            assert self.forward(["env"]) == (0, "None other")
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import simplejson
+from mock import Mock, patch
+
+from qubell.api.private.organization import Organization
+from qubell.api.provider.router import PrivatePath
+from qubell.cli import runner
+from qubell.tests.provider.test_response_cache import gen_response
+
+INSTANCE, DB, DISK = "518000000000000000000001", "518000000000000000000002", "518000000000000000000003"
+APP, ENV = "51800000000000000000000a", "51800000000000000000000e"
+
+RESOURCES = {
+    "/organizations/o1/instances/%s.json" % INSTANCE: {
+        "id": INSTANCE, "name": "web", "status": "Active", "createdAt": 0,
+        "application": {"id": APP}, "environment": {"id": ENV},
+        "config": [{"id": "port", "name": "Port", "value": 80}],
+        "interfaces": {"endpoints": {"signals": {"url": "http://web"}}},
+        "workflowsInfo": {"availableWorkflows": [{"name": "restart", "parameters": []}]},
+        "submodules": [{"componentId": "db", "name": "database", "instanceId": DB, "moduleType": "submodule",
+                        "submodules": [{"componentId": "disk", "instanceId": DISK, "moduleType": "submodule"}]}],
+    },
+    "/organizations/o1/instances/%s.json" % DB: {"id": DB, "status": "Launching"},
+    "/organizations/o1/instances/%s.json" % DISK: {"id": DISK, "status": "Failed"},
+    "/organizations/o1/applications/%s.json" % APP: {"id": APP, "name": "petclinic"},
+    "/organizations/o1/environments/%s.json" % ENV: {"id": ENV, "name": "default"},
+}
+
+
+def respond(method, url, **kwargs):
+    return gen_response(content=simplejson.dumps(RESOURCES[url.replace("http://nowhere.com", "")]))
+
+
+@patch("requests.Session.request", create=True)
+class DescribeTests(unittest.TestCase):
+    def setUp(self):
+        router = PrivatePath("http://nowhere.com")
+        router._cookies = {"PLAY_SESSION": "session"}
+        platform = Mock()
+        platform.get_organization.return_value = Organization("o1").init_router(router)
+        platform.snapshot.side_effect = router.snapshot
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        for patcher in [patch("qubell.cli.commands.instance._get_platform", return_value=platform),
+                        patch.dict(os.environ, {"NOMI_NAME_INDEX_PATH": os.path.join(index_dir, "names.sqlite")})]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def describe(self, *args):
+        out, err = StringIO(), StringIO()
+        code = runner.run(["--uncolorize", "--organization", "o1", "instance", "describe", INSTANCE] + list(args),
+                          stdout=out, stderr=err)
+        assert code == 0, err.getvalue()
+        return out.getvalue(), err.getvalue()
+
+    def test_every_resource_is_read_once_and_id_is_not_searched(self, request_mock):
+        request_mock.side_effect = respond
+        output, _ = self.describe()
+        paths = sorted(call[0][1].replace("http://nowhere.com", "") for call in request_mock.call_args_list)
+        assert paths == sorted(RESOURCES.keys())
+        assert "Application %s  petclinic" % APP in output
+        assert "Environment %s  default" % ENV in output
+        assert "endpoints.url" in output
+        assert "Module: db database %s Launching" % DB in output
+        assert "Module: db.disk  %s Failed" % DISK in output
+
+    def test_stats(self, request_mock):
+        request_mock.side_effect = respond
+        _, err = self.describe("--stats")
+        assert err.startswith("Requests: 5,")
+        assert "GET /organizations/{org_id}/instances/{instance_id}{ctype}" in err
+
+
+class TitleTests(unittest.TestCase):
+    def test_json_is_not_changed(self):
+        from qubell.cli.commands.instance import _calc_title
+        config = [{"id": "port", "name": "Port", "value": 80}, {"id": "host", "value": "web"}]
+        assert [c["_title"] for c in _calc_title(config)] == ["port (Port)", "host"]
+        assert config == [{"id": "port", "name": "Port", "value": 80}, {"id": "host", "value": "web"}]
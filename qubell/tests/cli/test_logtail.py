@@ -0,0 +1,101 @@
+import os
+import unittest
+from StringIO import StringIO
+
+from mock import MagicMock, Mock, patch
+
+from qubell.api.private.instance import ActivityLog
+from qubell.api.provider.batch import Batch
+from qubell.cli import logtail, runner
+
+
+def item(time, description, severity="INFO", event="status updated", source="self"):
+    return {"time": time, "description": description, "severity": severity, "eventTypeText": event, "source": source}
+
+
+class FakeInstance(object):
+    """
+    Platform returns items not older than after, like the activitylog route does
+    """
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items or []
+        self.requested = []
+
+    def get_activitylog(self, after=None, severity=None, start=None, end=None):
+        self.requested.append(after)
+        return ActivityLog([i for i in self.items if after is None or i["time"] >= after], severity=severity, end=end)
+
+
+class CursorTests(unittest.TestCase):
+    def test_items_of_last_time_are_not_repeated_nor_lost(self):
+        inst = FakeInstance("web", [item(1, "one"), item(2, "two")])
+        cursor = logtail.LogCursor(inst)
+        assert [i["description"] for i in cursor.poll()] == ["one", "two"]
+        assert cursor.poll() == []
+        inst.items.append(item(2, "same millisecond"))
+        inst.items.append(item(3, "three"))
+        assert [i["description"] for i in cursor.poll()] == ["same millisecond", "three"]
+        assert inst.requested == [None, 2, 2]
+
+    def test_severity_and_running_workflows(self):
+        inst = FakeInstance("web", [item(1, "launch", "DEBUG", "workflow started"), item(2, "error", "ERROR")])
+        cursor = logtail.LogCursor(inst, severity=["ERROR"], label="web")
+        assert cursor.poll() == [dict(item(2, "error", "ERROR"), instance="web")]
+        assert cursor.running == 1
+        inst.items.append(item(3, "launch", "DEBUG", "workflow finished"))
+        assert cursor.poll() == []
+        assert cursor.running == 0
+        assert "instance" not in inst.items[1]
+
+
+class FilterTests(unittest.TestCase):
+    def test_filters(self):
+        entry = item(1, "Status is Active", source="db")
+        assert logtail.compile_filter()(entry)
+        assert logtail.compile_filter("db")(entry)
+        assert not logtail.compile_filter("Failed")(entry)
+        assert logtail.compile_filter(regex="^INFO\tdb\t")(entry)
+        assert not logtail.compile_filter("Active", regex="Fail")(entry)
+
+
+class FollowTests(unittest.TestCase):
+    def test_interval(self):
+        interval = logtail.PollInterval(1, 5)
+        assert [interval.next(busy) for busy in [False, False, False, False, True, False]] == [2, 4, 5, 5, 1, 2]
+
+    def test_merged_by_time(self):
+        web, db = FakeInstance("web"), FakeInstance("db")
+        cursors = [logtail.LogCursor(web, label="web"), logtail.LogCursor(db, label="db")]
+        platform = Mock()
+        platform.batch.side_effect = Batch
+        shown, delays = [], []
+
+        def sleep(delay):
+            delays.append(delay)
+            if len(delays) == 2:
+                web.items.extend([item(1, "w1"), item(4, "w4", event="workflow started")])
+                db.items.extend([item(2, "d2"), item(3, "d3")])
+
+        logtail.follow(platform, cursors, shown.append, logtail.PollInterval(1, 8), sleep=sleep, rounds=4)
+        assert [[(i["instance"], i["time"]) for i in items] for items in shown] == \
+            [[], [("web", 1), ("db", 2), ("db", 3), ("web", 4)], [], []]
+        assert delays == [2, 4, 1, 1]
+
+
+class LogsCommandTests(unittest.TestCase):
+    def test_filter_and_tail(self):
+        inst = FakeInstance("web", [item(1000, "Status is Launching"), item(2000, "Status is Active"),
+                                    item(3000, "debug", "DEBUG"), item(4000, "Status is Failed")])
+        org = Mock()
+        org.get_instance.return_value = inst
+        platform = MagicMock()
+        platform.get_organization.return_value = org
+        out = StringIO()
+        with patch("qubell.cli.commands.instance._get_platform", return_value=platform), \
+                patch.dict(os.environ, {"NOMI_NAME_INDEX": "off"}):
+            code = runner.run(["--uncolorize", "instance", "logs", "web", "--filter-regex", "Status is [AF]",
+                               "--max-items", "1", "--utctime"], stdout=out, stderr=out)
+        assert code == 0, out.getvalue()
+        assert out.getvalue() == "1970-01-01 00:00:04  INFO  self  status updated  Status is Failed\n"
@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import Mock, patch
+
+from qubell.api.private.exceptions import ApiNotFoundError, NotFoundError
+from qubell.cli.nameindex import FULL_REFRESH_AGE, NameIndex, Resolver, completion, is_enabled
+
+WEB, OLD_WEB, DB = "518000000000000000000001", "518000000000000000000002", "518000000000000000000003"
+
+
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = NameIndex("http://tenant", os.path.join(self.dir, "nomi", "names.sqlite"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_entries_are_per_tenant_and_organization(self):
+        self.index.add("o1", "instance", [(OLD_WEB, "web")])
+        self.index.add("o1", "instance", [(WEB, "web"), (DB, "db")])
+        assert self.index.ids("o1", "instance", "web") == [WEB, OLD_WEB]
+        assert self.index.ids("o2", "instance", "web") == []
+        assert NameIndex("http://other", self.index.path).ids("o1", "instance", "web") == []
+        assert self.index.names("o1", "instance", "w") == ["web"]
+        assert self.index.names("o1", "instance") == ["db", "web"]
+        self.index.forget("o1", "instance", OLD_WEB)
+        assert self.index.ids("o1", "instance", "web") == [WEB]
+
+    def test_replace(self):
+        assert self.index.refreshed_at("o1", "application") is None
+        self.index.add("o1", "application", [("a1", "gone")])
+        self.index.replace("o1", "application", [("a2", "app")])
+        assert self.index.names("o1", "application") == ["app"]
+        assert self.index.refreshed_at("o1", "application") > time.time() - 5
+
+    def test_broken_database_is_ignored(self):
+        broken = NameIndex("http://tenant", self.dir)  # directory is not a database
+        broken.add("o1", "instance", [(WEB, "web")])
+        assert broken.ids("o1", "instance", "web") == []
+
+    def test_switch_and_path_are_separate_settings(self):
+        path = os.path.join(self.dir, "off")
+        with patch.dict(os.environ, {"NOMI_NAME_INDEX": "", "NOMI_NAME_INDEX_PATH": path}):
+            assert is_enabled()
+            assert NameIndex("http://tenant").path == path
+        with patch.dict(os.environ, {"NOMI_NAME_INDEX": "off", "NOMI_NAME_INDEX_PATH": path}):
+            assert not is_enabled()
+
+
+def fake_org(instances):
+    entities = {}
+
+    def entity(organization, id):
+        if id not in entities:
+            e = Mock(id=id)
+            e.init_router.return_value = e
+            e.json.side_effect = lambda: instances[id]
+            entities[id] = e
+        return entities[id]
+
+    # newest instances are listed first, like dashboard sorted by creation
+    newest_first = sorted(instances.items(), reverse=True)
+    org = Mock(organizationId="o1")
+    org.iter_instances_json.side_effect = lambda: iter([dict(i, id=id) for id, i in newest_first
+                                                        if i["status"] != "Destroyed"])
+    return org, entity
+
+
+class ResolverTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = NameIndex("http://tenant", os.path.join(self.dir, "names.sqlite"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def resolver(self, instances):
+        org, entity = fake_org(instances)
+        patcher = patch("qubell.api.private.instance.Instance", side_effect=entity)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return Resolver(org, self.index), org
+
+    def test_ids_are_not_resolved(self):
+        resolver, org = self.resolver({})
+        assert resolver.get("instance", WEB).id == WEB
+        assert not org.iter_instances_json.called
+
+    def test_name_from_index_is_validated(self):
+        instances = {OLD_WEB: {"name": "web", "status": "Destroyed"}, WEB: {"name": "web", "status": "Active"}}
+        resolver, org = self.resolver(instances)
+        self.index.replace("o1", "instance", [(OLD_WEB, "web")])
+        assert resolver.get("instance", "web").id == WEB
+        assert self.index.ids("o1", "instance", "web") == [WEB]
+        org.iter_instances_json.reset_mock()
+        assert resolver.get("instance", "web").id == WEB
+        assert not org.iter_instances_json.called
+
+    def test_incremental_refresh_stops_at_known_instance(self):
+        instances = {WEB: {"name": "web", "status": "Active"}, DB: {"name": "db", "status": "Active"}}
+        resolver, org = self.resolver(instances)
+        self.index.replace("o1", "instance", [(WEB, "web")])
+        assert resolver.get("instance", "db").id == DB
+        self.index.replace("o1", "instance", [(WEB, "web")], refreshed_at=time.time() - FULL_REFRESH_AGE - 1)
+        self.index.forget("o1", "instance", WEB)
+        assert resolver.get("instance", "web").id == WEB
+        assert sorted(self.index.names("o1", "instance")) == ["db", "web"]
+
+    def test_instance_older_than_refresh_is_searched(self):
+        resolver, org = self.resolver({})
+        self.index.replace("o1", "instance", [])
+        org.get_instance.return_value = Mock(id=DB)
+        assert resolver.get("instance", "db").id == DB
+        org.get_instance.assert_called_once_with(name="db")
+        assert self.index.ids("o1", "instance", "db") == [DB]
+
+    def test_missing_application(self):
+        resolver, org = self.resolver({})
+        org.list_applications_json.return_value = [{"id": "a1", "name": "app"}]
+        self.assertRaises(NotFoundError, resolver.get, "application", "other")
+        assert self.index.names("o1", "application") == ["app"]
+
+    def test_removed_entity_is_invalid(self):
+        resolver, _ = self.resolver({})
+        gone = Mock()
+        gone.json.side_effect = ApiNotFoundError("gone")
+        assert not resolver._valid("instance", gone, "web")
+
+
+class CompletionTests(unittest.TestCase):
+    def test_names_of_organization_given_by_name(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "names.sqlite")
+        index = NameIndex("http://tenant", path)
+        index.add("", "organization", [("o1", "my org")])
+        index.add("o1", "instance", [(WEB, "web"), (DB, "db"), (OLD_WEB, "worker")])
+        complete = completion("instance")
+        with patch.dict(os.environ, {"NOMI_NAME_INDEX_PATH": path}):
+            assert complete(None, ["--tenant", "http://tenant", "--organization", "my org", "instance"], "w") == \
+                ["web", "worker"]
+            assert complete(None, ["--tenant", "http://tenant", "--organization", "unknown"], "w") == []
@@ -0,0 +1,94 @@
+import os
+import unittest
+from StringIO import StringIO
+
+import simplejson
+from mock import Mock, patch
+
+from qubell.api.private.organization import Organization
+from qubell.cli import runner
+from qubell.cli.output import writer, write_object
+
+
+def capture(fn, *args):
+    out = StringIO()
+    with patch("sys.stdout", out):
+        fn(*args)
+    return out.getvalue()
+
+
+def write_rows(output, rows, columns=("id", "name")):
+    out = writer(output, list(columns))
+    for row in rows:
+        out.row(row)
+    out.finish()
+
+
+ROWS = [{"id": "1", "name": "first"}, {"id": "2", "name": u"tab\tand\nnew line", "extra": None}]
+
+
+class WriterTests(unittest.TestCase):
+    def test_text_has_no_writer(self):
+        assert writer("text", ["id"]) is None
+
+    def test_json(self):
+        assert simplejson.loads(capture(write_rows, "json", ROWS)) == ROWS
+        assert simplejson.loads(capture(write_rows, "json", [])) == []
+
+    def test_ndjson(self):
+        lines = capture(write_rows, "ndjson", ROWS).splitlines()
+        assert [simplejson.loads(line) for line in lines] == ROWS
+
+    def test_tsv(self):
+        assert capture(write_rows, "tsv", ROWS).splitlines() == ["id\tname", "1\tfirst", "2\ttab\\tand\\nnew line"]
+
+    def test_object(self):
+        obj = {"id": "1", "config": [{"id": "a"}]}
+        assert simplejson.loads(capture(write_object, "json", obj)) == obj
+        assert capture(write_object, "tsv", obj).splitlines() == ["key\tvalue", 'config\t[{"id": "a"}]', "id\t1"]
+
+
+def instances_page(params):
+    offset, to = int(params["from"]), int(params["to"])
+    records = [{"id": str(i), "name": "inst-%s" % i, "status": "Active"} for i in range(250)][offset:to]
+    response = Mock()
+    response.json.return_value = {"groups": [{"records": records}]}
+    return response
+
+
+class IterInstancesTests(unittest.TestCase):
+    def setUp(self):
+        self.org = Organization("org")
+        self.org._router = Mock()
+
+    def test_pages(self):
+        self.org._router.get_instances.side_effect = lambda org_id, params: instances_page(params)
+        instances = self.org.iter_instances_json(page_size=100)
+        assert next(instances)["id"] == "0"
+        assert self.org._router.get_instances.call_count == 1
+        assert len(list(instances)) == 249
+        assert self.org._router.get_instances.call_count == 3
+
+    def test_paging_ignored_by_platform(self):
+        response = Mock()
+        response.json.return_value = [{"id": str(i), "name": "inst"} for i in range(3)]
+        self.org._router.get_instances.return_value = response
+        assert len(list(self.org.iter_instances_json(page_size=2))) == 3
+        assert self.org._router.get_instances.call_count == 2
+
+
+class ListCommandTests(unittest.TestCase):
+    def test_instance_list_streams_rows(self):
+        org = Organization("org")
+        org._router = Mock()
+        org._router.get_instances.side_effect = lambda org_id, params: instances_page(params)
+        platform = Mock()
+        platform.get_organization.return_value = org
+        out = StringIO()
+        with patch("qubell.cli.commands.instance._get_platform", return_value=platform), \
+                patch.dict(os.environ, {"NOMI_NAME_INDEX": "off"}):
+            code = runner.run(["instance", "list", "--output", "ndjson"], stdout=out, stderr=out)
+        assert code == 0
+        rows = [simplejson.loads(line) for line in out.getvalue().splitlines()]
+        assert len(rows) == 250
+        assert rows[0] == {"id": "0", "name": "inst-0", "status": "Active"}
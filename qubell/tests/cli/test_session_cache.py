@@ -0,0 +1,66 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+from qubell.api.provider.router import Router
+from qubell.cli.session import SessionCache, session_user
+
+
+class SessionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = SessionCache(os.path.join(self.dir, "sessions"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        self.cache.save("http://tenant", "user", {"cookies": {"PLAY_SESSION": "s1"}, "expires_at": None})
+        assert self.cache.load("http://tenant", "user") == {"cookies": {"PLAY_SESSION": "s1"}, "expires_at": None}
+        assert self.cache.load("http://tenant", "other") is None
+        assert self.cache.load("http://other", "user") is None
+
+    def test_file_is_private(self):
+        self.cache.save("http://tenant", "user", {"jwt": "t", "expires_at": time.time() + 3600})
+        [name] = os.listdir(self.cache.path)
+        mode = stat.S_IMODE(os.stat(os.path.join(self.cache.path, name)).st_mode)
+        assert mode == 0600
+        assert stat.S_IMODE(os.stat(self.cache.path).st_mode) == 0700
+
+    def test_expired_session_is_dropped(self):
+        self.cache.save("http://tenant", "user", {"jwt": "t", "expires_at": time.time() + 10})
+        assert self.cache.load("http://tenant", "user") is None
+        assert os.listdir(self.cache.path) == []
+
+    def test_ttl_for_unknown_expiration(self):
+        self.cache.save("http://tenant", "user", {"cookies": {"PLAY_SESSION": "s1"}, "expires_at": None})
+        with patch("time.time", return_value=time.time() + self.cache.ttl):
+            assert self.cache.load("http://tenant", "user") is None
+
+    def test_refresh_token_is_not_stored_as_key(self):
+        assert "secret" not in session_user("user", "secret")
+        assert session_user("user") == "user"
+
+
+class RouterSessionStateTests(unittest.TestCase):
+    def test_cookies_restored_without_sign_in(self):
+        router = Router("http://tenant")
+        with patch.object(router._session, "post") as post:
+            router.restore_session({"cookies": {"PLAY_SESSION": "s1"}}, "user", "password")
+            assert not post.called
+        assert router.is_connected
+        assert router._creds == ("user", "password")
+        assert router.session_state()["cookies"] == {"PLAY_SESSION": "s1"}
+
+    def test_jwt_restored_with_expiration(self):
+        router = Router("http://tenant")
+        expires_at = time.time() + 3600
+        router.restore_session({"jwt": "token", "expires_at": expires_at}, refresh_token="refresh")
+        self.addCleanup(router.close)
+        assert router.is_connected
+        assert router.session_state() == {"jwt": "token", "expires_at": expires_at}
@@ -0,0 +1,42 @@
+import subprocess
+import sys
+import unittest
+
+import simplejson
+
+HEAVY_MODULES = ["requests", "yaml", "qubell.api.private.platform", "qubell.api.provider.router", "qubell.cli.commands"]
+
+PROBE = """
+import sys, time, json
+started = time.time()
+import qubell.cli.__main__
+elapsed = time.time() - started
+json.dump({"elapsed": elapsed, "modules": sorted(m for m in sys.modules if sys.modules[m])}, sys.stdout)
+"""
+
+
+def measure_import():
+    """
+    Imports nomi in fresh interpreter
+    :return: (seconds, names of loaded modules)
+    """
+    output = subprocess.check_output([sys.executable, "-c", PROBE])
+    result = simplejson.loads(output)
+    return result["elapsed"], result["modules"]
+
+
+class StartupTests(unittest.TestCase):
+    def test_api_is_not_imported_on_startup(self):
+        elapsed, modules = measure_import()
+        loaded = [m for m in modules for heavy in HEAVY_MODULES if m == heavy or m.startswith(heavy + ".")]
+        assert not loaded, "loaded on startup: %s" % loaded
+
+    def test_command_group_is_loaded_on_demand(self):
+        output = subprocess.check_output([sys.executable, "-m", "qubell.cli", "instance", "--help"])
+        assert "wait-status" in output
+
+
+if __name__ == '__main__':
+    # benchmark: python -m qubell.tests.cli.test_startup
+    timings = sorted(measure_import()[0] for _ in range(10))
+    print "nomi import time, sec: min %.3f median %.3f max %.3f" % (timings[0], timings[5], timings[-1])
@@ -0,0 +1,46 @@
+import threading
+import unittest
+
+from mock import Mock, patch
+
+from qubell.api.private import exceptions
+from qubell.api.private.exceptions import ApiAuthenticationError
+from qubell.api.private.platform import QubellPlatform
+from qubell.api.provider.batch import DEFAULT_MAX_IN_FLIGHT
+from qubell.api.provider.router import Router
+
+
+class BackendsVersionsTests(unittest.TestCase):
+    def setUp(self):
+        self.platform = QubellPlatform().init_router(Router("http://nowhere.com"))
+        self.asked = []
+        self.lock = threading.Lock()
+
+    def organization(self, backends):
+        org = Mock()
+
+        def read():
+            with self.lock:
+                self.asked.append(org)
+            if backends is None:
+                raise ApiAuthenticationError("forbidden")
+            return backends
+        org.environments = {'default': Mock()}
+        type(org.environments['default']).backends = property(lambda self: read())
+        return org
+
+    def test_first_readable_organization_wins(self):
+        closed = [self.organization(None) for _ in range(DEFAULT_MAX_IN_FLIGHT)]
+        first = self.organization([{'name': 'api', 'version': '1'}])
+        second = self.organization([{'name': 'api', 'version': '2'}])
+        rest = [self.organization([]) for _ in range(DEFAULT_MAX_IN_FLIGHT - 2)]
+        later = [self.organization([]) for _ in range(DEFAULT_MAX_IN_FLIGHT)]
+        with patch.object(QubellPlatform, "organizations", closed + [first, second] + rest + later):
+            assert self.platform.get_backends_versions() == {'api': '1'}
+        assert second in self.asked  # same wave is asked concurrently
+        assert not set(later) & set(self.asked)  # next wave is not
+
+    def test_no_readable_organization(self):
+        with patch.object(QubellPlatform, "organizations", [self.organization(None), self.organization(None)]):
+            self.assertRaises(exceptions.NotFoundError, self.platform.get_backends_versions)
+        assert len(self.asked) == 2
@@ -1,6 +1,9 @@
 import unittest
 
-from qubell.api.tools import retry
+from mock import Mock, patch
+
+from qubell.api.private.exceptions import ApiCircuitOpenError, ApiThrottledError
+from qubell.api.tools import retry, waitForStatus
 
 
 class RetryTest(unittest.TestCase):
@@ -112,4 +115,45 @@ class RetryTest(unittest.TestCase):
 
         with self.assertRaises(TypeError):
             return_smth()
-        self.assertEqual(self.counter.i, 6)
\ No newline at end of file
+        self.assertEqual(self.counter.i, 6)
+
+    def test_retry_after_delays_only_next_try(self):
+
+        @retry(4, 1, 2)
+        def return_smth():
+            self.counter.i += 1
+            if self.counter.i == 1:
+                raise ApiThrottledError("slow down", retry_after=60)
+            return self.counter.i == 4
+
+        with patch("time.sleep") as sleep:
+            assert return_smth()
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 60, 4, 8])
+
+
+class WaitForStatusTest(unittest.TestCase):
+    def instance(self, *reads):
+        instance = Mock(_is_projection_updated_instance=Mock(return_value=True))
+        instance.name = "web"
+        reads = list(reads)
+
+        def read_status():
+            read = reads.pop(0)
+            if isinstance(read, Exception):
+                raise read
+            return read
+        type(instance).status = property(lambda self: read_status())
+        return instance
+
+    def test_open_circuit_on_entry_and_at_timeout(self):
+        instance = self.instance(ApiCircuitOpenError("open", retry_after=30), 'Active',  # projection update
+                                 'Active',  # waiter
+                                 ApiCircuitOpenError("open", retry_after=30), 'Active')  # final check
+        with patch("time.sleep") as sleep:
+            assert waitForStatus(instance, final='Active', timeout=(3, 1, 1))
+        assert [call[0][0] for call in sleep.call_args_list].count(30) == 2
+
+    def test_circuit_open_until_timeout(self):
+        instance = self.instance(*[ApiCircuitOpenError("open", retry_after=1)] * 30)
+        with patch("time.sleep"):
+            assert waitForStatus(instance, final='Active', timeout=(3, 1, 1)) is False
@@ -0,0 +1,108 @@
+import itertools
+import threading
+import unittest
+
+from mock import Mock
+
+from qubell.api.provider.batch import Batch
+from qubell.monitor.driver import EventLoopDriver
+from qubell.monitor.stats import PHASES
+
+
+class FakeInstance(object):
+    def __init__(self, platform, id):
+        self.platform = platform
+        self.instanceId = id
+
+    def reschedule_workflow(self, workflow_name, timestamp):
+        assert workflow_name == 'destroy'
+        self.platform.advance(self.instanceId, 'Destroying', 'Destroyed')
+
+    def force_remove(self):
+        with self.platform.lock:
+            self.platform.removed.append(self.instanceId)
+
+
+class FakePlatform(object):
+    """
+    Instances move to next status on every dashboard query
+    """
+
+    def __init__(self, statuses=('Requested', 'Launching', 'Active')):
+        self.statuses = statuses
+        self.instances = {}
+        self.removed = []
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def advance(self, id, *statuses):
+        with self.lock:
+            self.instances[id] = list(statuses)
+
+    def launch(self, environment):
+        instance = FakeInstance(self, "%024x" % next(self.ids))
+        self.advance(instance.instanceId, *self.statuses)
+        return instance
+
+    def list_instances_json(self, application):
+        with self.lock:
+            self.queries += 1
+            listed = []
+            for id, statuses in self.instances.items():
+                status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+                if status != 'Destroyed':
+                    listed.append({'id': id, 'status': status})
+            return listed
+
+    def monitor(self):
+        org = Mock(list_instances_json=self.list_instances_json)
+        org._router.batch.side_effect = Batch
+        return Mock(org=org, app=Mock(launch=self.launch), destroy_interval="100000")
+
+
+def driver(platform, **kwargs):
+    load = EventLoopDriver(platform.monitor(), poll_interval=0.01, **kwargs)
+    load.tick = 0.005
+    return load
+
+
+class EventLoopDriverTests(unittest.TestCase):
+    def test_cycles_share_polling(self):
+        platform = FakePlatform()
+        load = driver(platform, concurrency=50, cycles=2)
+        samples = load.run()
+        assert len(samples) == 100
+        assert all(s.ok for s in samples), [s.error for s in samples if not s.ok][:1]
+        assert all(sorted(s.phases) == sorted(PHASES) for s in samples)
+        assert len(platform.removed) == 100
+        assert platform.queries == load.polls < 100
+        assert load.summary()["count"] == 100
+
+    def test_arrival_rate(self):
+        platform = FakePlatform()
+        samples = driver(platform, rate=6000, cycles=5).run()
+        assert sorted(s.worker for s in samples) == [0, 1, 2, 3, 4]
+
+    def test_failures(self):
+        platform = FakePlatform(statuses=('Requested', 'Error'))
+        samples = driver(platform, concurrency=2).run()
+        assert [s.ok for s in samples] == [False, False]
+        assert "Monitor didn't get Active state" in samples[0].error
+        assert sorted(samples[0].phases) == ["accepted", "launching"]
+
+    def test_timeout(self):
+        platform = FakePlatform(statuses=('Requested',))
+        samples = driver(platform, timeout=0.001).run()
+        assert not samples[0].ok
+        assert "didn't get launching" in samples[0].error
+
+    def test_failed_launch(self):
+        platform = FakePlatform()
+        monitor = platform.monitor()
+        monitor.app.launch = Mock(side_effect=AssertionError("Environment didn't get Online status"))
+        load = EventLoopDriver(monitor, poll_interval=0.01)
+        load.tick = 0.005
+        samples = load.run()
+        assert samples[0].error == "AssertionError: Environment didn't get Online status"
+        assert load.polls == 0
@@ -0,0 +1,138 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from qubell.monitor.load import LoadGenerator, arrival_time
+from qubell.monitor.stats import Phases, Sample, format_phases, format_summary, histogram, percentile, summarize, \
+    write_report
+
+
+class FakeMonitor(object):
+    def __init__(self, shared=None):
+        self.shared = shared or {"launches": 0, "in_flight": 0, "max_in_flight": 0, "lock": threading.Lock()}
+        self.status = False
+        self.phases = None
+
+    def clone(self):
+        return FakeMonitor(self.shared)
+
+    def launch(self, timeout):
+        self.phases = Phases()
+        self.phases.mark("accepted")
+        shared = self.shared
+        with shared["lock"]:
+            shared["launches"] += 1
+            shared["in_flight"] += 1
+            shared["max_in_flight"] = max(shared["max_in_flight"], shared["in_flight"])
+            number = shared["launches"]
+        threading.Event().wait(0.01)
+        with shared["lock"]:
+            shared["in_flight"] -= 1
+        if number % 4 == 0:
+            raise AssertionError("Monitor didn't get Active state")
+        self.phases.mark("launching")
+        self.phases.mark("active")
+        self.status = True
+
+
+class StatsTests(unittest.TestCase):
+    def test_percentile(self):
+        values = range(1, 101)
+        assert [percentile(values, p) for p in [50, 90, 99, 100]] == [50, 90, 99, 100]
+        assert percentile([7], 99) == 7
+        assert percentile([], 50) is None
+
+    def test_summary(self):
+        samples = [Sample(0, 0, d, True) for d in [3.0, 1.0, 2.0]] + [Sample(1, 0, 9.0, False, "error")]
+        summary = summarize(samples, 60)
+        assert summary["count"] == 4
+        assert summary["error_rate"] == 0.25
+        assert summary["throughput"] == 3.0
+        assert (summary["min"], summary["p50"], summary["mean"], summary["max"]) == (1.0, 2.0, 2.0, 3.0)
+        assert "p99: 3.0s" in format_summary(summary)
+        assert "p50: -" in format_summary(summarize([], 0))
+
+    def test_reports(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        samples = [Sample(0, 10, 1.5, True, phases={"accepted": 0.5, "launching": 1.0}),
+                   Sample(1, 11, 2.5, False, "AssertionError: timeout")]
+        summary = summarize(samples, 10)
+        write_report(os.path.join(directory, "load.csv"), samples, summary)
+        write_report(os.path.join(directory, "load.json"), samples, summary)
+        with open(os.path.join(directory, "load.csv")) as f:
+            rows = list(csv.reader(f))
+        assert rows == [["worker", "started", "duration", "ok", "error", "accepted", "launching", "active",
+                         "destroy_scheduled", "destroyed", "removed"],
+                        ["0", "10.000", "1.500", "1", "", "0.500", "1.000", "", "", "", ""],
+                        ["1", "11.000", "2.500", "0", "AssertionError: timeout", "", "", "", "", "", ""]]
+        with open(os.path.join(directory, "load.json")) as f:
+            report = json.load(f)
+        assert report["summary"]["errors"] == 1
+        assert report["samples"][1]["error"] == "AssertionError: timeout"
+        assert report["summary"]["phases"]["launching"]["count"] == 1
+
+    def test_phases(self):
+        times = iter([100, 101, 103.5])
+        phases = Phases(clock=lambda: next(times))
+        phases.mark("accepted")
+        phases.mark("launching")
+        assert phases.durations() == {"accepted": 1, "launching": 2.5}
+
+    def test_histogram(self):
+        assert histogram([0.5, 1, 1.5, 7, 1000], [1, 2, 5]) == [[1, 2], [2, 1], [5, 0], [None, 2]]
+
+    def test_phase_summary(self):
+        samples = [Sample(0, 0, 3, True, phases={"accepted": 0.2, "active": a}) for a in [10, 40, 50]]
+        samples.append(Sample(1, 0, 1, False, "error", phases={"accepted": 0.3}))
+        phases = summarize(samples, 60)["phases"]
+        assert sorted(phases) == ["accepted", "active"]
+        assert (phases["accepted"]["count"], phases["accepted"]["max"]) == (4, 0.3)
+        assert (phases["active"]["p50"], phases["active"]["p99"]) == (40, 50)
+        assert [c for b, c in phases["active"]["histogram"] if c] == [1, 2]
+        text = format_phases({"phases": phases}, width=4)
+        assert text.splitlines()[0] == "accepted: count: 4, p50: 0.2s, p90: 0.3s, p99: 0.3s, max: 0.3s"
+        assert "  <= 60s    ####" in text
+
+
+class LoadGeneratorTests(unittest.TestCase):
+    def test_arrival_time(self):
+        assert [arrival_time(n, 60) for n in range(3)] == [0, 1, 2]
+        # rate grows to 1/s in 10s, so 5 arrivals fit in ramp up
+        assert [round(arrival_time(n, 60, 10), 3) for n in [0, 5, 6]] == [0, 10, 11]
+        assert round(arrival_time(1, 60, 10), 3) == round(20 ** 0.5, 3)
+
+    def test_workers_repeat_cycles(self):
+        monitor = FakeMonitor()
+        published = []
+        load = LoadGenerator(monitor, concurrency=3, cycles=4, on_sample=published.append)
+        samples = load.run()
+        assert len(samples) == 12
+        assert sorted(published) == sorted(samples)
+        assert sorted(set(s.worker for s in samples)) == [0, 1, 2]
+        assert monitor.shared["max_in_flight"] <= 3
+        summary = load.summary()
+        assert summary["errors"] == 3
+        assert "AssertionError" in [s.error for s in samples if not s.ok][0]
+        # failed cycles keep phases reached before failure
+        assert all("accepted" in s.phases and ("active" in s.phases) == s.ok for s in samples)
+
+    def test_cycles_or_duration_is_required(self):
+        self.assertRaises(ValueError, LoadGenerator, FakeMonitor(), cycles=None)
+
+    def test_duration_limits_cycles(self):
+        load = LoadGenerator(FakeMonitor(), concurrency=2, cycles=None, duration=0.05)
+        samples = load.run()
+        assert 2 <= len(samples) <= 20
+        assert load.elapsed >= 0.05
+
+    def test_arrival_rate(self):
+        slept = []
+        load = LoadGenerator(FakeMonitor(), rate=6000, cycles=5, sleep=lambda s: slept.append(s))
+        samples = load.run()
+        assert sorted(s.worker for s in samples) == [0, 1, 2, 3, 4]
+        assert all(s <= 0.04 for s in slept)
@@ -0,0 +1,90 @@
+import time
+import unittest
+
+from mock import Mock, patch
+
+from qubell.api.provider import HISTOGRAM_BOUNDS, histogram_percentile, route, _routes_stat
+from qubell.api.provider.router import Router
+from qubell.monitor.prober import Probe, Prober, default_probes, window
+
+
+def gen_response(code=200, body=None):
+    return Mock(status_code=code, text="", json=Mock(return_value=body))
+
+
+class ProbedRouter(Router):
+    @property
+    def is_connected(self): return True
+
+    @route("GET /probed/{some_id}")
+    def get_probed(self, some_id): pass
+
+
+class HistogramTests(unittest.TestCase):
+    def test_percentile(self):
+        histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        histogram[0], histogram[3], histogram[-1] = 90, 9, 1
+        assert [histogram_percentile(histogram, p) for p in [50, 90, 99, 100]] == [10, 10, 100, 10000]
+        assert histogram_percentile([0] * len(histogram), 50) is None
+
+    def test_window(self):
+        before = {"count": 2, "total": 30, "histogram": [1, 1, 0]}
+        after = {"count": 5, "total": 100, "histogram": [2, 1, 2]}
+        assert window(before, after) == {"count": 3, "total": 70, "histogram": [1, 0, 2]}
+        assert window(None, after)["histogram"] == [2, 1, 2]
+
+
+@patch("requests.Session.request", create=True)
+class ProberTests(unittest.TestCase):
+    def setUp(self):
+        _routes_stat.pop("GET /probed/{some_id}", None)
+        self.router = ProbedRouter("http://nowhere.com")
+
+    def test_route_histogram(self, request_mock):
+        request_mock.return_value = gen_response()
+        self.router.get_probed(some_id="1")
+        histogram = _routes_stat["GET /probed/{some_id}"]["histogram"]
+        assert len(histogram) == len(HISTOGRAM_BOUNDS) + 1
+        assert histogram[0] == 1 and sum(histogram) == 1
+
+    def test_report_covers_calls_since_previous_one(self, request_mock):
+        def slow_every_second(*args, **kwargs):
+            if request_mock.call_count % 2 == 0:
+                time.sleep(0.03)
+            return gen_response()
+        request_mock.side_effect = slow_every_second
+        self.router.get_probed(some_id="before prober")
+        publisher = Mock()
+        probe = Probe("probed", "GET /probed/{some_id}", lambda: self.router.get_probed(some_id="1"))
+        prober = Prober([probe], publisher, interval=0, report_interval=1000, tags={"zone": "z1"})
+        assert prober.run(rounds=4) == 4
+        published = dict((args[0], args[1]) for args, _ in publisher.publish.call_args_list)
+        assert published["monitor.api.count"] == 4
+        assert published["monitor.api.errors"] == 0
+        assert (published["monitor.api.p50"], published["monitor.api.p99"]) == (10, 50)
+        assert publisher.publish.call_args[0][2] == {"zone": "z1", "probe": "probed"}
+        assert prober.report() == {"probed": {"count": 0, "errors": 0, "avg": None,
+                                              "p50": None, "p90": None, "p99": None}}
+
+    def test_failures_are_counted(self, request_mock):
+        request_mock.return_value = gen_response(500)
+        failing = Probe("failing", "GET /probed/{some_id}", lambda: self.router.get_probed(some_id="1"))
+        unreachable = Probe("unreachable", "GET /nowhere", Mock(side_effect=IOError("refused")))
+        prober = Prober([failing, unreachable], sleep=Mock())
+        prober.probe()
+        prober.probe()
+        report = prober.report()
+        assert (report["failing"]["count"], report["failing"]["errors"]) == (2, 2)
+        assert report["unreachable"]["errors"] == 2
+
+    def test_default_probes(self, request_mock):
+        router = Mock()
+        router.get_instances.return_value = gen_response(body={"groups": [{"records": [{"id": "i1"}]}]})
+        probes = default_probes(router, "o1", "e1")
+        assert [p.name for p in probes] == ["organizations", "dashboard", "environment", "activitylog"]
+        for p in probes:
+            p.call()
+        router.get_environment.assert_called_once_with(org_id="o1", env_id="e1")
+        router.get_instance_activitylog.assert_called_once_with(org_id="o1", instance_id="i1", params={"max": 20})
+        router.get_instances.return_value = gen_response(body={"groups": []})
+        assert [p.name for p in default_probes(router, "o1")] == ["organizations", "dashboard"]
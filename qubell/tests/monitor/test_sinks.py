@@ -0,0 +1,147 @@
+import BaseHTTPServer
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+from mock import Mock, patch
+
+from qubell.monitor.sinks import AsyncPublisher, DatadogSink, JsonLinesSink, LastValueSink, Metric, \
+    PrometheusSink, Sink, StatsdSink, publish_results, result_tags, sinks_from_env
+
+
+class Pushgateway(BaseHTTPServer.HTTPServer):
+    def __init__(self):
+        self.requests = []
+        outer = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_POST(self):
+                outer.requests.append((self.path, self.rfile.read(int(self.headers["Content-Length"]))))
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s" % self.server_port
+
+
+class Failing(Sink):
+    def send(self, metrics):
+        raise IOError("unreachable")
+
+
+class SinksTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_json_lines(self):
+        path = os.path.join(self.dir, "metrics.jsonl")
+        sink = JsonLinesSink(path)
+        sink.send([Metric("monitor.p50", 12.5, 100, {"zone": "z1"})])
+        sink.send([Metric("monitor.p90", 20, 101)])
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert lines == [{"metric": "monitor.p50", "value": 12.5, "timestamp": 100, "tags": {"zone": "z1"}},
+                         {"metric": "monitor.p90", "value": 20, "timestamp": 101, "tags": {}}]
+
+    def test_last_value(self):
+        path = os.path.join(self.dir, "perfrep.z1")
+        LastValueSink(path).send([Metric("monitor.execution_duration", 42), Metric("monitor.p50", 1)])
+        with open(path) as f:
+            assert f.read() == "seconds\n42\n"
+
+    def test_prometheus_textfile_keeps_last_value_of_series(self):
+        path = os.path.join(self.dir, "monitor.prom")
+        sink = PrometheusSink(path)
+        sink.send([Metric("monitor.p50", 1, tags={"zone": "z1"}), Metric("monitor.p50", 2, tags={"zone": "z2"})])
+        sink.send([Metric("monitor.p50", 3, tags={"zone": "z1"}), Metric("monitor.error_rate", 0.5)])
+        with open(path) as f:
+            assert f.read() == ('# TYPE monitor_error_rate gauge\n'
+                                'monitor_error_rate 0.5\n'
+                                '# TYPE monitor_p50 gauge\n'
+                                'monitor_p50{zone="z1"} 3.0\n'
+                                'monitor_p50{zone="z2"} 2.0\n')
+        assert os.listdir(self.dir) == ["monitor.prom"]
+
+    def test_pushgateway(self):
+        gateway = Pushgateway()
+        self.addCleanup(gateway.server_close)
+        self.addCleanup(gateway.shutdown)
+        PrometheusSink(url=gateway.url + "/").send([Metric("monitor.p99", 7, tags={"zone": 'a "b"'})])
+        assert gateway.requests == [("/metrics/job/qubell_monitor",
+                                     '# TYPE monitor_p99 gauge\nmonitor_p99{zone="a \\"b\\""} 7.0\n')]
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        port = server.getsockname()[1]
+        metric = Metric("monitor.p50", 12.5, tags={"zone": "z1", "stack": "dev"})
+        for sink in [StatsdSink("127.0.0.1", port, prefix="qubell."), StatsdSink("127.0.0.1", port, dogstatsd=True)]:
+            sink.send([metric])
+            sink.close()
+        assert server.recv(1024) == "qubell.monitor.p50:12.5|g"
+        assert server.recv(1024) == "monitor.p50:12.5|g|#stack:dev,zone:z1"
+
+    def test_datadog(self):
+        datadog = Mock()
+        with patch.dict(sys.modules, {"datadog": datadog}):
+            sink = DatadogSink("api", "app", host="monitor-host", suffix_tag="zone")
+            sink.send([Metric("monitor.execution_duration", 42, 100, {"zone": "z1", "stack": "dev"})])
+        datadog.initialize.assert_called_once_with(api_key="api", app_key="app")
+        datadog.api.Metric.send.assert_called_once_with(metrics=[{
+            "metric": "monitor.execution_duration.z1", "points": [(100, 42)], "host": "monitor-host",
+            "tags": ["stack:dev", "zone:z1"]}])
+
+    def test_sinks_from_env(self):
+        jsonl = os.path.join(self.dir, "metrics.jsonl")
+        sinks = sinks_from_env("z1", {"RESULT_JSONL": jsonl, "RESULT_STATSD": "localhost"})
+        assert [s.__class__ for s in sinks] == [LastValueSink, JsonLinesSink, StatsdSink]
+        assert sinks[0].path == "perfrep.z1"
+        assert sinks[2].address == ("localhost", 8125)
+        assert sinks_from_env("z1", {"RESULT_FILE": ""}) == []
+        assert result_tags("z1", {}) == {"stack": "dev", "tenant": "staging", "zone": "z1"}
+        assert result_tags("z1", {"RESULT_TAGS": "team:qa"}) == {"team": "qa", "zone": "z1"}
+
+
+class AsyncPublisherTests(unittest.TestCase):
+    def test_flush_on_close_and_failing_sink(self):
+        sink = Mock(spec=Sink)
+        publisher = AsyncPublisher([Failing(), sink], flush_interval=60)
+        publish_results(publisher, 42, {"zone": "z1"}, {"error_rate": 0.0, "throughput": 2.0, "p50": 40,
+                                                        "p90": None, "p99": 50})
+        publisher.close()
+        metrics = [m for call in sink.send.call_args_list for m in call[0][0]]
+        assert [(m.name, m.value) for m in metrics] == [
+            ("monitor.execution_duration", 42), ("monitor.error_rate", 0.0), ("monitor.throughput", 2.0),
+            ("monitor.p50", 40), ("monitor.p99", 50)]
+        assert metrics[0].tags == {"zone": "z1"}
+        sink.close.assert_called_once_with()
+
+    def test_publish_does_not_wait_for_sink(self):
+        release = threading.Event()
+        sent = []
+        sink = Mock(spec=Sink)
+        sink.send.side_effect = lambda metrics: release.wait(5) and sent.extend(metrics)
+        publisher = AsyncPublisher([sink], flush_interval=0.01, max_batch=1, max_buffer=2)
+        for value in range(10):
+            publisher.publish("monitor.cycle_duration", value)
+        assert publisher.dropped >= 1  # first metric is taken by sink, buffer holds two more
+        release.set()
+        publisher.close()
+        assert len(sent) == 10 - publisher.dropped
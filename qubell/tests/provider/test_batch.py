@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+
+from qubell.api.provider.batch import Batch, parallel_map
+from qubell.api.provider.router import Router
+
+
+class BatchTests(unittest.TestCase):
+
+    def test_results_in_order(self):
+        def slow_square(x):
+            time.sleep(0.01 * (5 - x))
+            return x * x
+
+        with Batch(max_in_flight=5) as batch:
+            calls = batch.map(slow_square, range(5))
+        assert [call.result() for call in calls] == [0, 1, 4, 9, 16]
+
+    def test_errors_are_captured_per_call(self):
+        def fail_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+
+        with Batch(max_in_flight=2) as batch:
+            calls = batch.map(fail_odd, range(4))
+        assert calls[0].result() == 0
+        assert isinstance(calls[1].exception(), ValueError)
+        self.assertRaises(ValueError, calls[3].result)
+        assert calls[2].exception() is None
+
+    def test_max_in_flight_is_respected(self):
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        def track(_):
+            with lock:
+                state["current"] += 1
+                state["peak"] = max(state["peak"], state["current"])
+            time.sleep(0.01)
+            with lock:
+                state["current"] -= 1
+
+        with Batch(max_in_flight=3) as batch:
+            batch.map(track, range(12))
+        assert state["peak"] <= 3
+        assert len(batch._workers or []) == 0
+
+    def test_finished_calls_are_not_kept(self):
+        release = threading.Event()
+        with Batch(max_in_flight=2) as batch:
+            batch.map(lambda x: x, range(10))
+            batch.wait()
+            assert not batch._pending
+            slow = batch.submit(release.wait, 5)
+            assert batch._pending == set([slow])
+            release.set()
+            batch.wait()
+            assert slow.done() and not batch._pending
+
+    def test_parallel_map_return_exceptions(self):
+        def check(x):
+            assert x, "zero"
+            return x
+
+        results = parallel_map(check, [1, 0, 2], return_exceptions=True)
+        assert results[0] == 1 and results[2] == 2
+        assert isinstance(results[1], AssertionError)
+        self.assertRaises(AssertionError, parallel_map, check, [1, 0, 2])
+
+    def test_router_pool_fits_max_in_flight(self):
+        router = Router("http://nowhere.com")
+        router.batch(max_in_flight=32)
+        assert router._session.get_adapter("http://nowhere.com")._pool_maxsize == 32
@@ -0,0 +1,109 @@
+import time
+import unittest
+
+import requests
+from mock import patch
+
+from qubell.api.private.exceptions import ApiCircuitOpenError, ApiThrottledError
+from qubell.api.provider import route, _routes_stat
+from qubell.api.provider.breaker import CircuitBreaker, CIRCUIT_BREAKERS, CLOSED, OPEN, HALF_OPEN
+from qubell.api.provider.ratelimit import RATE_LIMITER
+from qubell.api.provider.router import Router
+from qubell.api.tools import retry
+from qubell.tests.provider.test_response_cache import gen_response
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=4)
+        for success in [True, False, True]:
+            breaker.record(success)
+        assert breaker.state == CLOSED
+        breaker.record(False)
+        assert breaker.state == OPEN
+        self.assertRaises(ApiCircuitOpenError, breaker.before)
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker(slow_call=100, slow_rate=0.5, min_calls=2)
+        breaker.record(True, 500)
+        breaker.record(True, 500)
+        assert breaker.state == OPEN
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.05)
+        breaker.record(False)
+        assert breaker.state == OPEN
+        self.assertRaises(ApiCircuitOpenError, breaker.before)
+        time.sleep(0.06)
+        breaker.before()  # probe is allowed
+        assert breaker.state == HALF_OPEN
+        self.assertRaises(ApiCircuitOpenError, breaker.before)  # only one probe at once
+        breaker.record(True)
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_opens_again(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0)
+        breaker.record(False)
+        breaker.before()
+        breaker.record(False)
+        assert breaker.state == OPEN
+
+    def test_retry_backs_off(self):
+        calls = []
+
+        @retry(3, 0, 1)
+        def poller():
+            calls.append(1)
+            raise ApiCircuitOpenError("open", retry_after=0.01)
+
+        assert poller() is False
+        assert len(calls) == 3
+
+
+@patch("requests.Session.request", create=True)
+class RouteCircuitTests(unittest.TestCase):
+
+    class DummyRouter(Router):
+        @route("GET /flaky/{some_id}")
+        def get_flaky(self, some_id): pass
+
+    def setUp(self):
+        CIRCUIT_BREAKERS.enable("GET /flaky/*", min_calls=2, cooldown=60)
+        self.router = self.DummyRouter("http://nowhere.com", verify_codes=False)
+
+    def tearDown(self):
+        CIRCUIT_BREAKERS.clear()
+        RATE_LIMITER.clear()
+
+    def test_fail_fast_on_5xx(self, request_mock):
+        request_mock.return_value = gen_response(503)
+        self.router.get_flaky(some_id="1")
+        self.router.get_flaky(some_id="1")
+        self.assertRaises(ApiCircuitOpenError, self.router.get_flaky, some_id="1")
+        assert request_mock.call_count == 2
+        assert _routes_stat["GET /flaky/{some_id}"]["circuit"] == OPEN
+
+    @patch("time.sleep")
+    def test_connection_errors_are_failures(self, sleep_mock, request_mock):
+        request_mock.side_effect = requests.ConnectionError("down")
+        for _ in range(2):
+            self.assertRaises(requests.ConnectionError, self.router.get_flaky, some_id="1")
+        assert CIRCUIT_BREAKERS.states() == {"GET /flaky/{some_id}": OPEN}
+
+    def test_open_circuit_takes_no_rate_limit_tokens(self, request_mock):
+        request_mock.return_value = gen_response(503)
+        self.router.get_flaky(some_id="1")
+        self.router.get_flaky(some_id="1")
+        RATE_LIMITER.limit(1, route="GET /flaky/*", block=False)
+        for _ in range(3):
+            self.assertRaises(ApiCircuitOpenError, self.router.get_flaky, some_id="1")
+        assert RATE_LIMITER._rules[0].bucket(None).take(block=False) == 0
+
+    def test_throttled_probe_is_released(self, request_mock):
+        breaker = CIRCUIT_BREAKERS.get("GET /flaky/{some_id}")
+        breaker.state, breaker._opened_at = OPEN, 0
+        RATE_LIMITER.limit(1, route="GET /flaky/*", block=False)
+        RATE_LIMITER.acquire("GET /flaky/{some_id}")
+        self.assertRaises(ApiThrottledError, self.router.get_flaky, some_id="1")
+        assert breaker.state == HALF_OPEN and not breaker._probing
+        breaker.before()  # next call probes at once
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from qubell.api.private.exceptions import ApiThrottledError
+from qubell.api.provider import route, _routes_stat
+from qubell.api.provider.ratelimit import TokenBucket, RateLimiter, RATE_LIMITER, from_config
+from qubell.api.provider.router import Router
+from qubell.tests.provider.test_response_cache import gen_response
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_is_free(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+
+    def test_non_blocking_returns_wait_without_taking(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.take()
+        wait = bucket.take(block=False)
+        assert 0 < wait <= 0.1
+        time.sleep(wait)
+        assert bucket.take(block=False) == 0
+
+    def test_rate_across_threads(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        started = time.time()
+        threads = [threading.Thread(target=bucket.take) for _ in range(11)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert time.time() - started >= 0.09
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_route_pattern(self):
+        limiter = RateLimiter().limit(1, route="POST .../launch", block=False)
+        launch = "POST /organizations/{org_id}/applications/{app_id}/launch{ctype}"
+        limiter.acquire(launch, "org")
+        self.assertRaises(ApiThrottledError, limiter.acquire, launch, "org")
+        assert limiter.acquire("GET /organizations/{org_id}{ctype}", "org") == 0
+
+    def test_each_organization_has_own_bucket(self):
+        limiter = RateLimiter().limit(1, organization="*", block=False)
+        limiter.acquire("GET /x", "org1")
+        limiter.acquire("GET /x", "org2")
+        try:
+            limiter.acquire("GET /x", "org1")
+            assert False, "should be throttled"
+        except ApiThrottledError as e:
+            assert e.retry_after > 0
+
+    def test_specific_organization(self):
+        limiter = RateLimiter().limit(1, organization="org1", block=False)
+        for _ in range(3):
+            limiter.acquire("GET /x", "org2")
+
+    def test_throttled_call_takes_no_tokens(self):
+        limiter = RateLimiter().limit(10, burst=1).limit(1, route="POST .../launch", block=False)
+        launch = "POST /organizations/{org_id}/applications/{app_id}/launch{ctype}"
+        limiter.acquire(launch, "org")
+        time.sleep(0.1)
+        self.assertRaises(ApiThrottledError, limiter.acquire, launch, "org")
+        assert limiter.acquire("GET /organizations/{org_id}{ctype}", "org") == 0  # global token is given back
+
+    def test_from_config(self):
+        assert not from_config(None)
+        bucket = from_config("5:10")._rules[0].bucket(None)
+        assert bucket.rate == 5 and bucket.burst == 10
+
+
+@patch("requests.Session.request", create=True)
+class RouteThrottlingTests(unittest.TestCase):
+
+    class DummyRouter(Router):
+        @route("GET /throttled/{org_id}")
+        def get_throttled(self, org_id): pass
+
+    def tearDown(self):
+        RATE_LIMITER.clear()
+
+    def test_throttled_time_in_route_stat(self, request_mock):
+        request_mock.return_value = gen_response()
+        _routes_stat.pop("GET /throttled/{org_id}", None)
+        RATE_LIMITER.limit(20, burst=1, route="GET /throttled/*")
+        router = self.DummyRouter("http://nowhere.com")
+        router.get_throttled(org_id="1")
+        router.get_throttled(org_id="1")
+        assert _routes_stat["GET /throttled/{org_id}"]["throttled"] >= 40
@@ -0,0 +1,113 @@
+import unittest
+
+from mock import patch
+
+from qubell.api.provider import route, _routes_stat
+from qubell.api.provider.cache import ResponseCache
+from qubell.api.provider.router import Router
+
+
+def gen_response(code=200, content='{"status": "Active"}', headers=None):
+    class DummyResponse(object):
+        status_code = code
+        text = content
+
+        class request(object):
+            body = "request body"
+
+        def __init__(self):
+            self.content = content
+            self.headers = headers or {}
+            self.parsed = 0
+
+        def json(self):
+            self.parsed += 1
+            import simplejson
+            return simplejson.loads(self.content)
+
+    return DummyResponse()
+
+
+@patch("requests.Session.request", create=True)
+class ResponseCacheTests(unittest.TestCase):
+
+    class DummyRouter(Router):
+        @route("GET /cached/{some_id}")
+        def get_cached(self, some_id, params=None): pass
+
+        @route("POST /cached/{some_id}")
+        def post_cached(self, some_id, data): pass
+
+    def setUp(self):
+        self.router = self.DummyRouter("http://nowhere.com").enable_cache(max_entries=2)
+
+    def test_disabled_by_default(self, request_mock):
+        request_mock.return_value = gen_response(headers={'ETag': '"v1"'})
+        router = self.DummyRouter("http://nowhere.com")
+        router.get_cached(some_id="1")
+        router.get_cached(some_id="1")
+        request_mock.assert_called_with('GET', 'http://nowhere.com/cached/1', verify=False, params=None)
+
+    def test_conditional_request_and_304(self, request_mock):
+        first = gen_response(headers={'ETag': '"v1"', 'Last-Modified': 'yesterday'})
+        request_mock.return_value = first
+        assert self.router.get_cached(some_id="1").json() == {"status": "Active"}
+
+        request_mock.return_value = gen_response(304, content='')
+        resp = self.router.get_cached(some_id="1")
+        request_mock.assert_called_with('GET', 'http://nowhere.com/cached/1', verify=False,
+                                        params=None, headers={'If-None-Match': '"v1"', 'If-Modified-Since': 'yesterday'})
+        assert resp.status_code == 200
+        assert resp.json() == {"status": "Active"}
+        assert first.parsed == 1
+
+    def test_body_digest_without_validators(self, request_mock):
+        first = gen_response()
+        request_mock.return_value = first
+        self.router.get_cached(some_id="2").json()
+
+        second = gen_response()
+        request_mock.return_value = second
+        assert self.router.get_cached(some_id="2").json() == {"status": "Active"}
+        assert first.parsed == 1
+        assert second.parsed == 0
+
+    def test_changed_body_is_parsed(self, request_mock):
+        request_mock.return_value = gen_response()
+        self.router.get_cached(some_id="3").json()
+        request_mock.return_value = gen_response(content='{"status": "Destroyed"}')
+        assert self.router.get_cached(some_id="3").json() == {"status": "Destroyed"}
+
+    def test_params_are_part_of_key(self, request_mock):
+        request_mock.return_value = gen_response(headers={'ETag': '"v1"'})
+        self.router.get_cached(some_id="4", params={"after": 1})
+        self.router.get_cached(some_id="4", params={"after": 2})
+        request_mock.assert_called_with('GET', 'http://nowhere.com/cached/4', verify=False, params={"after": 2})
+
+    def test_writes_are_not_cached(self, request_mock):
+        request_mock.return_value = gen_response(headers={'ETag': '"v1"'})
+        self.router.post_cached(some_id="5", data="{}")
+        self.router.post_cached(some_id="5", data="{}")
+        request_mock.assert_called_with('POST', 'http://nowhere.com/cached/5', verify=False, data="{}")
+
+    def test_hit_ratio_in_route_stat(self, request_mock):
+        _routes_stat.pop("GET /cached/{some_id}", None)
+        request_mock.return_value = gen_response()
+        self.router.get_cached(some_id="6")
+        self.router.get_cached(some_id="6")
+        stat = _routes_stat["GET /cached/{some_id}"]
+        assert stat["count"] == 2
+        assert stat["hits"] == 1
+        assert stat["hit_ratio"] == 0.5
+
+
+class ResponseCacheLruTests(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        for key in ["a", "b"]:
+            cache.process(key, gen_response())
+        cache.lookup("a")
+        cache.process("c", gen_response())
+        assert cache.lookup("a")
+        assert not cache.lookup("b")
+        assert len(cache) == 2
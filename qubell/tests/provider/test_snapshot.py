@@ -0,0 +1,104 @@
+import threading
+import unittest
+
+from mock import patch
+
+from qubell.api.provider import route
+from qubell.api.provider.router import Router
+from qubell.tests.provider.test_response_cache import gen_response
+
+
+@patch("requests.Session.request", create=True)
+class SnapshotTests(unittest.TestCase):
+
+    class DummyRouter(Router):
+        @route("GET /organizations/{org_id}/instances/{instance_id}")
+        def get_instance(self, org_id, instance_id): pass
+
+        @route("PUT /organizations/{org_id}/instances/{instance_id}")
+        def put_instance(self, org_id, instance_id, data): pass
+
+        @route("POST /organizations")
+        def post_organization(self, data): pass
+
+    def setUp(self):
+        self.router = self.DummyRouter("http://nowhere.com")
+
+    def test_reads_are_memoized_inside_block(self, request_mock):
+        first = gen_response()
+        request_mock.return_value = first
+        with self.router.snapshot():
+            assert self.router.get_instance(org_id="o1", instance_id="i1").json() == {"status": "Active"}
+            assert self.router.get_instance(org_id="o1", instance_id="i1").json() == {"status": "Active"}
+        assert request_mock.call_count == 1
+        assert first.parsed == 1
+
+    def test_discarded_on_exit(self, request_mock):
+        request_mock.return_value = gen_response()
+        with self.router.snapshot():
+            self.router.get_instance(org_id="o1", instance_id="i1")
+        self.router.get_instance(org_id="o1", instance_id="i1")
+        assert request_mock.call_count == 2
+        assert self.router._snapshot is None
+
+    def test_nested_blocks_share_snapshot(self, request_mock):
+        request_mock.return_value = gen_response()
+        with self.router.snapshot() as outer:
+            with self.router.snapshot() as inner:
+                assert outer is inner
+                self.router.get_instance(org_id="o1", instance_id="i1")
+            self.router.get_instance(org_id="o1", instance_id="i1")
+        assert request_mock.call_count == 1
+
+    def test_write_invalidates_same_organization(self, request_mock):
+        request_mock.return_value = gen_response()
+        with self.router.snapshot() as snapshot:
+            self.router.get_instance(org_id="o1", instance_id="i1")
+            self.router.get_instance(org_id="o2", instance_id="i2")
+            self.router.put_instance(org_id="o1", instance_id="i3", data="{}")
+            assert len(snapshot) == 1
+            self.router.get_instance(org_id="o1", instance_id="i1")
+            self.router.get_instance(org_id="o2", instance_id="i2")
+        assert request_mock.call_count == 4
+
+    def test_unscoped_write_invalidates_everything(self, request_mock):
+        request_mock.return_value = gen_response()
+        with self.router.snapshot() as snapshot:
+            self.router.get_instance(org_id="o1", instance_id="i1")
+            self.router.post_organization(data="{}")
+            assert len(snapshot) == 0
+
+    def test_errors_are_not_memoized(self, request_mock):
+        request_mock.return_value = gen_response(404)
+        self.router.verify_codes = False
+        with self.router.snapshot():
+            self.router.get_instance(org_id="o1", instance_id="i1")
+            self.router.get_instance(org_id="o1", instance_id="i1")
+        assert request_mock.call_count == 2
+
+    def test_other_thread_does_not_see_snapshot(self, request_mock):
+        request_mock.return_value = gen_response()
+        polls = []
+
+        def poll():
+            for _ in range(2):
+                self.router.get_instance(org_id="o1", instance_id="i1")
+                polls.append(self.router._snapshot)
+
+        with self.router.snapshot():
+            self.router.get_instance(org_id="o1", instance_id="i1")
+            poller = threading.Thread(target=poll)
+            poller.start()
+            poller.join()
+        assert polls == [None, None]
+        assert request_mock.call_count == 3
+
+    def test_batch_calls_share_snapshot_of_caller(self, request_mock):
+        request_mock.return_value = gen_response()
+        get = lambda instance_id: self.router.get_instance(org_id="o1", instance_id=instance_id)
+        with self.router.snapshot():
+            get("i1")
+            self.router.parallel_map(get, ["i1", "i1", "i2"], max_in_flight=1)
+        assert request_mock.call_count == 2
+        self.router.parallel_map(get, ["i1", "i1"])
+        assert request_mock.call_count == 4
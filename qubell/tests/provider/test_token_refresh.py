@@ -0,0 +1,134 @@
+import threading
+import time
+import unittest
+
+import simplejson
+from mock import patch
+
+from qubell.api.private.exceptions import ApiUnauthorizedError
+from qubell.api.provider import route, play_auth
+from qubell.api.provider.jwtauth import TokenManager
+from qubell.api.provider.router import Router
+from qubell.tests.provider.test_response_cache import gen_response
+
+
+def token_response(token, expires_in=3600):
+    return gen_response(content=simplejson.dumps({'jwtBearer': token, 'expiresIn': expires_in}))
+
+
+class DummyRouter(Router):
+    @play_auth
+    @route("GET /secured")
+    def get_secured(self, auth, cookies): pass
+
+    @route("POST /refreshToken/jwtBearer")
+    def generate_session_token(self, json): pass
+
+
+@patch("requests.Session.request", create=True)
+class TokenRefreshTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = DummyRouter("http://nowhere.com")
+
+    def tearDown(self):
+        if self.router._token_manager:
+            self.router._token_manager.stop()
+
+    def test_connect_with_refresh_token(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+        assert self.router.is_connected
+        assert self.router._jwt_auth.token == "jwt-1"
+        assert self.router._token_manager.expires_at > time.time() + 3000
+
+    def test_retry_once_after_401(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+
+        responses = [gen_response(401), token_response("jwt-2"), gen_response()]
+        request_mock.side_effect = lambda *args, **kwargs: responses.pop(0)
+        assert self.router.get_secured().status_code == 200
+        assert self.router._jwt_auth.token == "jwt-2"
+        assert self.router.auth_generation == 1
+
+    def test_second_401_is_raised(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+
+        responses = [gen_response(401), token_response("jwt-2"), gen_response(401)]
+        request_mock.side_effect = lambda *args, **kwargs: responses.pop(0)
+        self.assertRaises(ApiUnauthorizedError, self.router.get_secured)
+
+    def test_refresh_route_is_not_repeated(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+        request_mock.return_value = gen_response(401)
+        self.assertRaises(ApiUnauthorizedError, self.router.reauthenticate)
+        assert request_mock.call_count == 2
+
+    def test_concurrent_401_refresh_once(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+        refreshes = []
+
+        def respond(method, url, **kwargs):
+            if url.endswith("jwtBearer"):
+                refreshes.append(1)
+                time.sleep(0.05)
+                return token_response("jwt-2")
+            return gen_response() if kwargs['auth'].token == "jwt-2" else gen_response(401)
+
+        request_mock.side_effect = respond
+        threads = [threading.Thread(target=self.router.get_secured) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(refreshes) == 1
+
+    def test_401_during_scheduled_refresh_is_repeated(self, request_mock):
+        request_mock.return_value = token_response("jwt-1")
+        self.router.connect(refresh_token="refresh")
+        refreshes = []
+
+        def respond(method, url, **kwargs):
+            if url.endswith("jwtBearer"):
+                refreshes.append(1)
+                return token_response("jwt-2")
+            if kwargs['auth'].token == "jwt-1":
+                self.router._token_manager._refresh_ahead()  # timer fires before 401 is handled
+                return gen_response(401)
+            return gen_response()
+
+        request_mock.side_effect = respond
+        assert self.router.get_secured().status_code == 200
+        assert len(refreshes) == 1
+        assert self.router.auth_generation == 1
+
+    def test_refreshed_ahead_of_expiry(self, request_mock):
+        request_mock.return_value = token_response("jwt-1", expires_in=0.1)
+        manager = TokenManager(self.router, "refresh")
+        manager.refresh()
+        request_mock.return_value = token_response("jwt-2")
+        time.sleep(0.2)
+        manager.stop()
+        assert manager.auth.token == "jwt-2"
+
+    def test_restored_token_refreshed_ahead_of_expiry(self, request_mock):
+        request_mock.return_value = token_response("jwt-2")
+        self.router.restore_session({'jwt': "jwt-1", 'expires_at': time.time() + 0.1}, refresh_token="refresh")
+        time.sleep(0.2)
+        assert self.router._jwt_auth.token == "jwt-2"
+        assert self.router._token_manager.expires_at > time.time() + 3000
+
+    def test_replaced_and_closed_refresh_is_stopped(self, request_mock):
+        self.router.restore_session({'jwt': "jwt-1", 'expires_at': time.time() + 3600}, refresh_token="refresh")
+        timer = self.router._token_manager._timer
+        self.router.restore_session({'jwt': "jwt-2", 'expires_at': time.time() + 3600}, refresh_token="refresh")
+        assert timer.finished.is_set() and not timer.is_alive()
+        timer = self.router._token_manager._timer
+        self.router.close()
+        assert self.router._token_manager is None
+        assert timer.finished.is_set() and not timer.is_alive()
+        assert not request_mock.called
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import Mock, MagicMock, patch
+
+from qubell.api.private.exceptions import LeaseTimeoutError
+from qubell.api.private.testing import SandBox
+from qubell.api.private.testing.lease import EnvironmentLease, FileLease, organization_lease
+
+
+class FakeEnvironment(object):
+    def __init__(self):
+        self.properties = {}
+
+    def json(self):
+        return {"properties": [{"name": k, "type": "string", "value": v} for k, v in self.properties.items()]}
+
+    def set_property(self, name, type, value):
+        self.properties[name] = value
+
+    def remove_property(self, name):
+        del self.properties[name]
+
+
+class FileLeaseTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_second_waits_for_release(self):
+        first = FileLease("org", directory=self.dir)
+        first.acquire()
+        self.assertRaises(LeaseTimeoutError, FileLease("org", timeout=0.05, directory=self.dir, poll_interval=0.01).acquire)
+        with FileLease("other org", timeout=0, directory=self.dir):
+            pass
+        threading.Timer(0.05, first.release).start()
+        with FileLease("org", timeout=5, directory=self.dir, poll_interval=0.01) as second:
+            assert second._file is not None
+        assert len(os.listdir(self.dir)) == 2
+
+
+class EnvironmentLeaseTests(unittest.TestCase):
+    def lease(self, environment, clock, **kwargs):
+        return EnvironmentLease(environment, "org", clock=clock, sleep=Mock(), ttl=100, **kwargs)
+
+    def test_lease_is_exclusive_until_release(self):
+        environment = FakeEnvironment()
+        first = self.lease(environment, lambda: 1000)
+        first.acquire()
+        assert first.holder() == (first.owner, 1100)
+        second = self.lease(environment, iter(range(1000, 2000, 10)).next, timeout=50)
+        self.assertRaises(LeaseTimeoutError, second.acquire)
+        first.release()
+        assert environment.properties == {}
+        second.acquire()
+        assert second.holder()[0] == second.owner
+
+    def test_expired_lease_is_taken_over(self):
+        environment = FakeEnvironment()
+        self.lease(environment, lambda: 1000).acquire()
+        late = self.lease(environment, lambda: 1200)
+        late.acquire()
+        assert late.holder() == (late.owner, 1300)
+
+    def test_lost_race(self):
+        environment = FakeEnvironment()
+        winner = self.lease(environment, lambda: 1000)
+        loser = self.lease(environment, iter(range(1000, 2000, 10)).next, timeout=30)
+        # other host overwrites the lease while loser settles
+        loser.sleep.side_effect = lambda seconds: environment.set_property(
+            winner.property, 'string', "%s@%s" % (winner.owner, 10 ** 9))
+        self.assertRaises(LeaseTimeoutError, loser.acquire)
+        loser.release()
+        assert winner.holder()[0] == winner.owner
+
+
+class OrganizationLeaseTests(unittest.TestCase):
+    def test_environment_lease_is_used_across_hosts(self):
+        platform = Mock()
+        environment = FakeEnvironment()
+        platform.get_organization.return_value.get_default_environment.return_value = environment
+        with patch.dict(os.environ, {"QUBELL_LEASE_ORGANIZATION": "leases"}):
+            with organization_lease(platform, "sandbox"):
+                assert len(environment.properties) == 1
+        platform.get_organization.assert_called_once_with(name="leases")
+        assert environment.properties == {}
+
+    def test_sandbox_takes_lease_only_to_create_organization(self):
+        platform = Mock(organizations=["existing"])
+        with patch("qubell.api.private.testing.organization_lease", return_value=MagicMock()) as lease:
+            SandBox(platform, {"organization": {"name": "existing"}})
+            assert not lease.called
+            SandBox(platform, {"organization": {"name": "new"}})
+            lease.assert_called_once_with(platform, "new")
+        platform.organization.assert_called_with(name="new")
@@ -0,0 +1,362 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import MagicMock, Mock, patch
+
+from qubell.api.private.exceptions import ApiCircuitOpenError
+from qubell.api.private.testing import FINGERPRINT_PROPERTY, INSTANCES_PROPERTY, SandBox
+from qubell.api.provider.batch import parallel_map
+from qubell.api.private.testing.sandbox_testcase import SandBoxTestCase, join_reapers
+from qubell.api.tools import wait_for_statuses
+
+
+class FakeOrganization(object):
+    """
+    Dashboard lists instances, every query moves them to next status
+    """
+
+    organizationId = "o1"
+
+    def __init__(self):
+        self.statuses = {}
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def list_instances_json(self):
+        self.queries += 1
+        listed = []
+        for id, statuses in self.statuses.items():
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            if status != 'Destroyed':
+                listed.append({'id': id, 'status': status})
+        return listed
+
+    def instance(self, name, *statuses):
+        with self.lock:
+            instance = Mock(instanceId="%024x" % len(self.statuses), organizationId=self.organizationId,
+                            organization=self, status='Destroyed', error=False)
+            instance.name = name
+            self.statuses[instance.instanceId] = list(statuses)
+        return instance
+
+
+class WaitForStatusesTests(unittest.TestCase):
+    def test_one_query_per_poll(self):
+        org = FakeOrganization()
+        web = org.instance("web", 'Requested', 'Launching', 'Active')
+        db = org.instance("db", 'Launching', 'Running')
+        failed = org.instance("failed", 'Launching', 'Error')
+        sleep = Mock()
+        statuses = wait_for_statuses([web, db, failed], sleep=sleep)
+        assert statuses == {web.instanceId: 'Active', db.instanceId: 'Running', failed.instanceId: 'Error'}
+        assert org.queries == 3
+        assert sleep.call_count == 2
+
+    def test_unlisted_instance_is_asked(self):
+        org = FakeOrganization()
+        destroyed = org.instance("destroyed", 'Destroyed')
+        assert wait_for_statuses([destroyed], final=['Destroyed'], accepted=['Active']) == \
+            {destroyed.instanceId: 'Destroyed'}
+
+    def test_timeout(self):
+        org = FakeOrganization()
+        stuck = org.instance("stuck", 'Launching')
+        clock = iter(range(0, 1000, 30)).next
+        statuses = wait_for_statuses([stuck], timeout=1, clock=clock, sleep=Mock())
+        assert statuses == {stuck.instanceId: 'Launching'}
+
+    def test_open_circuit_keeps_instance_pending(self):
+        org = FakeOrganization()
+        web = org.instance("web", 'Launching', 'Active')
+        child = Mock(instanceId="child", organizationId=org.organizationId, organization=org)
+        reads = [ApiCircuitOpenError("open", retry_after=30), None, 'Running']
+
+        def read_status():
+            read = reads.pop(0)
+            if isinstance(read, Exception):
+                raise read
+            return read
+        type(child).status = property(lambda self: read_status())
+        sleep = Mock()
+        with patch("qubell.api.tools.back_off") as back_off:
+            statuses = wait_for_statuses([web, child], sleep=sleep)
+        assert statuses == {web.instanceId: 'Active', "child": 'Running'}
+        assert [call[0][0] for call in sleep.call_args_list] == [3, 3]
+        back_off.assert_called_once_with(27)
+
+
+class SandBoxSetupTests(unittest.TestCase):
+    def sandbox_case(self, org, applications):
+        organization = MagicMock()
+        organization.create_instance.side_effect = \
+            lambda application, environment, parameters: org.instance(application, *parameters["statuses"])
+        organization.applications.__getitem__.side_effect = lambda name: name
+
+        class Sandboxed(SandBoxTestCase):
+            platform = Mock(parallel_map=parallel_map)
+            parameters = {"organization": "sandbox", "provider_name": "provider"}
+
+            def test_nothing(self):
+                pass
+
+        Sandboxed.applications = applications
+        sandbox = MagicMock()
+        sandbox.make.return_value = organization
+        sandbox.organization = organization
+        sandbox.fingerprint.return_value = "f1"
+        sandbox.find_reusable.return_value = None
+        sandbox.recorded_instances.return_value = ([], [])
+        sandbox.__getitem__.side_effect = lambda key: {"applications": applications}[key]
+        patcher = patch("qubell.api.private.testing.sandbox_testcase.SandBox", return_value=sandbox)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sandbox = sandbox
+        return Sandboxed("test_nothing"), organization
+
+    def test_services_are_added_in_one_update(self):
+        org = FakeOrganization()
+        case, organization = self.sandbox_case(org, [
+            {"name": "db", "add_as_service": True, "parameters": {"statuses": ['Active']}},
+            {"name": "cache", "add_as_service": True, "parameters": {"statuses": ['Active']}},
+            {"name": "web", "parameters": {"statuses": ['Running']}},
+            {"name": "lib", "launch": False}])
+        case.setup_once()
+        assert [i.name for i in case.service_instances] == ["db", "cache"]
+        assert [i.name for i in case.regular_instances] == ["web"]
+        environment = organization.environments.__getitem__.return_value
+        assert environment.__enter__.call_count == 1
+        added = environment.__enter__.return_value.add_service.call_args_list
+        assert [call[0][0].name for call in added] == ["db", "cache"]
+        assert org.queries == 2
+        assert case.setup_timings.keys() == ["organization", "services launch", "services added to environment",
+                                             "services start", "instances launch", "instances start"]
+
+    def test_failed_instance(self):
+        org = FakeOrganization()
+        case, _ = self.sandbox_case(org, [{"name": "web", "parameters": {"statuses": ['Error']}}])
+        with self.assertRaises(AssertionError) as context:
+            case.setup_once()
+        assert "Instance web (" in str(context.exception)
+        assert [i.name for i in case.regular_instances] == ["web"]  # teardown destroys it
+
+    def test_launched_instances_are_kept_when_launch_fails(self):
+        org = FakeOrganization()
+        case, organization = self.sandbox_case(org, [{"name": "web", "parameters": {"statuses": ['Active']}},
+                                                     {"name": "broken", "parameters": {}}])
+        with self.assertRaises(KeyError):
+            case.setup_once()
+        assert [i.name for i in case.regular_instances] == ["web"]
+
+    def test_sandbox_is_remembered_for_reuse(self):
+        org = FakeOrganization()
+        case, organization = self.sandbox_case(org, [
+            {"name": "db", "add_as_service": True, "parameters": {"statuses": ['Active']}},
+            {"name": "web", "parameters": {"statuses": ['Active']}}])
+        with patch.dict(os.environ, {"QUBELL_REUSE_SANDBOX": "true"}):
+            case.setup_once()
+        name, fingerprint, instances = self.sandbox.remember.call_args[0]
+        assert fingerprint == "f1"
+        assert sorted((app, i.name) for app, i in instances.items()) == [("db", "db"), ("web", "web")]
+        case.destroy_instances = Mock()
+        case.teardown_once()
+        assert not case.destroy_instances.called
+
+    def test_matching_sandbox_is_reused(self):
+        org = FakeOrganization()
+        case, organization = self.sandbox_case(org, [
+            {"name": "db", "add_as_service": True, "parameters": {"statuses": ['Active']}},
+            {"name": "web", "parameters": {"statuses": ['Active']}}])
+        db, web = org.instance("db", 'Active'), org.instance("web", 'Active')
+        self.sandbox.find_reusable.return_value = {"db": db, "web": web}
+        with patch.dict(os.environ, {"QUBELL_REUSE_SANDBOX": "true"}):
+            case.setup_once()
+        assert not self.sandbox.make.called
+        assert not organization.create_instance.called
+        assert (case.service_instances, case.regular_instances) == ([db], [web])
+        assert case.setup_timings.keys() == ["reuse check"]
+
+    def test_previous_sandbox_is_destroyed_when_not_reused(self):
+        org = FakeOrganization()
+        case, organization = self.sandbox_case(org, [
+            {"name": "db", "add_as_service": True, "parameters": {"statuses": ['Active']}},
+            {"name": "web", "parameters": {"statuses": ['Active']}}])
+        old_web, old_db = org.instance("web", 'Active'), org.instance("db", 'Active')
+        self.sandbox.recorded_instances.return_value = ([old_web], [old_db])
+        destroyed = []
+        case.destroy_instances = lambda instances, wait=True: destroyed.append(list(instances))
+        with patch.dict(os.environ, {"QUBELL_REUSE_SANDBOX": "true"}):
+            case.setup_once()
+        assert destroyed == [[old_web], [old_db]]
+        assert self.sandbox.make.called
+        assert case.setup_timings.keys()[:3] == ["reuse check", "previous sandbox destroy", "organization"]
+
+    def test_reuse_is_off_by_default(self):
+        case, _ = self.sandbox_case(FakeOrganization(), [])
+        with patch.dict(os.environ, {"QUBELL_REUSE_SANDBOX": ""}):
+            case.setup_once()
+        assert not self.sandbox.fingerprint.called
+        assert not self.sandbox.remember.called
+
+
+class SandBoxTeardownTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("qubell.api.private.testing.sandbox_testcase.wait_for_statuses",
+                        lambda *args, **kwargs: wait_for_statuses(*args, sleep=Mock(), **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.events = []
+
+    def case(self, org, regular, services):
+        class Sandboxed(SandBoxTestCase):
+            platform = Mock(parallel_map=parallel_map)
+
+            def test_nothing(self):
+                pass
+
+        listed = org.list_instances_json
+        org.list_instances_json = lambda: self.events.append("poll") or listed()
+        for instance in regular + services:
+            instance.destroy.side_effect = lambda name=instance.name: self.events.append(name)
+        case = Sandboxed("test_nothing")
+        case.regular_instances, case.service_instances = regular, services
+        return case
+
+    def test_waves(self):
+        org = FakeOrganization()
+        regular = [org.instance("web", 'Destroying', 'Destroyed'), org.instance("app", 'Destroyed')]
+        services = [org.instance("db", 'Active', 'Active', 'Destroying', 'Destroyed'), org.instance("cache", 'Destroyed')]
+        case = self.case(org, regular, services)
+        with patch.dict(os.environ, {"QUBELL_ASYNC_TEARDOWN": ""}):
+            case.teardown_once()
+        assert sorted(self.events[:2]) == ["app", "web"]
+        assert self.events[2:4] == ["poll", "poll"]
+        assert sorted(self.events[4:6]) == ["cache", "db"]
+        assert self.events[6:] == ["poll", "poll"]
+        assert case.regular_instances == case.service_instances == []
+
+    def test_last_wave_is_verified_in_background(self):
+        org = FakeOrganization()
+        services = [org.instance("db", 'Destroying', 'Failed'), org.instance("cache", 'Destroyed')]
+        case = self.case(org, [], services)
+        release = threading.Event()
+        destroying = org.list_instances_json
+        org.list_instances_json = lambda: release.wait(5) and destroying()
+        with patch.dict(os.environ, {"QUBELL_ASYNC_TEARDOWN": "true"}):
+            with patch("qubell.api.private.testing.sandbox_testcase.log") as log:
+                case.teardown_once()
+                assert sorted(self.events) == ["cache", "db"]
+                release.set()
+                failures = join_reapers()
+        errors = [call[0][0] for call in log.error.call_args_list]
+        assert len(errors) == 1 and "({0})".format("db") in errors[0]
+        assert failures == errors
+        assert join_reapers() == []
+
+    def test_failed_destroy_does_not_stop_teardown(self):
+        org = FakeOrganization()
+        web, db = org.instance("web", 'Destroyed'), org.instance("db", 'Destroyed')
+        case = self.case(org, [web], [db])
+        web.destroy.side_effect = IOError("unreachable")
+        case.teardown_once()
+        assert db.destroy.called
+
+
+class SandBoxFingerprintTests(unittest.TestCase):
+    def setUp(self):
+        self.organization = MagicMock()
+        platform = Mock(organizations=["sandbox"])
+        platform.organization.return_value = self.organization
+        self.sandbox = lambda applications, **definition: SandBox(platform, dict(
+            organization={"name": "sandbox"}, applications=applications, **definition))
+
+    def test_fingerprint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ["a.yml", "b.yml"]:
+            with open(os.path.join(directory, name), "w") as f:
+                f.write("application: {}")
+        by_file = self.sandbox([{"name": "app", "file": os.path.join(directory, "a.yml")}]).fingerprint("default")
+        moved = self.sandbox([{"name": "app", "file": os.path.join(directory, "b.yml")}]).fingerprint("default")
+        by_content = self.sandbox([{"content": u"application: {}", "name": "app"}]).fingerprint("default")
+        assert by_file == moved == by_content
+        assert by_file != self.sandbox([{"name": "app", "content": "application: {x: 1}"}]).fingerprint("default")
+        assert by_file != self.sandbox([{"name": "app", "content": "application: {}"}]).fingerprint("other")
+        assert by_file != self.sandbox([{"name": "app", "content": "application: {}", "parameters": {"x": 1}}],
+                                       ).fingerprint("default")
+        assert by_file != self.sandbox([{"name": "app", "content": "application: {}"}],
+                                       environments=[{"name": "default", "markers": ["m"]}]).fingerprint("default")
+
+    def test_meta_is_fingerprinted_by_content(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        meta = os.path.join(directory, "meta.yml")
+        manifests = {"http://kit/db.yml": "application: {}"}
+
+        def write_meta(*names):
+            with open(meta, "w") as f:
+                f.write(json.dumps({"kit": {"applications": [
+                    {"name": name, "manifest": "http://kit/%s.yml" % name} for name in names]}}))
+
+        sandbox = self.sandbox([{"name": "app", "content": "application: {}"}])
+        with patch("qubell.api.private.manifest.requests.get",
+                   side_effect=lambda url: Mock(content=manifests[url])):
+            write_meta("db")
+            original = sandbox.fingerprint("default", meta)
+            assert original == sandbox.fingerprint("default", meta)
+            assert original != sandbox.fingerprint("default")
+            manifests["http://kit/db.yml"] = "application: {x: 1}"
+            assert original != sandbox.fingerprint("default", meta)
+            manifests["http://kit/db.yml"] = "application: {}"
+            manifests["http://kit/cache.yml"] = "application: {}"
+            write_meta("db", "cache")
+            changed = sandbox.fingerprint("default", meta)
+        assert original != changed
+        self.environment(original, {"app": "i1"})
+        assert sandbox.find_reusable("default", changed) is None
+
+    def environment(self, fingerprint, instances, service_ids=()):
+        env = self.organization.environments.__getitem__.return_value
+        env.json.return_value = {"serviceIds": list(service_ids), "properties": [
+            {"name": FINGERPRINT_PROPERTY, "type": "string", "value": fingerprint},
+            {"name": INSTANCES_PROPERTY, "type": "string", "value": json.dumps(instances)}]}
+        self.organization.get_instance.side_effect = lambda id: Mock(instanceId=id)
+        return env
+
+    def test_find_reusable(self):
+        sandbox = self.sandbox([{"name": "db", "add_as_service": True}, {"name": "web"}])
+        self.environment("f1", {"db": "i1", "web": "i2"}, service_ids=["i1"])
+        self.organization.list_instances_json.return_value = [{"id": "i1", "status": "Active"},
+                                                              {"id": "i2", "status": "Running"}]
+        reused = sandbox.find_reusable("default", "f1")
+        assert dict((name, i.instanceId) for name, i in reused.items()) == {"db": "i1", "web": "i2"}
+        assert sandbox.find_reusable("default", "f2") is None
+
+    def test_broken_sandbox_is_not_reused(self):
+        sandbox = self.sandbox([{"name": "db", "add_as_service": True}, {"name": "web"}])
+        self.environment("f1", {"db": "i1", "web": "i2"}, service_ids=["i1"])
+        self.organization.list_instances_json.return_value = [{"id": "i1", "status": "Active"},
+                                                              {"id": "i2", "status": "Error"}]
+        assert sandbox.find_reusable("default", "f1") is None
+        self.environment("f1", {"db": "i1"}, service_ids=[])
+        self.organization.list_instances_json.return_value = [{"id": "i1", "status": "Active"}]
+        assert sandbox.find_reusable("default", "f1") is None
+
+    def test_recorded_instances(self):
+        sandbox = self.sandbox([{"name": "db", "add_as_service": True}, {"name": "web"}, {"name": "app"}])
+        self.environment("f0", {"db": "i1", "web": "i2", "app": "i3"}, service_ids=["i1"])
+        self.organization.list_instances_json.return_value = [{"id": "i1", "status": "Active"},
+                                                              {"id": "i2", "status": "Error"}]
+        regular, services = sandbox.recorded_instances("default")
+        assert ([i.instanceId for i in regular], [i.instanceId for i in services]) == (["i2"], ["i1"])
+
+    def test_remember(self):
+        sandbox = self.sandbox([])
+        env = self.environment(None, {})
+        sandbox.remember("default", "f1", {"web": Mock(instanceId="i2"), "db": Mock(instanceId="i1")})
+        operations = env.__enter__.return_value
+        operations.add_property.assert_any_call(FINGERPRINT_PROPERTY, 'string', "f1")
+        operations.add_property.assert_any_call(INSTANCES_PROPERTY, 'string', '{"db": "i1", "web": "i2"}')
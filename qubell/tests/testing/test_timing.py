@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+
+from mock import Mock, patch
+from nose.plugins import PluginTester
+
+from qubell.api.private.testing.setup_once import SetupOnce
+from qubell.api.provider.ratelimit import back_off
+from qubell.api.tools.timing import SleepMeter, TimingPlugin, TimingRecorder, html_report
+
+ROUTE = "GET /organizations{ctype}"
+
+
+class FakeRoutes(object):
+    """
+    Route statistics, that tests call and sleep in
+    """
+
+    def __init__(self):
+        self.stat = {}
+        self.now = 0
+        self.meter = Mock(total=0, throttled=0)
+
+    def __call__(self):
+        return dict((route, dict(stat)) for route, stat in self.stat.items())
+
+    def call(self, route=ROUTE, ms=1000):
+        stat = self.stat.setdefault(route, {"count": 0, "total": 0})
+        stat["count"] += 1
+        stat["total"] += ms
+        self.now += ms / 1000.0
+
+    def sleep(self, seconds):
+        self.meter.total += seconds
+        self.now += seconds
+
+
+class TimingRecorderTests(unittest.TestCase):
+    def setUp(self):
+        self.routes = FakeRoutes()
+        patcher = patch("qubell.api.tools.timing.routes_stat", self.routes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_setup_once_and_teardown_once_are_not_counted_in_test(self):
+        routes = self.routes
+
+        class Sandboxed(SetupOnce, unittest.TestCase):
+            def setup_once(self):
+                routes.call()
+                routes.call()
+                routes.sleep(10)
+
+            def teardown_once(self):
+                routes.sleep(5)
+
+            def test_chatty(self):
+                routes.call("GET /organizations/{org_id}/dashboard{ctype}", ms=2000)
+                routes.call()
+                routes.sleep(1)
+
+            def test_quiet(self):
+                pass
+
+        recorder = TimingRecorder(routes.meter, clock=lambda: routes.now)
+        recorder.start_class(Sandboxed)
+        Sandboxed.setUpClass()
+        result = unittest.TestResult()
+        for test in unittest.TestLoader().loadTestsFromTestCase(Sandboxed):
+            recorder.start_test("sandboxed", test._testMethodName)
+            test.run(result)
+            recorder.stop_test()
+        Sandboxed.tearDownClass()
+        recorder.stop_class(Sandboxed)
+        assert result.wasSuccessful()
+        assert Sandboxed.setup_once.__name__ == "setup_once"  # restored
+
+        results = recorder.results()
+        classes = dict((c["name"], c) for c in results["classes"])
+        sandboxed = classes["%s.Sandboxed" % __name__]
+        assert sandboxed["setup_once"]["calls"] == 2 and sandboxed["setup_once"]["sleep"] == 10
+        assert sandboxed["teardown_once"]["wall"] == 5
+        assert sandboxed["usage"]["calls"] == 4
+        tests = dict((t["name"], t) for t in classes["sandboxed"]["tests"])
+        chatty = tests["test_chatty"]
+        assert (chatty["calls"], chatty["sleep"], chatty["http"]) == (2, 1, 3)
+        assert chatty["routes"] == {ROUTE: 1, "GET /organizations/{org_id}/dashboard{ctype}": 1}
+        assert tests["test_quiet"]["calls"] == 0 and tests["test_quiet"]["wall"] == 0
+        assert results["slowest_sandboxes"] == [{"name": "%s.Sandboxed" % __name__, "wall": 17,
+                                                 "setup_once": 12, "teardown_once": 5}]
+        assert results["chattiest_tests"] == [{"name": "sandboxed.test_chatty", "calls": 2, "wall": 4}]
+        assert "<li>2 calls sandboxed.test_chatty</li>" in html_report(results)
+
+    def test_sleep_meter(self):
+        import time
+        meter = SleepMeter()
+        meter.install()
+        try:
+            time.sleep(0.01)
+            back_off(0.1)
+        finally:
+            meter.uninstall()
+        assert time.sleep is not meter.sleep
+        assert 0.01 <= meter.total < 0.1
+        assert meter.throttled >= 0.1
+
+
+SUITE = '''
+import time
+import unittest
+
+from qubell.api.private.testing.setup_once import SetupOnce
+
+
+class SlowSandbox(SetupOnce, unittest.TestCase):
+    def setup_once(self):
+        time.sleep(0.05)
+
+    def test_one(self):
+        pass
+
+    def test_two(self):
+        pass
+'''
+
+
+class TimingPluginTests(PluginTester, unittest.TestCase):
+    activate = "--with-qubell-timing"
+    plugins = [TimingPlugin()]
+    source = SUITE
+    module = "test_slow_sandbox"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.suitepath = os.path.join(self.dir, self.module + ".py")
+        with open(self.suitepath, "w") as f:
+            f.write(textwrap.dedent(self.source))
+        self.args = ["--qubell-timing-report", os.path.join(self.dir, "timing")]
+        super(TimingPluginTests, self).setUp()
+
+    def test_report(self):
+        assert "Timing report: " in self.output
+        with open(os.path.join(self.dir, "timing.json")) as f:
+            results = json.load(f)
+        sandbox, = results["slowest_sandboxes"]
+        assert sandbox["name"] == "test_slow_sandbox.SlowSandbox"
+        assert sandbox["setup_once"] >= 0.05
+        tests, = [c["tests"] for c in results["classes"] if c["name"] == sandbox["name"]]
+        assert [t["name"] for t in tests] == ["test_one", "test_two"]
+        assert all(t["sleep"] < 0.05 for t in tests)
+        assert os.path.exists(os.path.join(self.dir, "timing.html"))
+        assert results["not_destroyed"] == []
+
+
+LEAKING_SUITE = '''
+import unittest
+
+from qubell.api.private.testing import sandbox_testcase
+
+
+class LeakingSandbox(unittest.TestCase):
+    def test_teardown_leaves_instance(self):
+        sandbox_testcase._reaped_failures.append("Instance i1 (web) was not destroyed properly.")
+'''
+
+
+class TimingPluginReaperTests(TimingPluginTests):
+    source = LEAKING_SUITE
+    module = "test_leaking_sandbox"
+
+    def test_report(self):
+        assert "Not destroyed by sandboxes:\n  Instance i1 (web)" in self.output
+        assert "OK" in self.output and "FAILED" not in self.output
+        with open(os.path.join(self.dir, "timing.json")) as f:
+            assert json.load(f)["not_destroyed"] == ["Instance i1 (web) was not destroyed properly."]
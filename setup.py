@@ -31,7 +31,9 @@ setup(name='qubell-api-python-client',
       test_suite="nosetests",
       entry_points='''
         [console_scripts]
-        nomi=qubell.cli.__main__:entity
+        nomi=qubell.cli.__main__:main
         qubell_monitor = qubell.monitor.monitor:main
+        [nose.plugins.0.10]
+        qubell-timing = qubell.api.tools.timing:TimingPlugin
     '''
      )